@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class BillingServiceConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "billing_service"
+
+    def ready(self):
+        # registers the CheckList signal receivers that keep the index fresh
+        from . import checklist, log_pipeline  # noqa: F401
+        from .audit import audit_log
+        from .cache import billing_cache
+        from .metrics import connection_pool_stats, registry
+        from .routers import replica_pool
+
+        registry.register_gauge("billing_audit_log", audit_log.stats)
+        registry.register_gauge("billing_cache", billing_cache.stats)
+        registry.register_gauge("billing_checklist_index_size", lambda: len(checklist.invalid_name_index))
+        registry.register_gauge("database_replica", replica_pool.stats)
+        registry.register_gauge("database_pool", connection_pool_stats)
+        registry.register_gauge("logging", log_pipeline.stats)
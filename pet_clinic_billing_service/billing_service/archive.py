@@ -0,0 +1,124 @@
+"""
+Hot/cold tiering for billing rows.
+
+Rows whose status is in BILLING_ARCHIVE_STATUSES and that have not changed
+for BILLING_ARCHIVE_AFTER_DAYS are moved, in batches, from Billing to
+BillingArchive under their original ids, so the hot table only carries
+active history. Each batch commits on its own, so an interrupted run loses
+nothing and the next run carries on. Reads by id or natural key fall
+through to the archive; updating an archived row moves it back first.
+Archiving does not change BillingSummary, which counts both tables.
+"""
+from datetime import timedelta
+from django.db import connections, router, transaction
+from django.utils import timezone
+from .models import Billing, BillingArchive
+from .serializers import BillingRowSerializer
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = ('id', 'owner_id', 'type', 'type_name', 'pet_id', 'payment', 'status', 'updated_at')
+
+_partitioned = {}
+
+
+def archive_statuses():
+    return [status.strip() for status in os.getenv("BILLING_ARCHIVE_STATUSES", "paid,closed,cancelled").split(",")
+            if status.strip()]
+
+
+def retention_cutoff(days=None):
+    if days is None:
+        days = int(os.getenv("BILLING_ARCHIVE_AFTER_DAYS", 90))
+    return timezone.now() - timedelta(days=days)
+
+
+def eligible(cutoff, statuses):
+    return Billing.objects.filter(status__in=statuses, updated_at__lt=cutoff)
+
+
+def is_partitioned(using):
+    if using not in _partitioned:
+        connection = connections[using]
+        partitioned = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+                    [BillingArchive._meta.db_table],
+                )
+                partitioned = cursor.fetchone() is not None
+        _partitioned[using] = partitioned
+    return _partitioned[using]
+
+
+def ensure_partition(when, using):
+    """
+    Create the monthly billing_archive partition that `when` falls in, if the
+    table is partitioned and it does not exist yet.
+    """
+    if not is_partitioned(using):
+        return
+    start = when.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (start + timedelta(days=32)).replace(day=1)
+    table = BillingArchive._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_y{start:%Y}m{start:%m} PARTITION OF {table} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+
+
+def archive_batch(cutoff, statuses, batch_size, after_id=0):
+    """
+    Move up to `batch_size` eligible rows with ids above `after_id` to the
+    archive in one transaction. Rows another transaction has locked are
+    skipped and picked up by a later run. Returns (rows moved, last id seen).
+    """
+    using = router.db_for_write(Billing)
+    with transaction.atomic(using=using):
+        rows = list(
+            eligible(cutoff, statuses).filter(id__gt=after_id).order_by('id')
+            .select_for_update(skip_locked=True).values(*ARCHIVE_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0, after_id
+        now = timezone.now()
+        ensure_partition(now, using)
+        BillingArchive.objects.using(using).bulk_create([BillingArchive(**row, archived_at=now) for row in rows])
+        Billing.objects.using(using).filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows), rows[-1]['id']
+
+
+def archived_record(using, **lookup):
+    # a natural key can have been archived more than once; the latest wins
+    return (
+        BillingArchive.objects.using(using).filter(**lookup).order_by('-archived_at')
+        .values(*BillingRowSerializer.fields).first()
+    )
+
+
+async def aarchived_record(using, **lookup):
+    return await (
+        BillingArchive.objects.using(using).filter(**lookup).order_by('-archived_at')
+        .values(*BillingRowSerializer.fields).afirst()
+    )
+
+
+def restore(pk):
+    """
+    Move archived row `pk` back into Billing, under the same id, and return
+    it. Must run inside the caller's transaction; raises
+    Billing.DoesNotExist when there is no such archived row and
+    IntegrityError when an active row already holds its natural key.
+    """
+    archived = BillingArchive.objects.select_for_update().filter(id=pk).order_by('-archived_at').first()
+    if archived is None:
+        raise Billing.DoesNotExist(f"No billing or archived billing with id {pk}")
+    billing = Billing.objects.create(**{field: getattr(archived, field) for field in ARCHIVE_FIELDS})
+    BillingArchive.objects.filter(id=pk).delete()
+    logger.info("restore() - Moved archived billing %s back to the active table", pk)
+    return billing
@@ -0,0 +1,151 @@
+"""
+Async read path for the billing endpoints.
+
+With SERVICE_ASYNC_VIEWS=true the list and retrieve routes are served by the
+coroutines below, so under an ASGI server (uvicorn) one worker interleaves
+many concurrent reads on its event loop. Writes keep going to the DRF
+BillingViewSet, which runs in a worker thread.
+"""
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, OperationalError, router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+from .archive import aarchived_record
+from .budget import query_budget
+from .cache import billing_cache
+from .metrics import stage
+from .models import Billing
+from .pagination import InvalidCursor
+from .renderers import dumps
+from .serializers import BillingRowSerializer, InvalidFields, project
+from .views import BillingViewSet
+from opentelemetry import trace
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# BillingViewSet's query-building helpers, shared with the sync views
+helpers = BillingViewSet()
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type="application/json")
+
+
+def dispatch(sync_view, **handlers):
+    """
+    Route each HTTP method to its coroutine in `handlers`; any other method
+    goes to the DRF `sync_view` in a worker thread.
+    """
+    async def view(request, *args, **kwargs):
+        handler = handlers.get(request.method.lower())
+        if handler is None:
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        return await handler(request, *args, **kwargs)
+    return csrf_exempt(view)
+
+
+async def billing_list(request):
+    logger.info("billing_list() called - Fetching billing records")
+    try:
+        fields = helpers.read_fields(request.GET)
+    except InvalidFields as e:
+        return json_response({'message': str(e)}, status=400)
+    if "cursor" in request.GET or "page_size" in request.GET:
+        return await billing_page(request, fields)
+
+    span = trace.get_current_span()
+    decision = await sync_to_async(helpers.plan_list)()
+    if request.GET.get("stream", "").lower() in ("1", "true"):
+        response = await billing_stream(decision, fields)
+        return decision.annotate(span, response, query_budget.budget_ms)
+
+    # the statement deadline is per connection, so the query and its fallback
+    # run together on the ORM's thread
+    data, decision = await sync_to_async(helpers.list_rows)(decision, fields)
+    logger.info("billing_list() completed successfully - Returned %s records", len(data))
+    return decision.annotate(span, json_response(data), query_budget.budget_ms)
+
+
+async def billing_stream(decision, fields=None):
+    chunk_size = int(os.getenv("BILLING_STREAM_CHUNK_SIZE", 500))
+    # routed now: a read-your-writes pin is gone by the time the response is consumed
+    pieces = helpers.stream_json(decision, chunk_size, fields, router.db_for_read(Billing))
+
+    # ASGI would buffer a sync iterator whole, so pull each chunk in the ORM's thread
+    async def generate():
+        while (piece := await sync_to_async(next)(pieces, None)) is not None:
+            yield piece
+
+    logger.info("billing_stream() - Streaming up to %s records in chunks of %s", decision.max_results, chunk_size)
+    return StreamingHttpResponse(generate(), content_type="application/json")
+
+
+async def billing_page(request, fields=None):
+    span = trace.get_current_span()
+    page_size = helpers.page_size(request.GET)
+    if page_size is None:
+        return json_response({'message': 'page_size must be an integer'}, status=400)
+    try:
+        # the statement deadline is per connection, so the page runs on the ORM's thread
+        objs, next_cursor, db_timer = await sync_to_async(helpers.fetch_page)(
+            request.GET.get("cursor"), page_size, fields
+        )
+    except InvalidCursor as e:
+        logger.warning("billing_page() - %s", e)
+        return json_response({'message': str(e)}, status=400)
+    except OperationalError as e:
+        logger.warning("billing_page() - Page exceeded its %sms budget: %s", query_budget.budget_ms, e)
+        return json_response({'message': 'The page query exceeded its time budget'}, status=503)
+    span.set_attribute("db.record_count", len(objs))
+    span.set_attribute("db.fetch_time_ms", db_timer.ms)
+
+    with stage("serialization"):
+        data = helpers.read_serializer(objs, many=True, fields=fields).data
+    return json_response({'results': data, 'next_cursor': next_cursor})
+
+
+async def billing_retrieve(request, pk=None, owner_id=None, pet_id=None, type=None):
+    logger.info("billing_retrieve() called - pk: %s, owner_id: %s, type: %s, pet_id: %s", pk, owner_id, type, pet_id)
+    try:
+        fields = helpers.read_fields(request.GET)
+    except InvalidFields as e:
+        return json_response({'message': str(e)}, status=400)
+    # routing only reads the replica health the background checker keeps
+    db = router.db_for_read(Billing)
+    share = db == DEFAULT_DB_ALIAS
+
+    async def load(**lookup):
+        record = await Billing.objects.using(db).filter(**lookup).values(*BillingRowSerializer.fields).afirst()
+        if record is None:
+            record = await aarchived_record(db, **lookup)
+        return record
+
+    with stage("db"):
+        if pk is not None:
+            record, hit = await billing_cache.aget_by_id(pk, lambda: load(id=pk), share=share)
+        else:
+            record, hit = await billing_cache.aget_by_natural_key(
+                owner_id, pet_id, type, lambda: load(owner_id=owner_id, pet_id=pet_id, type=type), share=share
+            )
+    trace.get_current_span().set_attribute("cache.hit", hit)
+
+    if record is None:
+        logger.warning("billing_retrieve() - Billing object not found with given parameters")
+        return json_response({'message': 'Billing object not found'}, status=404)
+    return json_response(project(record, fields))
+
+
+list_view = BillingViewSet.as_view({'get': 'list', 'post': 'create'})
+detail_view = BillingViewSet.as_view({'get': 'retrieve', 'put': 'update'})
+
+# the names match the router's so per-endpoint metrics keep their labels
+urlpatterns = [
+    path('billings/', dispatch(list_view, get=billing_list), name='billings-list'),
+    path('billings/<int:pk>/', dispatch(detail_view, get=billing_retrieve), name='billings-detail'),
+    path('billings/<int:owner_id>/<int:pet_id>/<str:type>/',
+         dispatch(BillingViewSet.as_view({'get': 'retrieve', 'put': 'upsert'}), get=billing_retrieve),
+         name='billing-retrieve'),
+]
@@ -0,0 +1,194 @@
+from contextlib import contextmanager
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import boto3
+from botocore.exceptions import ClientError, ParamValidationError
+
+logger = logging.getLogger(__name__)
+
+# DynamoDB's BatchWriteItem limit
+MAX_BATCH_SIZE = 25
+# errors about the request itself, which no retry can fix
+PERMANENT_ERROR_CODES = {'ValidationException', 'SerializationException'}
+
+
+def is_permanent(error):
+    if isinstance(error, ParamValidationError):
+        return True
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in PERMANENT_ERROR_CODES
+
+
+class AuditLogWriter:
+    """
+    Buffers BillingInfo audit records in a bounded queue and writes them to
+    DynamoDB from a background thread with BatchWriteItem, so create/update
+    requests never wait on DynamoDB. When the queue is full new records are
+    dropped and counted rather than blocking the request. Records DynamoDB
+    rejects as invalid are logged and counted, not retried.
+    """
+
+    def __init__(self, table_name='BillingInfo', max_queue_size=10_000, flush_interval=1.0, max_retries=5):
+        self.table_name = table_name
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._client = None
+        self.enabled = True
+        # request threads and the writer thread both update these
+        self._counter_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client(
+                'dynamodb',
+                region_name=os.environ.get('REGION', 'us-east-1'),
+                endpoint_url=os.environ.get('DYNAMODB_ENDPOINT_URL') or None,
+            )
+        return self._client
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="billing-audit-writer", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, data):
+        """
+        Queue one billing payload for the audit table. Returns False if it was
+        dropped or auditing is disabled.
+        """
+        if not self.enabled:
+            return False
+        self.start()
+        # microseconds keep (ownerId, timestamp) unique within a batch
+        formatted_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+        item = {
+            'ownerId': {'S': str(data['owner_id'])},
+            'timestamp': {'S': formatted_time},
+            'billing': {'S': json.dumps(data, default=str)},
+        }
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            dropped = self._count('dropped')
+            if dropped == 1 or dropped % 1_000 == 0:
+                logger.warning("AuditLogWriter queue full, %s audit records dropped so far", dropped)
+            return False
+        self._count('enqueued')
+        return True
+
+    def _count(self, name, n=1):
+        with self._counter_lock:
+            value = getattr(self, name) + n
+            setattr(self, name, value)
+        return value
+
+    def stats(self):
+        with self._counter_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+
+    @contextmanager
+    def disabled(self):
+        """
+        Skip auditing inside the block, for synthetic writes (benchmarks, plan
+        checks) that must never reach the BillingInfo table.
+        """
+        enabled, self.enabled = self.enabled, False
+        try:
+            yield
+        finally:
+            self.enabled = enabled
+
+    def stop(self, timeout=10):
+        """
+        Stop the flusher after it has drained everything already queued.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._write_batch(batch)
+            elif self._stop.is_set():
+                return
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if self._stop.is_set():
+                timeout = 0
+            try:
+                if timeout <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, items):
+        pending = [{'PutRequest': {'Item': item}} for item in items]
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client().batch_write_item(RequestItems={self.table_name: pending})
+                unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+                self._count('written', len(pending) - len(unprocessed))
+                pending = unprocessed
+            except Exception as e:
+                if is_permanent(e):
+                    self._reject([request['PutRequest']['Item'] for request in pending], e)
+                    return
+                logger.error("AuditLogWriter batch write failed (attempt %s): %s", attempt + 1, e)
+            if not pending:
+                return
+            # exponential backoff with full jitter before retrying unprocessed items
+            time.sleep(random.uniform(0, min(2.0, 0.05 * 2 ** attempt)))
+        self._count('failed', len(pending))
+        logger.error("AuditLogWriter gave up on %s audit records after %s retries", len(pending), self.max_retries)
+
+    def _reject(self, items, error):
+        if len(items) > 1:
+            # one invalid record fails the whole batch; write them one by one to keep the valid ones
+            for item in items:
+                self._write_batch([item])
+            return
+        self._count('rejected')
+        logger.error("AuditLogWriter dropped an invalid audit record for owner %s: %s", items[0]['ownerId']['S'],
+                     error)
+
+audit_log = AuditLogWriter(
+    max_queue_size=int(os.getenv("AUDIT_LOG_QUEUE_SIZE", 10_000)),
+    flush_interval=float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", 1.0)),
+)
+atexit.register(audit_log.stop)
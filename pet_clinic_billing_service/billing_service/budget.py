@@ -0,0 +1,156 @@
+"""
+Cost-aware query budget for the billing list endpoint.
+
+A request's cost is estimated as work units (CheckList names the anti-join
+has to consider plus Billing rows scanned) times a per-unit cost learned
+from recent timings. When the estimate exceeds the budget the plan is
+shrunk before it runs. The query then runs under a statement deadline, and
+if it still overruns, the last good result is served as a partial response.
+Keyset pages and every chunk query of a streamed list run under the same
+deadline, together with the exclusion lookups they depend on.
+"""
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from .models import Billing, CheckList
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetDecision:
+    def __init__(self, subquery_limit, max_results, exclusion, estimate_ms, decision='within_budget'):
+        self.subquery_limit = subquery_limit
+        self.max_results = max_results
+        self.exclusion = exclusion
+        self.estimate_ms = estimate_ms
+        self.decision = decision
+
+    def header(self):
+        return (
+            f"decision={self.decision}; estimate_ms={self.estimate_ms:.1f}; "
+            f"subquery_limit={self.subquery_limit}; max_results={self.max_results}"
+        )
+
+    def annotate(self, span, response, budget_ms):
+        span.set_attribute("db.budget.decision", self.decision)
+        span.set_attribute("db.budget.estimate_ms", self.estimate_ms)
+        span.set_attribute("db.budget.limit_ms", budget_ms)
+        response["X-Query-Budget"] = self.header()
+        return response
+
+
+class QueryBudget:
+    def __init__(self, budget_ms, initial_ms_per_unit=0.002, alpha=0.2, stats_ttl=60, partial_rows=1_000):
+        self.budget_ms = budget_ms
+        self.ms_per_unit = initial_ms_per_unit
+        self.alpha = alpha
+        self.stats_ttl = stats_ttl
+        self.partial_rows = partial_rows
+        self._stats = None
+        self._stats_at = 0
+        self._partial = None
+        self._lock = threading.Lock()
+
+    def table_stats(self):
+        if self._stats is None or time.monotonic() - self._stats_at > self.stats_ttl:
+            self._stats = {
+                'billing': _row_estimate(Billing._meta.db_table),
+                'check_list': _row_estimate(CheckList._meta.db_table),
+            }
+            self._stats_at = time.monotonic()
+        return self._stats
+
+    def cost_units(self, subquery_limit, max_results, exclusion):
+        stats = self.table_stats()
+        billing_rows = min(max_results, stats['billing'])
+        if exclusion == 'index':
+            return billing_rows
+        # the DISTINCT subquery scans its slice of check_list, and every billing row probes it
+        return min(subquery_limit, stats['check_list']) + billing_rows
+
+    def estimate_ms(self, subquery_limit, max_results, exclusion):
+        return self.cost_units(subquery_limit, max_results, exclusion) * self.ms_per_unit
+
+    def plan(self, subquery_limit, max_results, exclusion, tiers):
+        """
+        Return the plan to run: the requested one if it fits the budget,
+        otherwise a smaller plan whose estimate fits: lower subquery tiers
+        first, then halving both the subquery limit and the result cap.
+        """
+        estimate = self.estimate_ms(subquery_limit, max_results, exclusion)
+        if self.budget_ms <= 0 or estimate <= self.budget_ms:
+            return BudgetDecision(subquery_limit, max_results, exclusion, estimate)
+        requested = (subquery_limit, max_results)
+        for tier in sorted((t for t in tiers if t < subquery_limit), reverse=True):
+            subquery_limit = tier
+            estimate = self.estimate_ms(subquery_limit, max_results, exclusion)
+            if estimate <= self.budget_ms:
+                break
+        while estimate > self.budget_ms and (max_results > 1 or subquery_limit > 1):
+            subquery_limit = max(1, subquery_limit // 2)
+            max_results = max(1, max_results // 2)
+            estimate = self.estimate_ms(subquery_limit, max_results, exclusion)
+        logger.info("QueryBudget degraded plan %s -> %s, estimate %.1fms", requested, (subquery_limit, max_results),
+                    estimate)
+        return BudgetDecision(subquery_limit, max_results, exclusion, estimate, decision='degraded')
+
+    def observe(self, decision, elapsed_ms, data, keep_partial=True):
+        units = self.cost_units(decision.subquery_limit, decision.max_results, decision.exclusion)
+        if units > 0:
+            with self._lock:
+                self.ms_per_unit += self.alpha * (elapsed_ms / units - self.ms_per_unit)
+        if keep_partial:
+            self._partial = data[:self.partial_rows]
+
+    def on_timeout(self, decision):
+        # we under-estimated: the plan took longer than the whole budget, so
+        # assume at least twice that until timings say otherwise
+        units = self.cost_units(decision.subquery_limit, decision.max_results, decision.exclusion)
+        if units > 0:
+            with self._lock:
+                self.ms_per_unit = max(self.ms_per_unit, 2 * self.budget_ms / units)
+        return self._partial
+
+    @contextmanager
+    def deadline(self, using=DEFAULT_DB_ALIAS):
+        """
+        Abort any statement on `using` that runs past the budget (OperationalError).
+        """
+        db = connections[using]
+        if self.budget_ms <= 0:
+            yield
+        elif db.vendor == 'postgresql':
+            with transaction.atomic(using=using):
+                with db.cursor() as cursor:
+                    cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(self.budget_ms))])
+                yield
+        elif db.vendor == 'sqlite':
+            db.ensure_connection()
+            expires_at = time.monotonic() + self.budget_ms / 1_000
+            db.connection.set_progress_handler(lambda: time.monotonic() > expires_at, 10_000)
+            try:
+                yield
+            finally:
+                db.connection.set_progress_handler(None, 0)
+        else:
+            yield
+
+
+def _row_estimate(table):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE relname = %s", [table])
+            row = cursor.fetchone()
+            if row is not None and row[0] > 0:
+                return row[0]
+        cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}")
+        return cursor.fetchone()[0]
+
+
+query_budget = QueryBudget(
+    budget_ms=float(os.getenv("BILLING_QUERY_BUDGET_MS", 2_000)),
+    stats_ttl=int(os.getenv("BILLING_QUERY_STATS_TTL", 60)),
+)
@@ -0,0 +1,119 @@
+from django.db import IntegrityError, transaction
+from .archive import restore
+from .checklist import billing_type_names
+from .models import Billing, BillingArchive
+from .serializers import BillingUpsertSerializer
+from .summary import record_changes
+import logging
+
+logger = logging.getLogger(__name__)
+
+NATURAL_KEY = ('owner_id', 'pet_id', 'type')
+# the conflict update only refreshes updated_at (auto_now) when it is listed
+UPDATE_FIELDS = ('type_name', 'payment', 'status', 'updated_at')
+
+
+def natural_key(values):
+    return tuple(values[field] for field in NATURAL_KEY)
+
+
+def existing_keys(keys):
+    """
+    Map each natural key in `keys` that is already stored to its Billing id.
+    """
+    if not keys:
+        return {}
+    rows = Billing.objects.filter(
+        owner_id__in={key[0] for key in keys},
+        pet_id__in={key[1] for key in keys},
+    ).values_list('id', *NATURAL_KEY)
+    return {tuple(row[1:]): row[0] for row in rows if tuple(row[1:]) in keys}
+
+
+def archived_ids(keys):
+    """
+    Map each natural key in `keys` that is archived to the id of its latest
+    archived row.
+    """
+    if not keys:
+        return {}
+    rows = BillingArchive.objects.filter(
+        owner_id__in={key[0] for key in keys},
+        pet_id__in={key[1] for key in keys},
+    ).order_by('archived_at').values_list('id', *NATURAL_KEY)
+    return {tuple(row[1:]): row[0] for row in rows if tuple(row[1:]) in keys}
+
+
+def lock_stored(keys):
+    """
+    Restore the archived ones among `keys`, as upsert does, then lock every
+    stored row for `keys` and return its current values by natural key.
+    """
+    for pk in archived_ids([key for key in keys if key not in existing_keys(keys)]).values():
+        restore(pk)
+    rows = Billing.objects.select_for_update().filter(id__in=existing_keys(keys).values())
+    return {natural_key(row): row for row in rows.values(*NATURAL_KEY, 'status', 'payment')}
+
+
+def upsert_billings(items, batch_size=500):
+    """
+    Validate `items` and upsert the valid ones on the ('owner_id', 'pet_id',
+    'type') unique key in one transaction.
+
+    Returns the per-item outcomes, in request order, and the saved records.
+    When the same key appears more than once the last item wins and the
+    earlier ones are reported as superseded. An archived key is restored
+    under its id and updated, as the single-record upsert does.
+    """
+    results = [None] * len(items)
+    valid = {}
+    for index, item in enumerate(items):
+        serializer = BillingUpsertSerializer(data=item)
+        if not serializer.is_valid():
+            results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+            continue
+        key = natural_key(serializer.validated_data)
+        if key in valid:
+            superseded = valid[key][0]
+            results[superseded] = {'index': superseded, 'status': 'superseded'}
+        valid[key] = (index, serializer.validated_data)
+
+    saved = []
+    if valid:
+        with transaction.atomic():
+            # a concurrent upsert may insert one of the new keys after we locked the stored
+            # ones; retry once so it is locked and updated rather than counted as created
+            for attempt in range(2):
+                previous = lock_stored(valid.keys())
+                try:
+                    with transaction.atomic():
+                        Billing.objects.bulk_create(
+                            [Billing(**data) for key, (_, data) in valid.items() if key not in previous],
+                            batch_size=batch_size,
+                        )
+                    break
+                except IntegrityError:
+                    if attempt:
+                        raise
+                    logger.info("upsert_billings() - Keys created concurrently, retrying as updates")
+            # every one of these rows is locked by us, so the conflict path always updates it
+            Billing.objects.bulk_create(
+                [Billing(**data) for key, (_, data) in valid.items() if key in previous],
+                update_conflicts=True,
+                unique_fields=NATURAL_KEY,
+                update_fields=UPDATE_FIELDS,
+                batch_size=batch_size,
+            )
+            # bulk_create sends no post_save, so the new type names are added here
+            billing_type_names.add(data['type_name'] for _, data in valid.values())
+            after = existing_keys(valid.keys())
+            record_changes((previous.get(key), data) for key, (_, data) in valid.items())
+        for key, (index, data) in valid.items():
+            results[index] = {
+                'index': index,
+                'status': 'updated' if key in previous else 'created',
+                'id': after.get(key),
+            }
+            saved.append({'id': after.get(key), **data})
+    logger.info("upsert_billings() - %s upserted, %s rejected or superseded", len(saved), len(items) - len(saved))
+    return results, saved
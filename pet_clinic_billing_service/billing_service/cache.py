@@ -0,0 +1,246 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU with a per-entry TTL.
+    """
+
+    def __init__(self, maxsize=1_024, ttl=5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class BillingCache:
+    """
+    Read-through cache for billing rows, addressable by id and by the
+    (owner_id, pet_id, type) natural key.
+
+    Lookups go to the in-process LRU first, then to the optional shared tier
+    (any Django cache backend, e.g. Redis), then to the loader. A loaded row
+    is stored under both of its keys so either lookup warms the other.
+    Misses are not cached, so a create is visible immediately.
+
+    A load takes a lease on its key in the shared tier and only stores the row
+    while it still holds it. invalidate() deletes the leases of both keys, so
+    a row loaded before a write cannot be stored after that write's
+    invalidation.
+    """
+
+    def __init__(self, local, shared=None, shared_ttl=60):
+        self.local = local
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        # request threads share one instance
+        self._counter_lock = threading.Lock()
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @staticmethod
+    def id_key(pk):
+        return f"billing:id:{pk}"
+
+    @staticmethod
+    def natural_key(owner_id, pet_id, type):
+        return f"billing:key:{owner_id}:{pet_id}:{type}"
+
+    @staticmethod
+    def lease_key(key):
+        return f"{key}:lease"
+
+    def keys_for(self, record):
+        return [self.id_key(record['id']), self.natural_key(record['owner_id'], record['pet_id'], record['type'])]
+
+    def get_by_id(self, pk, loader, share=True):
+        """
+        Returns (record, whether it came from a cache tier).
+        """
+        return self._get(self.id_key(pk), loader, share)
+
+    def get_by_natural_key(self, owner_id, pet_id, type, loader, share=True):
+        return self._get(self.natural_key(owner_id, pet_id, type), loader, share)
+
+    async def aget_by_id(self, pk, loader, share=True):
+        return await self._aget(self.id_key(pk), loader, share)
+
+    async def aget_by_natural_key(self, owner_id, pet_id, type, loader, share=True):
+        return await self._aget(self.natural_key(owner_id, pet_id, type), loader, share)
+
+    def invalidate(self, record):
+        keys = self.keys_for(record)
+        for key in keys:
+            self.local.delete(key)
+        if self.shared is not None:
+            try:
+                # the leases go first, so a load still in flight cannot put the old row back
+                self.shared.delete_many([self.lease_key(key) for key in keys] + keys)
+            except Exception as e:
+                logger.error("BillingCache.invalidate() - Shared cache delete failed: %s", e)
+
+    def stats(self):
+        with self._counter_lock:
+            counters = dict(self.counters)
+        return {**counters, 'local_size': len(self.local)}
+
+    def _count(self, name):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def _get(self, key, loader, share=True):
+        record = self.local.get(key)
+        if record is not None:
+            self._count('local_hits')
+            return record, True
+        shared = self.shared is not None
+        if shared:
+            try:
+                record = self.shared.get(key)
+            except Exception as e:
+                logger.error("BillingCache._get() - Shared cache read failed: %s", e)
+            if record is not None:
+                self._count('shared_hits')
+                self._store_local(record)
+                return record, True
+        self._count('misses')
+        lease = None
+        if shared and share:
+            lease = uuid.uuid4().hex
+            try:
+                self.shared.set(self.lease_key(key), lease, timeout=self.shared_ttl)
+            except Exception as e:
+                logger.error("BillingCache._get() - Shared cache lease failed: %s", e)
+                lease = None
+        record = loader()
+        if record is not None:
+            if lease is not None:
+                try:
+                    if not self._store_shared(key, record, lease):
+                        return record, False
+                except Exception as e:
+                    logger.error("BillingCache._get() - Shared cache write failed: %s", e)
+            self._store_local(record)
+        return record, False
+
+    async def _aget(self, key, loader, share=True):
+        # same lookup order as _get(), awaiting the shared tier and an async loader
+        record = self.local.get(key)
+        if record is not None:
+            self._count('local_hits')
+            return record, True
+        shared = self.shared is not None
+        if shared:
+            try:
+                record = await self.shared.aget(key)
+            except Exception as e:
+                logger.error("BillingCache._aget() - Shared cache read failed: %s", e)
+            if record is not None:
+                self._count('shared_hits')
+                self._store_local(record)
+                return record, True
+        self._count('misses')
+        lease = None
+        if shared and share:
+            lease = uuid.uuid4().hex
+            try:
+                await self.shared.aset(self.lease_key(key), lease, timeout=self.shared_ttl)
+            except Exception as e:
+                logger.error("BillingCache._aget() - Shared cache lease failed: %s", e)
+                lease = None
+        record = await loader()
+        if record is not None:
+            if lease is not None:
+                try:
+                    if not await self._astore_shared(key, record, lease):
+                        return record, False
+                except Exception as e:
+                    logger.error("BillingCache._aget() - Shared cache write failed: %s", e)
+            self._store_local(record)
+        return record, False
+
+    def _store_local(self, record):
+        for key in self.keys_for(record):
+            self.local.set(key, record)
+
+    def _store_shared(self, key, record, lease):
+        """
+        Store `record` under both its keys if the lease on `key` survived the
+        load. Returns whether it did.
+        """
+        lease_key = self.lease_key(key)
+        if self.shared.get(lease_key) != lease:
+            return False
+        keys = self.keys_for(record)
+        self.shared.set_many({k: record for k in keys}, timeout=self.shared_ttl)
+        # an invalidation between the check and the write deleted the lease; take the row back out
+        if self.shared.get(lease_key) != lease:
+            self.shared.delete_many(keys)
+            return False
+        return True
+
+    async def _astore_shared(self, key, record, lease):
+        lease_key = self.lease_key(key)
+        if await self.shared.aget(lease_key) != lease:
+            return False
+        keys = self.keys_for(record)
+        await self.shared.aset_many({k: record for k in keys}, timeout=self.shared_ttl)
+        if await self.shared.aget(lease_key) != lease:
+            await self.shared.adelete_many(keys)
+            return False
+        return True
+
+
+def _shared_tier():
+    alias = os.getenv("BILLING_SHARED_CACHE", "shared")
+    return caches[alias] if alias in settings.CACHES else None
+
+
+billing_cache = BillingCache(
+    LRUCache(
+        maxsize=int(os.getenv("BILLING_CACHE_SIZE", 1_024)),
+        # other workers only see our invalidations through the shared tier,
+        # so the local tier keeps a short TTL
+        ttl=float(os.getenv("BILLING_CACHE_TTL", 5)),
+    ),
+    shared=_shared_tier(),
+    shared_ttl=int(os.getenv("BILLING_SHARED_CACHE_TTL", 60)),
+)
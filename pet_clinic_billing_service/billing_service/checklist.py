@@ -0,0 +1,209 @@
+from array import array
+from bisect import bisect_left
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Billing, CheckList
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidNameIndex:
+    """
+    Compact in-process index of CheckList.invalid_name.
+
+    Names are stored as 64-bit fingerprints in a sorted array (8 bytes per
+    row), with recently added rows kept in a small delta set until they are
+    compacted in. A fingerprint hit is only a candidate: matches are confirmed
+    against CheckList before a name is excluded, so a collision or a row
+    deleted by another process can never hide a valid billing record.
+
+    Refreshes pick up new rows by id. Deletes show up as a row count change,
+    but an in-place update made by another process does not, so the index is
+    also reloaded in full every `full_reload_seconds`.
+    """
+
+    COMPACT_THRESHOLD = 10_000
+
+    def __init__(self, refresh_seconds=60, full_reload_seconds=600):
+        self.refresh_seconds = refresh_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self._lock = threading.Lock()
+        self._sorted = array("q")
+        self._delta = frozenset()
+        self._max_id = None
+        self._row_count = 0
+        self._loaded_at = None
+        self._full_loaded_at = None
+        self._stale = True
+
+    def mark_stale(self):
+        self._stale = True
+
+    def mark_changed(self):
+        # new rows can be picked up incrementally on the next refresh
+        self._loaded_at = None
+
+    def __len__(self):
+        return len(self._sorted) + len(self._delta)
+
+    def might_contain(self, name):
+        fingerprint = hash(name)
+        if fingerprint in self._delta:
+            return True
+        hashes = self._sorted
+        i = bisect_left(hashes, fingerprint)
+        return i < len(hashes) and hashes[i] == fingerprint
+
+    def is_fresh(self):
+        return not self._stale and self._loaded_at is not None \
+            and time.monotonic() - self._loaded_at < self.refresh_seconds
+
+    def refresh(self):
+        if self.is_fresh():
+            return
+        # one refresh at a time; meanwhile other requests keep the previous index, if there is one
+        if not self._lock.acquire(blocking=self._max_id is None):
+            return
+        try:
+            if self.is_fresh():
+                return
+            if self._stale or self._max_id is None \
+                    or time.monotonic() - self._full_loaded_at >= self.full_reload_seconds:
+                self._full_load()
+            else:
+                self._incremental_load()
+            self._loaded_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def excluded_names(self, candidates, using=None):
+        """
+        Return the subset of `candidates` that are listed in CheckList,
+        confirmed on the `using` alias.
+        """
+        self.refresh()
+        hits = [name for name in set(candidates) if self.might_contain(name)]
+        if not hits:
+            return set()
+        checklist = CheckList.objects.using(using) if using else CheckList.objects.all()
+        return set(checklist.filter(invalid_name__in=hits).values_list('invalid_name', flat=True))
+
+    def _full_load(self):
+        start = time.time()
+        self._stale = False
+        hashes = array("q")
+        max_id = None
+        for row_id, name in CheckList.objects.order_by('id').values_list('id', 'invalid_name').iterator(chunk_size=20_000):
+            hashes.append(hash(name))
+            max_id = row_id
+        self._sorted = array("q", sorted(hashes))
+        self._delta = frozenset()
+        self._max_id = max_id if max_id is not None else -1
+        self._row_count = len(hashes)
+        self._full_loaded_at = time.monotonic()
+        logger.info("InvalidNameIndex loaded %s names in %.2fms", self._row_count, (time.time() - start) * 1_000)
+
+    def _incremental_load(self):
+        stats = CheckList.objects.aggregate(max_id=Max('id'), total=Count('id'))
+        new_rows = CheckList.objects.filter(id__gt=self._max_id).values_list('id', 'invalid_name') \
+            if stats['max_id'] is not None and stats['max_id'] > self._max_id else []
+        added = {}
+        for row_id, name in new_rows:
+            added[row_id] = hash(name)
+        if self._row_count + len(added) != stats['total']:
+            # rows were deleted or rewritten somewhere we did not see
+            logger.info("InvalidNameIndex detected CheckList rewrite, reloading")
+            self._full_load()
+            return
+        if not added:
+            return
+        self._max_id = max(added)
+        self._row_count += len(added)
+        delta = self._delta | frozenset(added.values())
+        if len(delta) >= self.COMPACT_THRESHOLD:
+            self._sorted = array("q", sorted(self._sorted.tolist() + list(delta)))
+            delta = frozenset()
+        self._delta = delta
+        logger.debug("InvalidNameIndex added %s names", len(added))
+
+
+class BillingTypeNames:
+    """
+    The distinct Billing.type_name values the index checks, so list requests
+    do not each run SELECT DISTINCT over billing. The set is reloaded every
+    `refresh_seconds`; names saved in this process are added straight away,
+    and another process's new names show up on the next reload, the same
+    bound the index has for CheckList rows.
+    """
+
+    def __init__(self, refresh_seconds=60):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._names = frozenset()
+        self._added = None
+        self._loaded_at = None
+
+    def add(self, names):
+        names = frozenset(names)
+        with self._lock:
+            self._names = self._names | names
+            if self._added is not None:
+                self._added.update(names)
+
+    def get(self, using=None):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return self._names
+        # one reload at a time; meanwhile other requests keep the previous set, if there is one
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return self._names
+        try:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return self._names
+            with self._lock:
+                # names saved while the DISTINCT runs may not be in its result
+                self._added = set()
+            billings = Billing.objects.using(using) if using else Billing.objects.all()
+            names = set(billings.order_by().values_list('type_name', flat=True).distinct())
+            with self._lock:
+                self._names = frozenset(names | self._added)
+                self._added = None
+                self._loaded_at = time.monotonic()
+            return self._names
+        finally:
+            self._load_lock.release()
+
+
+refresh_seconds = int(os.getenv("CHECKLIST_INDEX_REFRESH_SECONDS", 60))
+invalid_name_index = InvalidNameIndex(
+    refresh_seconds,
+    full_reload_seconds=int(os.getenv("CHECKLIST_INDEX_FULL_RELOAD_SECONDS", 600)),
+)
+billing_type_names = BillingTypeNames(refresh_seconds)
+
+
+def index_enabled():
+    return os.getenv("CHECKLIST_INDEX_ENABLED", "true").lower() in ("1", "true")
+
+
+@receiver(post_save, sender=CheckList)
+def checklist_saved(sender, instance, created, **kwargs):
+    if created:
+        invalid_name_index.mark_changed()
+    else:
+        invalid_name_index.mark_stale()
+
+
+@receiver(post_delete, sender=CheckList)
+def checklist_deleted(sender, instance, **kwargs):
+    invalid_name_index.mark_stale()
+
+
+@receiver(post_save, sender=Billing)
+def billing_saved(sender, instance, **kwargs):
+    billing_type_names.add([instance.type_name])
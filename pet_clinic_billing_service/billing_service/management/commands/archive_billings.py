@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from billing_service.archive import archive_batch, archive_statuses, eligible, retention_cutoff
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Move billing records past the retention policy (status in BILLING_ARCHIVE_STATUSES, unchanged "
+        "for BILLING_ARCHIVE_AFTER_DAYS) to billing_archive in batches. Safe to stop and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, default=None,
+                            help="Override BILLING_ARCHIVE_AFTER_DAYS.")
+        parser.add_argument("--status", action="append", dest="statuses",
+                            help="Override BILLING_ARCHIVE_STATUSES; repeatable.")
+        parser.add_argument("--batch-size", type=int, default=1_000, help="Rows moved per transaction.")
+        parser.add_argument("--max-batches", type=int, default=None, help="Stop after this many batches.")
+        parser.add_argument("--pause", type=float, default=0.0,
+                            help="Seconds to sleep between batches, to spread the load.")
+        parser.add_argument("--start-after-id", type=int, default=0,
+                            help="Resume from this id (the last one a previous run reported).")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the eligible rows.")
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options["older_than_days"])
+        statuses = options["statuses"] or archive_statuses()
+        if options["dry_run"]:
+            count = eligible(cutoff, statuses).filter(id__gt=options["start_after_id"]).count()
+            self.stdout.write(f"{count} billing records updated before {cutoff:%Y-%m-%d} with status in {statuses}")
+            return
+
+        started = time.monotonic()
+        moved = batches = 0
+        last_id = options["start_after_id"]
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            count, last_id = archive_batch(cutoff, statuses, options["batch_size"], after_id=last_id)
+            if not count:
+                break
+            moved += count
+            batches += 1
+            self.stdout.write(f"batch {batches}: archived {count} records, last id {last_id}")
+            if options["pause"]:
+                time.sleep(options["pause"])
+        self.stdout.write(
+            f"Archived {moved} billing records in {batches} batches ({time.monotonic() - started:.1f}s)"
+        )
@@ -0,0 +1,224 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from billing_service.audit import audit_log
+from billing_service.budget import query_budget
+from itertools import count, cycle
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+TYPE_NAMES = ['CatCare', 'DogForever', 'IdealPet', 'PetFirst', 'PetSecurity']
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def summarize(latencies_ms, query_counts):
+    ordered = sorted(latencies_ms)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 3)
+
+    return {
+        'requests': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'p50_ms': pct(50),
+        'p90_ms': pct(90),
+        'p99_ms': pct(99),
+        'max_ms': round(ordered[-1], 3),
+        'queries_per_request': round(statistics.fmean(query_counts), 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the billing endpoints on a throwaway test database seeded at the given "
+        "CheckList/Billing sizes, across subquery limit tiers and exclusion strategies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checklist-sizes", type=_int_list, default=[1_000, 100_000, 1_000_000])
+        parser.add_argument("--billing-rows", type=int, default=10_000)
+        parser.add_argument("--limits", type=_int_list, default=[100, 1_000, 1_000_000],
+                            help="Subquery limit tiers (small, medium, large).")
+        parser.add_argument("--max-results", type=int, default=10_000,
+                            help="Result cap every list request runs with.")
+        parser.add_argument("--exclusion", default="subquery,index",
+                            help="Comma separated exclusion strategies to compare.")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="Write results as JSON to this file instead of stdout.")
+        parser.add_argument("--baseline", help="Compare against a previously saved results file.")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="Allowed relative p50/p99 slowdown against the baseline.")
+        parser.add_argument("--fail-on-regression", action="store_true")
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        # migration 0003 would otherwise seed 1M rows before we seed our own sizes
+        os.environ["CHECKLIST_SEED_ROWS"] = "0"
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        saved_env = {k: os.environ.get(k) for k in (
+            "SMALL_NAME_LIMIT", "MEDIUM_NAME_LIMIT", "LARGE_NAME_LIMIT",
+            "MAX_BILLING_RESULTS", "MIN_BILLING_RESULTS", "CHECKLIST_INDEX_ENABLED",
+        )}
+        # the budget would quietly degrade the larger tiers and carry its learned cost from one
+        # scenario to the next; every scenario runs exactly the plan it is labelled with
+        budget_ms, ms_per_unit = query_budget.budget_ms, query_budget.ms_per_unit
+        query_budget.budget_ms = 0
+        try:
+            # the writes go through the real views; keep them out of the live audit table
+            with audit_log.disabled():
+                results = self.run_matrix(options)
+        finally:
+            query_budget.budget_ms, query_budget.ms_per_unit = budget_ms, ms_per_unit
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'meta': {
+                'vendor': connection.vendor,
+                'billing_rows': options["billing_rows"],
+                'iterations': options["iterations"],
+                'seed': options["seed"],
+                'query_budget_ms': 0,
+                'python': sys.version.split()[0],
+            },
+            'results': results,
+        }
+        payload = json.dumps(report, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(payload + "\n")
+        else:
+            self.stdout.write(payload)
+
+        if options["baseline"]:
+            regressions = self.compare(options["baseline"], results, options["tolerance"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} benchmark regressions against {options['baseline']}")
+
+    def run_matrix(self, options):
+        from billing_service.cache import billing_cache
+        from billing_service.checklist import invalid_name_index
+        from billing_service.models import Billing
+        from billing_service.seeding import seed_checklist, truncate_checklist
+
+        client = Client()
+        results = {}
+        # a fixed result cap keeps runs comparable
+        os.environ["MAX_BILLING_RESULTS"] = os.environ["MIN_BILLING_RESULTS"] = str(options["max_results"])
+        for size in options["checklist_sizes"]:
+            truncate_checklist(connection)
+            seed = seed_checklist(connection, size, seed=options["seed"])
+            invalid_name_index.mark_stale()
+            billing_cache.local.clear()
+            self.seed_billing(options["billing_rows"])
+            self.stderr.write(f"check_list={size}: seeded at {seed['rows_per_second']:,} rows/s")
+
+            for mode in options["exclusion"].split(","):
+                os.environ["CHECKLIST_INDEX_ENABLED"] = "true" if mode == "index" else "false"
+                tiers = options["limits"] if mode == "subquery" else options["limits"][:1]
+                for limit in tiers:
+                    # pin all three tiers so every request runs at this limit
+                    for name in ("SMALL_NAME_LIMIT", "MEDIUM_NAME_LIMIT", "LARGE_NAME_LIMIT"):
+                        os.environ[name] = str(limit)
+                    key = f"list[checklist={size},exclusion={mode},limit={limit}]"
+                    results[key] = self.measure(options["iterations"], lambda: client.get("/billings/"))
+                    self.stderr.write(f"{key}: p50={results[key]['p50_ms']}ms p99={results[key]['p99_ms']}ms")
+
+            keys = list(Billing.objects.values_list('id', 'owner_id', 'pet_id', 'type')[:options["iterations"]])
+            pick = cycle(keys)
+
+            def retrieve():
+                _, owner_id, pet_id, type = next(pick)
+                return client.get(f"/billings/{owner_id}/{pet_id}/{type}/")
+            results[f"retrieve[checklist={size}]"] = self.measure(len(keys), retrieve)
+
+            new_owner = count(10_000_000)
+
+            def create():
+                owner_id = next(new_owner)
+                return client.post("/billings/", {
+                    'owner_id': owner_id, 'pet_id': owner_id, 'type': 'insurance',
+                    'type_name': 'CatCare', 'payment': '10.00', 'status': 'open',
+                }, content_type="application/json")
+            results[f"create[checklist={size}]"] = self.measure(options["iterations"], create)
+
+            updates = cycle(keys)
+
+            def update():
+                pk, owner_id, pet_id, type = next(updates)
+                return client.put(f"/billings/{pk}/", {
+                    'owner_id': owner_id, 'pet_id': pet_id, 'type': type,
+                    'type_name': 'CatCare', 'payment': f"{random.randint(1, 99)}.00", 'status': 'open',
+                }, content_type="application/json")
+            results[f"update[checklist={size}]"] = self.measure(len(keys), update)
+        return results
+
+    def seed_billing(self, rows):
+        from billing_service.models import Billing, CheckList
+        Billing.objects.all().delete()
+        # a few billing rows carry names that are on the check list
+        invalid = list(CheckList.objects.values_list('invalid_name', flat=True)[:3])
+        names = TYPE_NAMES + invalid
+        Billing.objects.bulk_create(
+            [
+                Billing(owner_id=i, pet_id=i, type='insurance', type_name=random.choice(names),
+                        payment=f"{random.randint(1, 99)}.00", status='open')
+                for i in range(1, rows + 1)
+            ],
+            batch_size=5_000,
+        )
+
+    def measure(self, iterations, send):
+        latencies = []
+        query_counts = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = send()
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                latencies.append((time.perf_counter() - start) * 1_000)
+            if response.status_code >= 400:
+                raise CommandError(f"Benchmark request failed with {response.status_code}: {response.content[:200]}")
+            query_counts.append(len(queries))
+
+        # one extra traced request for peak Python heap usage; tracing would skew the timings above
+        tracemalloc.start()
+        try:
+            send()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {**summarize(latencies, query_counts), 'peak_memory_kb': round(peak / 1024, 1)}
+
+    def compare(self, baseline_path, results, tolerance):
+        with open(baseline_path) as f:
+            baseline = json.load(f)['results']
+        regressions = []
+        for key, current in sorted(results.items()):
+            previous = baseline.get(key)
+            if previous is None:
+                continue
+            for metric in ('p50_ms', 'p99_ms'):
+                if previous[metric] > 0 and current[metric] > previous[metric] * (1 + tolerance):
+                    regressions.append(key)
+                    self.stderr.write(
+                        f"REGRESSION {key} {metric}: {previous[metric]}ms -> {current[metric]}ms"
+                    )
+        if not regressions:
+            self.stderr.write(f"No regressions against {baseline_path} (tolerance {tolerance:.0%})")
+        return regressions
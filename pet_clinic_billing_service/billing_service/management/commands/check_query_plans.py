@@ -0,0 +1,181 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from billing_service.audit import audit_log
+import json
+import os
+import random
+import re
+
+TYPE_NAMES = ['CatCare', 'DogForever', 'IdealPet', 'PetFirst', 'PetSecurity']
+# nodes that consume their whole input before emitting a row, so a Limit above them bounds nothing
+BLOCKING_NODES = {'Sort', 'Hash', 'Aggregate', 'Materialize', 'Incremental Sort', 'WindowAgg', 'SetOp'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the SQL the billing endpoints issue against a seeded throwaway test "
+        "database and fail if any of it sequentially scans a table larger than --max-scan-rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checklist-rows", type=int, default=200_000)
+        parser.add_argument("--billing-rows", type=int, default=10_000)
+        parser.add_argument("--max-scan-rows", type=int, default=50_000,
+                            help="Largest table an unbounded sequential scan may read.")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--verbose-plans", action="store_true", help="Print every plan, not just failures.")
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        os.environ["CHECKLIST_SEED_ROWS"] = "0"
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        saved_index_env = os.environ.get("CHECKLIST_INDEX_ENABLED")
+        try:
+            self.seed(options)
+            # the writes go through the real views; keep them out of the live audit table
+            with audit_log.disabled():
+                queries = self.capture_queries()
+            failures = self.check_plans(queries, options)
+        finally:
+            if saved_index_env is None:
+                os.environ.pop("CHECKLIST_INDEX_ENABLED", None)
+            else:
+                os.environ["CHECKLIST_INDEX_ENABLED"] = saved_index_env
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if failures:
+            raise CommandError(f"{len(failures)} queries scan tables above {options['max_scan_rows']:,} rows")
+        self.stdout.write(self.style.SUCCESS(f"{len(queries)} queries checked, no oversized sequential scans"))
+
+    def seed(self, options):
+        from billing_service.models import Billing, CheckList
+        from billing_service.seeding import seed_checklist, truncate_checklist
+        truncate_checklist(connection)
+        seed_checklist(connection, options["checklist_rows"], seed=options["seed"])
+        invalid = list(CheckList.objects.values_list('invalid_name', flat=True)[:3])
+        Billing.objects.bulk_create(
+            [
+                Billing(owner_id=i, pet_id=i, type='insurance', type_name=random.choice(TYPE_NAMES + invalid),
+                        payment=f"{random.randint(1, 99)}.00", status='open')
+                for i in range(1, options["billing_rows"] + 1)
+            ],
+            batch_size=5_000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def scenarios(self):
+        client = Client()
+        yield "list", lambda: client.get("/billings/")
+        yield "list_page", lambda: client.get("/billings/?page_size=100")
+        yield "list_page_cursor", lambda: client.get(
+            "/billings/", {"cursor": client.get("/billings/?page_size=100").json()["next_cursor"]}
+        )
+        yield "retrieve", lambda: client.get("/billings/1/")
+        yield "retrieve_natural_key", lambda: client.get("/billings/2/2/insurance/")
+        yield "create", lambda: client.post("/billings/", {
+            'owner_id': 20_000_000 + random.randint(0, 1_000_000), 'pet_id': 1, 'type': 'insurance',
+            'type_name': 'CatCare', 'payment': '10.00', 'status': 'open',
+        }, content_type="application/json")
+        yield "update", lambda: client.put("/billings/3/", {
+            'owner_id': 3, 'pet_id': 3, 'type': 'insurance',
+            'type_name': 'CatCare', 'payment': '12.00', 'status': 'open',
+        }, content_type="application/json")
+        yield "bulk", lambda: client.post("/billings/bulk/", [
+            {'owner_id': i, 'pet_id': i, 'type': 'insurance', 'type_name': 'IdealPet',
+             'payment': '15.00', 'status': 'open'}
+            for i in range(4, 14)
+        ], content_type="application/json")
+        yield "upsert", lambda: client.put("/billings/5/5/insurance/", {
+            'type_name': 'PetFirst', 'payment': '11.00',
+        }, content_type="application/json")
+        yield "summary", lambda: client.get("/billings/summary/3/")
+
+    def capture_queries(self):
+        from billing_service.budget import query_budget
+        from billing_service.cache import billing_cache
+        from billing_service.checklist import invalid_name_index
+
+        captured = []
+        for mode in ("subquery", "index"):
+            os.environ["CHECKLIST_INDEX_ENABLED"] = "true" if mode == "index" else "false"
+            # warm the once-a-minute work (index load, table stats) so only per-request SQL is captured
+            invalid_name_index.refresh()
+            query_budget.table_stats()
+            billing_cache.local.clear()
+            for name, send in self.scenarios():
+                with CaptureQueriesContext(connection) as queries:
+                    response = send()
+                    if response.streaming:
+                        b"".join(response.streaming_content)
+                if response.status_code >= 400:
+                    raise CommandError(f"{name} failed with {response.status_code}: {response.content[:200]}")
+                captured.extend((f"{name}[{mode}]", q['sql']) for q in queries.captured_queries)
+        return captured
+
+    def check_plans(self, queries, options):
+        failures = []
+        seen = set()
+        for name, sql in queries:
+            if not re.match(r"\s*(SELECT|UPDATE|DELETE|WITH)\b", sql, re.IGNORECASE) or sql in seen:
+                continue
+            seen.add(sql)
+            plan, scans = self.explain(sql)
+            oversized = [(table, rows) for table, rows in scans if rows > options["max_scan_rows"]]
+            if oversized or options["verbose_plans"]:
+                self.stderr.write(f"{name}: {sql[:200]}\n{plan}")
+            for table, rows in oversized:
+                failures.append((name, table))
+                self.stderr.write(self.style.ERROR(f"{name}: sequential scan on {table} (~{rows:,} rows)"))
+        return failures
+
+    def explain(self, sql):
+        """
+        Return the printable plan and the (table, row estimate) of every
+        sequential scan in it that is not cut short by a LIMIT.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = list(self.postgres_scans(plan[0]['Plan'], bounded=False))
+                return json.dumps(plan, indent=2), scans
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            rows = cursor.fetchall()
+        details = [row[-1] for row in rows]
+        # SQLite's plan has no LIMIT node: a plain top-level scan of a LIMITed query with no
+        # temp b-tree (sort/distinct) stops early, every other bare scan reads the whole table
+        bounded = re.search(r"\bLIMIT\b", sql, re.IGNORECASE) and not any("TEMP B-TREE" in d for d in details)
+        # SQLite names aliased tables by their alias (Django aliases subquery tables as U0, U1, ...)
+        aliases = dict(
+            (alias, table) for table, alias in re.findall(r'(?:FROM|JOIN) "(\w+)" (?:AS )?"?(\w+)"?', sql)
+        )
+        tables = set(connection.introspection.table_names())
+        scans = []
+        for (id, parent, *_), detail in zip(rows, details):
+            match = re.match(r"SCAN (?:TABLE )?(\w+)$", detail)
+            table = match and aliases.get(match.group(1), match.group(1))
+            if table in tables and not (bounded and parent == 0):
+                scans.append((table, self.table_rows(table)))
+        return "\n".join(details), scans
+
+    def postgres_scans(self, node, bounded):
+        if node['Node Type'] == 'Limit':
+            bounded = True
+        elif node['Node Type'] in BLOCKING_NODES:
+            bounded = False
+        if node['Node Type'] == 'Seq Scan' and not bounded:
+            yield node['Relation Name'], int(node['Plan Rows'])
+        for child in node.get('Plans', ()):
+            # a SubPlan/InitPlan runs to completion regardless of the Limit above its parent
+            child_bounded = bounded and child.get('Parent Relationship') not in ('SubPlan', 'InitPlan')
+            yield from self.postgres_scans(child, child_bounded)
+
+    def table_rows(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}")
+            return cursor.fetchone()[0]
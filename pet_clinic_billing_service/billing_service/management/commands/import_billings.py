@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from billing_service.bulk import upsert_billings
+from billing_service.cache import billing_cache
+from billing_service.transfer import FORMATS, open_import, read_records
+from collections import Counter
+import json
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert billing records from an NDJSON or CSV file (optionally .gz, '-' for stdin), "
+        "as written by GET /billings/export/, in batches with constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=sorted(FORMATS), default=None,
+                            help="Input format; defaults to the file extension, else ndjson.")
+        parser.add_argument("--batch-size", type=int, default=1_000,
+                            help="Records per upsert transaction.")
+        parser.add_argument("--max-errors", type=int, default=100,
+                            help="Stop after this many invalid records (0 for no limit).")
+
+    def handle(self, *args, **options):
+        try:
+            stream, fmt = open_import(options["path"], options["format"])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        totals = Counter()
+        batch = []
+        with stream:
+            for number, record in read_records(stream, fmt):
+                if isinstance(record, str):
+                    self.report_error(totals, number, record, options)
+                    continue
+                batch.append((number, record))
+                if len(batch) >= options["batch_size"]:
+                    self.flush(batch, totals, options)
+                    batch = []
+            self.flush(batch, totals, options)
+
+        seconds = time.monotonic() - started
+        self.stdout.write(
+            f"Imported {totals['created'] + totals['updated']} records in {seconds:.1f}s "
+            f"({totals['created']} created, {totals['updated']} updated, "
+            f"{totals['superseded']} superseded, {totals['invalid']} invalid)"
+        )
+
+    def flush(self, batch, totals, options):
+        if not batch:
+            return
+        results, saved = upsert_billings([record for _, record in batch], batch_size=options["batch_size"])
+        for data in saved:
+            billing_cache.invalidate(data)
+        for result in results:
+            if result['status'] == 'invalid':
+                self.report_error(totals, batch[result['index']][0], result['errors'], options)
+            else:
+                totals[result['status']] += 1
+
+    def report_error(self, totals, number, errors, options):
+        totals['invalid'] += 1
+        self.stderr.write(f"line {number}: {errors if isinstance(errors, str) else json.dumps(errors)}")
+        if options["max_errors"] and totals['invalid'] >= options["max_errors"]:
+            raise CommandError(f"Stopped after {totals['invalid']} invalid records")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from billing_service.summary import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = "Recompute BillingSummary from Billing and its archive (all owners, or only --owner ones)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", type=int, action="append", dest="owners",
+                            help="Only rebuild this owner's summary; repeatable.")
+        parser.add_argument("--batch-size", type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        rows = rebuild_summary(owner_ids=options["owners"], batch_size=options["batch_size"])
+        self.stdout.write(f"Rebuilt {rows} billing summary rows")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from billing_service.seeding import next_checklist_id, seed_checklist, truncate_checklist
+
+
+class Command(BaseCommand):
+    help = "Bulk-load random CheckList names (COPY on PostgreSQL, executemany elsewhere)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000, help="Number of rows to insert.")
+        parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible data.")
+        parser.add_argument("--batch-size", type=int, default=50_000)
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--truncate", action="store_true", help="Empty check_list before loading.")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if options["truncate"]:
+            truncate_checklist(connection)
+        report = seed_checklist(
+            connection,
+            options["rows"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            start_id=next_checklist_id(connection),
+        )
+        self.stdout.write(
+            f"Loaded {report['rows']} rows in {report['seconds']}s ({report['rows_per_second']:,} rows/s)"
+        )
@@ -1,26 +1,55 @@
 # Generated by Django 4.2.16 on 2024-11-07 22:51
 
+from django.core.management.color import no_style
 from django.db import migrations
+import io
+import os
 import random
 
-def generate_random_string():
-    return ''.join(random.choices('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=32))
+ALPHABET = b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+# maps every byte value onto the alphabet (near-uniform: 256 is not a multiple of 62)
+BYTE_TO_CHAR = bytes(ALPHABET[i % len(ALPHABET)] for i in range(256))
+
+
+def generate_names(count, length=32):
+    # one randbytes() call per batch instead of one random.choices() per name
+    raw = random.randbytes(count * length).translate(BYTE_TO_CHAR).decode('ascii')
+    return [raw[i:i + length] for i in range(0, len(raw), length)]
+
+
+def copy_batch(cursor, table, first_id, names):
+    # generated names are alphanumeric, so COPY's text format needs no escaping
+    data = "".join(f"{row_id}\t{name}\n" for row_id, name in enumerate(names, first_id))
+    sql = f"COPY {table} (id, invalid_name) FROM STDIN"
+    if hasattr(cursor, 'copy_expert'):
+        cursor.copy_expert(sql, io.StringIO(data))  # psycopg2
+    else:
+        with cursor.copy(sql) as copy:  # psycopg 3
+            copy.write(data)
+
 
 def fill_check_list(apps, schema_editor):
     CheckList = apps.get_model('billing_service', 'CheckList')
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(CheckList._meta.db_table)
 
-    # Generate 1 million rows in batches
-    batch_size = 10_000
-    total_rows = 1_000_000
-    for i in range(0, total_rows, batch_size):
-        batch = [
-            CheckList(
-                id=j,
-                invalid_name=generate_random_string()
-            )
-            for j in range(i, min(i + batch_size, total_rows))
-        ]
-        CheckList.objects.bulk_create(batch, ignore_conflicts=True)
+    # Generate 1 million rows in batches (CHECKLIST_SEED_ROWS overrides, e.g. 0 for test databases).
+    # Rows go in through COPY on PostgreSQL and one executemany() per batch elsewhere, not as ORM objects.
+    batch_size = 50_000
+    total_rows = int(os.getenv('CHECKLIST_SEED_ROWS', 1_000_000))
+    with connection.cursor() as cursor:
+        for first_id in range(0, total_rows, batch_size):
+            names = generate_names(min(batch_size, total_rows - first_id))
+            if connection.vendor == 'postgresql':
+                copy_batch(cursor, table, first_id, names)
+            else:
+                cursor.executemany(
+                    f"INSERT INTO {table} (id, invalid_name) VALUES (%s, %s)",
+                    zip(range(first_id, first_id + len(names)), names),
+                )
+        # explicit ids bypass the id sequence; move it past them
+        for sql in connection.ops.sequence_reset_sql(no_style(), [CheckList]):
+            cursor.execute(sql)
 
 class Migration(migrations.Migration):
 
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.3 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_service', '0003_fill_checklist'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='billing',
+            index=models.Index(fields=['type_name'], name='billing_type_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checklist',
+            index=models.Index(fields=['invalid_name'], name='check_list_invalid_name_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1 on 2026-10-17 10:00
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_summary(apps, schema_editor):
+    # a frozen copy of summary.rebuild_summary(); billing_archive does not exist yet at this point
+    Billing = apps.get_model('billing_service', 'Billing')
+    BillingSummary = apps.get_model('billing_service', 'BillingSummary')
+    db_alias = schema_editor.connection.alias
+    rows = Billing.objects.using(db_alias).order_by().values('owner_id', 'status', 'type').annotate(
+        row_count=Count('id'), row_total=Sum('payment')
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=5_000):
+        batch.append(BillingSummary(owner_id=row['owner_id'], status=row['status'], type=row['type'],
+                                    count=row['row_count'], total=row['row_total']))
+        if len(batch) >= 5_000:
+            BillingSummary.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    BillingSummary.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_service', '0004_billing_checklist_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_id', models.IntegerField()),
+                ('status', models.CharField(max_length=20)),
+                ('type', models.CharField(max_length=200)),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'unique_together': {('owner_id', 'status', 'type')},
+            },
+        ),
+        migrations.RunPython(backfill_summary, migrations.RunPython.noop),
+    ]
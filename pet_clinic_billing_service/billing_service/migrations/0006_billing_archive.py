@@ -0,0 +1,62 @@
+# Generated by Django 5.1 on 2026-10-17 11:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def partition_archive(apps, schema_editor):
+    """
+    On PostgreSQL, replace the plain billing_archive table with one
+    range-partitioned by archived_at; archive_billings adds the monthly
+    partitions. The primary key has to include the partition column, and
+    CreateModel's indexes are still deferred, so they land on the new table.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE TABLE billing_archive_partitioned (LIKE billing_archive INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (archived_at)"
+    )
+    schema_editor.execute("DROP TABLE billing_archive")
+    schema_editor.execute("ALTER TABLE billing_archive_partitioned RENAME TO billing_archive")
+    schema_editor.execute("ALTER TABLE billing_archive ADD PRIMARY KEY (id, archived_at)")
+    schema_editor.execute("CREATE TABLE billing_archive_default PARTITION OF billing_archive DEFAULT")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_service', '0005_billingsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billing',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='billing',
+            index=models.Index(fields=['status', 'updated_at'], name='billing_status_updated_idx'),
+        ),
+        migrations.CreateModel(
+            name='BillingArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('owner_id', models.IntegerField()),
+                ('type', models.CharField(max_length=200)),
+                ('type_name', models.CharField(max_length=200)),
+                ('pet_id', models.IntegerField()),
+                ('payment', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(max_length=20)),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'billing_archive',
+                'indexes': [models.Index(fields=['owner_id', 'pet_id', 'type'], name='billing_archive_key_idx')],
+            },
+        ),
+        migrations.RunPython(partition_archive, migrations.RunPython.noop),
+    ]
@@ -8,9 +8,16 @@ class Billing(models.Model):
     pet_id = models.IntegerField()
     payment = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('owner_id', 'pet_id', 'type')
+        indexes = [
+            # list excludes on type_name and reads its DISTINCT values
+            models.Index(fields=['type_name'], name='billing_type_name_idx'),
+            # archive_billings selects rows by status and age
+            models.Index(fields=['status', 'updated_at'], name='billing_status_updated_idx'),
+        ]
 
     def __str__(self):
         return self.owner_id
@@ -20,3 +27,43 @@ class CheckList(models.Model):
 
     class Meta:
         db_table = 'check_list'
+        indexes = [
+            # btree rather than hash: it also serves the DISTINCT ... LIMIT subquery
+            models.Index(fields=['invalid_name'], name='check_list_invalid_name_idx'),
+        ]
+
+class BillingSummary(models.Model):
+    """
+    Per-owner billing count and payment total for each (status, type),
+    maintained in the same transaction as every Billing write.
+    """
+    owner_id = models.IntegerField()
+    status = models.CharField(max_length=20)
+    type = models.CharField(max_length=200)
+    count = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('owner_id', 'status', 'type')
+
+class BillingArchive(models.Model):
+    """
+    Billing rows moved out of the hot table by archive_billings, under their
+    original ids. On PostgreSQL the table is range-partitioned by archived_at.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    owner_id = models.IntegerField()
+    type = models.CharField(max_length=200)
+    type_name = models.CharField(max_length=200)
+    pet_id = models.IntegerField()
+    payment = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'billing_archive'
+        indexes = [
+            # natural-key lookups; a key can be archived more than once, so not unique
+            models.Index(fields=['owner_id', 'pet_id', 'type'], name='billing_archive_key_idx'),
+        ]
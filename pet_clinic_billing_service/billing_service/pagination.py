@@ -0,0 +1,70 @@
+from operator import attrgetter
+import base64
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_id, **state):
+    """
+    Build the opaque cursor handed back to clients for the next page. `state`
+    carries whatever else the following pages must repeat.
+    """
+    raw = json.dumps({"id": last_id, **state}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Return the cursor's contents: the last id as "id", plus its state.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id = state["id"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+    if not isinstance(last_id, int):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    return state
+
+
+def keyset_page(queryset, cursor, page_size, key=attrgetter("id"), state=None):
+    """
+    Return one page of `queryset` ordered by id, starting after `cursor`,
+    together with the cursor of the following page (None on the last page).
+    `key` extracts the id from a fetched row; `state` goes into the next cursor.
+    """
+    qs = queryset.order_by("id")
+    if cursor:
+        qs = qs.filter(id__gt=decode_cursor(cursor)["id"])
+    # one extra row tells us whether another page exists without a COUNT(*)
+    objs = list(qs[:page_size + 1])
+    if len(objs) > page_size:
+        objs = objs[:page_size]
+        return objs, encode_cursor(key(objs[-1]), **(state or {}))
+    return objs, None
+
+
+def iter_keyset_chunks(queryset, chunk_size, limit=None, key=attrgetter("id")):
+    """
+    Yield `queryset` in id order as lists of at most `chunk_size` rows, seeking
+    past the last id of each chunk so every query stays a bounded index range.
+    """
+    qs = queryset.order_by("id")
+    last_id = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        chunk_qs = qs if last_id is None else qs.filter(id__gt=last_id)
+        chunk = list(chunk_qs[:size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < size:
+            return
+        last_id = key(chunk[-1])
+        if remaining is not None:
+            remaining -= len(chunk)
@@ -0,0 +1,35 @@
+from rest_framework.renderers import BaseRenderer
+from decimal import Decimal
+import datetime
+import json
+
+
+def _default(obj):
+    # same wire format DRF uses: decimals as strings, datetimes as ISO 8601
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default)
+
+
+def dumps(data):
+    return _encoder.encode(data)
+
+
+class FastJSONRenderer(BaseRenderer):
+    """
+    Compact JSON renderer for read-only responses built from plain dicts and
+    lists; skips DRF's indentation and encoder negotiation.
+    """
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return dumps(data).encode("utf-8")
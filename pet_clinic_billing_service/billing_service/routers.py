@@ -0,0 +1,205 @@
+"""
+Read-replica routing.
+
+Reads go round-robin to the replica aliases listed in
+settings.DATABASE_REPLICA_ALIASES, writes always go to `default`. A replica
+is skipped while it fails its health check or lags the primary by more than
+DATABASE_REPLICA_MAX_LAG seconds; with no usable replica, reads fall back to
+the primary. Requests that write, and requests that recently wrote (cookie)
+or ask for it (X-Read-Your-Writes header), are pinned to the primary.
+The insurance service's service/routers.py is the same file; keep them equal.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from itertools import count
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_pinned = ContextVar("db_pinned_to_primary", default=False)
+
+PIN_COOKIE = "db_pin_primary"
+PIN_HEADER = "HTTP_X_READ_YOUR_WRITES"
+
+
+class ReplicaPool:
+    """
+    Health of the replica aliases, kept fresh by a background thread that
+    checks each replica every `check_interval` seconds, so routing a read
+    never waits on a health-check query. A replica whose last successful
+    check is older than two intervals (a hung check included) is not used.
+    """
+
+    def __init__(self, aliases, max_lag=5.0, check_interval=10.0):
+        self.aliases = list(aliases)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        # unchecked replicas are not used; the first check runs as soon as the checker starts
+        self.health = {alias: {'healthy': False, 'lag_seconds': None, 'checked_at': 0} for alias in self.aliases}
+        self._next = count()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None or not self.aliases:
+                return
+            self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+            self._thread.start()
+
+    def choose(self):
+        """
+        Return the next usable replica alias, or None to read from the primary.
+        """
+        self.start()
+        healthy = [alias for alias in self.aliases if self.is_healthy(alias)]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    def is_healthy(self, alias):
+        state = self.health[alias]
+        return state['healthy'] and time.monotonic() - state['checked_at'] <= 2 * self.check_interval
+
+    def check(self, alias):
+        try:
+            lag = replica_lag(alias)
+        except Exception as e:
+            logger.warning("ReplicaPool.check() - Replica '%s' failed its health check: %s", alias, e)
+            self.health[alias] = {'healthy': False, 'lag_seconds': None, 'checked_at': time.monotonic(),
+                                  'error': str(e)}
+            return
+        healthy = lag <= self.max_lag
+        if not healthy:
+            logger.warning("ReplicaPool.check() - Replica '%s' is %.1fs behind, reading from primary", alias, lag)
+        self.health[alias] = {'healthy': healthy, 'lag_seconds': lag, 'checked_at': time.monotonic()}
+
+    def _run(self):
+        while True:
+            try:
+                for alias in self.aliases:
+                    self.check(alias)
+            finally:
+                # this thread outlives requests, so it has to return its connections itself
+                close_old_connections()
+            time.sleep(self.check_interval)
+
+    def stats(self):
+        stats = {}
+        for alias, state in self.health.items():
+            stats[f"{alias}_healthy"] = int(state['healthy'])
+            if state['lag_seconds'] is not None:
+                stats[f"{alias}_lag_seconds"] = state['lag_seconds']
+        return stats
+
+
+def replica_lag(alias):
+    """
+    Seconds the replica is behind the primary (0 when it has replayed
+    everything it received).
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT CASE WHEN NOT pg_is_in_recovery() "
+                "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+            )
+            return float(cursor.fetchone()[0])
+        cursor.execute("SELECT 1")
+        return 0.0
+
+
+replica_pool = ReplicaPool(
+    getattr(settings, 'DATABASE_REPLICA_ALIASES', []),
+    max_lag=float(os.getenv("DATABASE_REPLICA_MAX_LAG", 5)),
+    check_interval=float(os.getenv("DATABASE_REPLICA_CHECK_INTERVAL", 10)),
+)
+
+
+@contextmanager
+def pin_to_primary():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # reads inside a write transaction must see its uncommitted rows
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica_pool.choose() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_pool.aliases}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema through replication
+        if db in replica_pool.aliases:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pins writes, and reads that follow a write from the same client within
+    DATABASE_READ_YOUR_WRITES_SECONDS, to the primary.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.window = float(os.getenv("DATABASE_READ_YOUR_WRITES_SECONDS", replica_pool.max_lag))
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.pinned(request):
+            return self.get_response(request)
+        with pin_to_primary():
+            response = self.get_response(request)
+        return self.remember_write(request, response)
+
+    async def __acall__(self, request):
+        if not self.pinned(request):
+            return await self.get_response(request)
+        with pin_to_primary():
+            response = await self.get_response(request)
+        return self.remember_write(request, response)
+
+    def pinned(self, request):
+        if not replica_pool.aliases:
+            return False
+        return (
+            request.method not in ("GET", "HEAD", "OPTIONS")
+            or PIN_COOKIE in request.COOKIES
+            or request.META.get(PIN_HEADER, "").lower() in ("1", "true")
+        )
+
+    def remember_write(self, request, response):
+        writes = request.method not in ("GET", "HEAD", "OPTIONS")
+        if writes and response.status_code < 400 and self.window > 0:
+            # rounded up, since the cookie must outlive the window
+            response.set_cookie(PIN_COOKIE, "1", max_age=math.ceil(self.window), httponly=True)
+        return response
@@ -0,0 +1,89 @@
+"""
+Bulk seeding for the check_list table.
+
+Names are generated a whole batch at a time from a single `randbytes()` call
+mapped onto the alphanumeric alphabet, and loaded through the database's bulk
+path: COPY on PostgreSQL, one `executemany()` per batch inside a single
+transaction elsewhere. This module works on raw SQL only; migration 0003 keeps
+its own frozen copy of the name generator and load path.
+"""
+from django.db import transaction
+import io
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+# maps every byte value onto the alphabet (near-uniform: 256 is not a multiple of 62)
+_BYTE_TO_CHAR = bytes(ALPHABET[i % len(ALPHABET)] for i in range(256))
+
+
+def generate_names(count, rng, length=32):
+    raw = rng.randbytes(count * length).translate(_BYTE_TO_CHAR).decode('ascii')
+    return [raw[i:i + length] for i in range(0, len(raw), length)]
+
+
+def seed_checklist(connection, rows, seed=None, batch_size=50_000, start_id=0, table='check_list'):
+    """
+    Insert `rows` random CheckList names with ids starting at `start_id`.
+
+    Returns a report dict with the row count, elapsed seconds and rows per second.
+    """
+    rng = random.Random(seed)
+    quoted_table = connection.ops.quote_name(table)
+    start = time.time()
+    loaded = 0
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        for first_id in range(start_id, start_id + rows, batch_size):
+            count = min(batch_size, start_id + rows - first_id)
+            names = generate_names(count, rng)
+            if connection.vendor == 'postgresql':
+                _copy_batch(cursor, quoted_table, first_id, names)
+            else:
+                cursor.executemany(
+                    f"INSERT INTO {quoted_table} (id, invalid_name) VALUES (%s, %s)",
+                    zip(range(first_id, first_id + count), names),
+                )
+            loaded += count
+            logger.info("seed_checklist() - %s/%s rows, %.0f rows/s", loaded, rows, loaded / (time.time() - start))
+        if connection.vendor == 'postgresql' and rows:
+            # explicit ids bypass the identity sequence; move it past them
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), (SELECT MAX(id) FROM {quoted_table}))",
+                [table],
+            )
+    seconds = time.time() - start
+    return {
+        'rows': loaded,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(loaded / seconds) if seconds > 0 else loaded,
+    }
+
+
+def _copy_batch(cursor, quoted_table, first_id, names):
+    # generated names are alphanumeric, so COPY's text format needs no escaping
+    data = "".join(f"{row_id}\t{name}\n" for row_id, name in enumerate(names, first_id))
+    sql = f"COPY {quoted_table} (id, invalid_name) FROM STDIN"
+    if hasattr(cursor, 'copy_expert'):
+        cursor.copy_expert(sql, io.StringIO(data))  # psycopg2
+    else:
+        with cursor.copy(sql) as copy:  # psycopg 3
+            copy.write(data)
+
+
+def truncate_checklist(connection, table='check_list'):
+    quoted_table = connection.ops.quote_name(table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"TRUNCATE {quoted_table}")
+        else:
+            cursor.execute(f"DELETE FROM {quoted_table}")
+
+
+def next_checklist_id(connection, table='check_list'):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MAX(id) FROM {connection.ops.quote_name(table)}")
+        max_id = cursor.fetchone()[0]
+    return 0 if max_id is None else max_id + 1
@@ -1,11 +1,78 @@
 from rest_framework import serializers
 from .models import Billing
 
-class BillingSerializer(serializers.ModelSerializer):
+class InvalidFields(ValueError):
+    pass
+
+def requested_fields(value, available):
+    """
+    Parse a `?fields=type,payment` value into a tuple of names from
+    `available`, in `available` order and always including 'id'. Returns None
+    when the parameter is absent or empty, meaning every field.
+    """
+    names = {name.strip() for name in (value or "").split(",") if name.strip()}
+    if not names:
+        return None
+    unknown = names.difference(available)
+    if unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(sorted(unknown))}; available: {', '.join(available)}")
+    return tuple(name for name in available if name in names or name == 'id')
+
+def project(data, fields):
+    """
+    Narrow an already serialized record, or list of records, to `fields`.
+    """
+    if fields is None:
+        return data
+    if isinstance(data, dict):
+        return {name: data[name] for name in fields}
+    return [{name: row[name] for name in fields} for row in data]
+
+class FieldsetMixin:
+    """
+    Serializer that takes a `fields` argument and drops every other field.
+    """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields).difference(fields):
+                self.fields.pop(name)
+
+class BillingSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Billing
-        fields = '__all__'
+        # updated_at only drives archiving; responses keep their shape
+        exclude = ('updated_at',)
+
+class BillingUpsertSerializer(BillingSerializer):
+    # upserts resolve ('owner_id', 'pet_id', 'type') conflicts themselves, so
+    # the unique_together validator would only reject existing rows
+    class Meta(BillingSerializer.Meta):
+        validators = []
 
 class HealthSerializer(serializers.ModelSerializer):
     class Meta:
-        fields = ['message']
\ No newline at end of file
+        fields = ['message']
+
+class BillingRowSerializer:
+    """
+    Read-only fast path: builds response rows straight from
+    `.values_list(*BillingRowSerializer.fields)` tuples, without model
+    instances or per-field DRF serialization. Writes still go through
+    BillingSerializer for validation.
+    """
+    fields = ('id', 'owner_id', 'type', 'type_name', 'pet_id', 'payment', 'status')
+
+    def __init__(self, rows, many=False, fields=None):
+        # `fields` narrows the columns, matching a `.values_list(*fields)` query
+        self.rows = rows
+        self.many = many
+        if fields is not None:
+            self.fields = fields
+
+    @property
+    def data(self):
+        fields = self.fields
+        if self.many:
+            return [dict(zip(fields, row)) for row in self.rows]
+        return dict(zip(fields, self.rows))
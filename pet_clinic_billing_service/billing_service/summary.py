@@ -0,0 +1,112 @@
+"""
+Incremental maintenance of BillingSummary.
+
+Every Billing write turns into per-(owner_id, status, type) deltas that are
+applied with atomic `count = count + n` updates inside the writer's
+transaction, so the summary commits or rolls back with the billing row.
+rebuild_summary() recomputes it from Billing and BillingArchive for backfills
+and drift repair.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from itertools import groupby
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from .models import Billing, BillingArchive, BillingSummary
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def summary_key(record):
+    return record['owner_id'], record['status'], record['type']
+
+
+def billing_deltas(changes):
+    """
+    Fold (before, after) record pairs into {summary key: (count, total)}
+    deltas. `before` is None for a create; keys that net to zero are dropped.
+    """
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    for before, after in changes:
+        if before is not None:
+            delta = deltas[summary_key(before)]
+            delta[0] -= 1
+            delta[1] -= Decimal(before['payment'])
+        if after is not None:
+            delta = deltas[summary_key(after)]
+            delta[0] += 1
+            delta[1] += Decimal(after['payment'])
+    return {key: tuple(delta) for key, delta in deltas.items() if delta[0] or delta[1]}
+
+
+def apply_deltas(deltas):
+    # callers hold the transaction; the savepoint only guards the insert race
+    for (owner_id, status, type), (count, total) in deltas.items():
+        rows = BillingSummary.objects.filter(owner_id=owner_id, status=status, type=type)
+        if rows.update(count=F('count') + count, total=F('total') + total):
+            continue
+        try:
+            with transaction.atomic():
+                BillingSummary.objects.create(owner_id=owner_id, status=status, type=type, count=count, total=total)
+        except IntegrityError:
+            # another transaction created the row first
+            rows.update(count=F('count') + count, total=F('total') + total)
+
+
+def record_changes(changes):
+    """
+    Apply the summary deltas of (before, after) Billing record pairs.
+    """
+    apply_deltas(billing_deltas(changes))
+
+
+def owner_summary(owner_id):
+    rows = list(BillingSummary.objects.filter(owner_id=owner_id, count__gt=0).values('status', 'type', 'count', 'total'))
+    summary = {'owner_id': owner_id, 'count': 0, 'total': Decimal(0), 'by_status': {}, 'by_type': {}}
+    for row in rows:
+        summary['count'] += row['count']
+        summary['total'] += row['total']
+        for group, name in (('by_status', row['status']), ('by_type', row['type'])):
+            bucket = summary[group].setdefault(name, {'count': 0, 'total': Decimal(0)})
+            bucket['count'] += row['count']
+            bucket['total'] += row['total']
+    return summary
+
+
+def rebuild_summary(owner_ids=None, batch_size=5_000):
+    """
+    Recompute BillingSummary from Billing and its archive (for `owner_ids`
+    only, if given) in one transaction.
+    """
+    def aggregate(model):
+        rows = model.objects.all()
+        if owner_ids is not None:
+            rows = rows.filter(owner_id__in=owner_ids)
+        return rows.order_by().values('owner_id', 'status', 'type').annotate(
+            row_count=Count('id'), row_total=Sum('payment')
+        )
+
+    summaries = BillingSummary.objects.all()
+    if owner_ids is not None:
+        summaries = summaries.filter(owner_id__in=owner_ids)
+    rows = aggregate(Billing).union(aggregate(BillingArchive), all=True)
+    # ordered by key, so a key's hot and archived groups arrive together
+    rows = rows.order_by('owner_id', 'status', 'type')
+    created = 0
+    with transaction.atomic():
+        summaries.delete()
+        batch = []
+        for key, group in groupby(rows.iterator(chunk_size=batch_size), key=summary_key):
+            group = list(group)
+            batch.append(BillingSummary(owner_id=key[0], status=key[1], type=key[2],
+                                        count=sum(row['row_count'] for row in group),
+                                        total=sum(row['row_total'] for row in group)))
+            if len(batch) >= batch_size:
+                BillingSummary.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        BillingSummary.objects.bulk_create(batch)
+        created += len(batch)
+    logger.info("rebuild_summary() - Wrote %s summary rows", created)
+    return created
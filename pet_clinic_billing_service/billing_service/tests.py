@@ -1,3 +1,642 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from botocore.exceptions import ClientError
+from datetime import timedelta
+from decimal import Decimal
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from pet_clinic_billing_service.startup import Bootstrap
+from unittest import mock
+from . import bulk
+from .archive import archive_batch, retention_cutoff
+from .async_views import billing_retrieve
+from .audit import AuditLogWriter, audit_log
+from .budget import query_budget
+from .cache import BillingCache, LRUCache, billing_cache
+from .checklist import InvalidNameIndex, billing_type_names
+from .log_pipeline import RateLimitFilter, SamplingFilter
+from .metrics import Histogram, connection_pool_stats
+from .models import Billing, BillingArchive, BillingSummary, CheckList
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .routers import ReplicaPool, pin_to_primary
+from .seeding import generate_names, next_checklist_id, seed_checklist
+from .serializers import BillingSerializer
+from .summary import billing_deltas, rebuild_summary, record_changes
+from .transfer import read_records
+from .views import BillingViewSet
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
 
-# Create your tests here.
+# the check_list seeding migration would otherwise load a million rows into every test database
+os.environ.setdefault("CHECKLIST_SEED_ROWS", "0")
+
+
+def streamed(response):
+    # async views stream through an async iterator
+    if response.is_async:
+        async def collect():
+            return b"".join([piece async for piece in response.streaming_content])
+        return async_to_sync(collect)()
+    return b"".join(response.streaming_content)
+
+
+class WriteTestCase(TestCase):
+    """
+    For tests that write through the views: nothing reaches the BillingInfo
+    audit table, and no cached row survives from an earlier test.
+    """
+    def setUp(self):
+        disabled = audit_log.disabled()
+        disabled.__enter__()
+        self.addCleanup(disabled.__exit__, None, None, None)
+        billing_cache.local.clear()
+
+
+def billing(owner_id=1, pet_id=1, type='insurance', **fields):
+    fields = {'type_name': 'CatCare', 'payment': '10.00', 'status': 'open', **fields}
+    return Billing.objects.create(owner_id=owner_id, pet_id=pet_id, type=type, **fields)
+
+
+class ListBudgetTests(TestCase):
+    def test_replanned_query_timing_out_again_returns_an_empty_result(self):
+        billing()
+        with mock.patch.object(BillingViewSet, 'run_list_query', side_effect=OperationalError("interrupted")), \
+                mock.patch('billing_service.views.query_budget._partial', None):
+            response = self.client.get('/billings/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        self.assertIn("decision=timed_out", response["X-Query-Budget"])
+
+    def test_stream_aborts_when_a_chunk_overruns_the_deadline(self):
+        billing()
+        with mock.patch('billing_service.views.iter_keyset_chunks', side_effect=OperationalError("interrupted")):
+            response = self.client.get('/billings/?stream=1')
+            with self.assertRaises(OperationalError):
+                streamed(response)
+
+    def test_page_over_the_deadline_is_a_503(self):
+        with mock.patch('billing_service.views.keyset_page', side_effect=OperationalError("interrupted")):
+            response = self.client.get('/billings/?page_size=10')
+
+        self.assertEqual(response.status_code, 503)
+
+    def test_list_stream_and_page_return_the_same_rows(self):
+        ids = [billing(owner_id=i, pet_id=i).id for i in range(1, 6)]
+
+        listed = [row['id'] for row in self.client.get('/billings/').json()]
+        stream = [row['id'] for row in
+                    json.loads(streamed(self.client.get('/billings/?stream=1')))]
+        paged = [row['id'] for row in self.client.get('/billings/?page_size=10').json()['results']]
+
+        self.assertEqual(sorted(listed), ids)
+        self.assertEqual(stream, ids)
+        self.assertEqual(paged, ids)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        # seeded names would sort among these
+        CheckList.objects.all().delete()
+        # type names sort as their ids do, so a subquery limit of n excludes ids 1..n
+        self.ids = [billing(owner_id=i, pet_id=i, type_name=f"name{i:02d}").id for i in range(1, 11)]
+        CheckList.objects.bulk_create([CheckList(invalid_name=f"name{i:02d}") for i in range(1, 11)])
+
+    def traverse(self, page_size):
+        ids, cursor = [], None
+        while True:
+            params = {'page_size': page_size, **({'cursor': cursor} if cursor else {})}
+            body = self.client.get('/billings/', params).json()
+            ids += [row['id'] for row in body['results']]
+            cursor = body['next_cursor']
+            if cursor is None:
+                return ids
+
+    @mock.patch.dict(os.environ, {"CHECKLIST_INDEX_ENABLED": "false"})
+    def test_every_page_of_a_traversal_uses_the_first_pages_exclusion(self):
+        limits = iter([2, 8, 8, 8, 8, 8])
+        with mock.patch.object(BillingViewSet, 'pick_subquery_limit', side_effect=lambda: next(limits)):
+            ids = self.traverse(page_size=3)
+
+        self.assertEqual(ids, self.ids[2:])
+
+    def test_cursor_round_trips_its_state(self):
+        cursor = encode_cursor(42, subquery_limit=100)
+
+        self.assertEqual(decode_cursor(cursor), {'id': 42, 'subquery_limit': 100})
+        with self.assertRaises(InvalidCursor):
+            decode_cursor("not-a-cursor")
+
+    def test_tampered_subquery_limit_is_rejected(self):
+        response = self.client.get('/billings/', {'page_size': 3, 'cursor': encode_cursor(1, subquery_limit="x")})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class BenchmarkSupportTests(TestCase):
+    @mock.patch.dict(os.environ, {"MAX_BILLING_RESULTS": "500", "MIN_BILLING_RESULTS": "500"})
+    def test_pinned_result_cap(self):
+        caps = {BillingViewSet().plan_list().max_results for _ in range(20)}
+
+        self.assertEqual(caps, {500})
+
+    def test_disabled_audit_log_queues_nothing(self):
+        with mock.patch.object(audit_log, 'start') as start, audit_log.disabled():
+            queued = audit_log.enqueue({'owner_id': 1})
+
+        self.assertFalse(queued)
+        start.assert_not_called()
+        self.assertTrue(audit_log.enabled)
+
+    def test_benchmark_runs_without_the_query_budget(self):
+        budget_ms = query_budget.budget_ms
+        seen = []
+        with mock.patch.object(connection.creation, 'create_test_db'), \
+                mock.patch.object(connection.creation, 'destroy_test_db'), \
+                mock.patch('billing_service.management.commands.benchmark_billing.Command.run_matrix',
+                           side_effect=lambda options: seen.append(query_budget.budget_ms) or {}):
+            call_command('benchmark_billing', stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(seen, [0])
+        self.assertEqual(query_budget.budget_ms, budget_ms)
+
+
+class UpsertTests(WriteTestCase):
+    def put(self, body):
+        return self.client.put('/billings/1/1/insurance/', json.dumps(body), content_type='application/json')
+
+    def test_creates_then_updates_the_natural_key(self):
+        created = self.put({'type_name': 'CatCare', 'payment': '10.00'})
+        updated = self.put({'type_name': 'CatCare', 'payment': '12.50'})
+
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(updated.json()['id'], created.json()['id'])
+        self.assertEqual(Billing.objects.get().payment, Decimal('12.50'))
+
+    def test_non_object_body_is_a_400(self):
+        response = self.put([1, 2])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Billing.objects.exists())
+
+
+class BillingCacheTests(TestCase):
+    record = {'id': 1, 'owner_id': 2, 'pet_id': 3, 'type': 'insurance', 'payment': '10.00'}
+
+    def setUp(self):
+        self.shared = LocMemCache('billing-cache-tests', {})
+        self.shared.clear()
+        self.cache = BillingCache(LRUCache(), shared=self.shared)
+
+    def test_reports_the_miss_then_the_hit(self):
+        self.assertEqual(self.cache.get_by_id(1, lambda: self.record), (self.record, False))
+        self.assertEqual(self.cache.get_by_natural_key(2, 3, 'insurance', lambda: None), (self.record, True))
+
+    def test_row_loaded_before_a_write_is_not_stored_after_its_invalidation(self):
+        def load_then_write():
+            # the write commits and invalidates while this (old) row is being loaded
+            self.cache.invalidate(self.record)
+            return self.record
+
+        self.cache.get_by_id(1, load_then_write)
+
+        self.assertEqual(self.shared.get_many(self.cache.keys_for(self.record)), {})
+        self.assertEqual(self.cache.get_by_id(1, lambda: None), (None, False))
+
+    def test_counts_every_lookup_across_threads(self):
+        self.cache.get_by_id(1, lambda: self.record)
+
+        def lookups():
+            for _ in range(2_000):
+                self.cache.get_by_id(1, lambda: None)
+        threads = [threading.Thread(target=lookups) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual((self.cache.stats()['local_hits'], self.cache.stats()['misses']), (16_000, 1))
+
+
+class ChecklistIndexTests(WriteTestCase):
+    def test_list_checks_cached_type_names_against_the_index(self):
+        billing(owner_id=1, pet_id=1, type_name='CatCare')
+        billing(owner_id=2, pet_id=2, type_name='Bogus')
+        CheckList.objects.create(invalid_name='Bogus')
+        self.client.get('/billings/')
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = self.client.get('/billings/').json()
+
+        self.assertEqual([row['type_name'] for row in rows], ['CatCare'])
+        self.assertFalse([query['sql'] for query in queries if 'DISTINCT' in query['sql']])
+
+    def test_bulk_upserted_type_names_are_checked_before_the_next_reload(self):
+        billing_type_names.get()
+        CheckList.objects.create(invalid_name='Bogus')
+        item = {'owner_id': 1, 'pet_id': 1, 'type': 'insurance', 'type_name': 'Bogus', 'payment': '10.00',
+                'status': 'open'}
+        self.client.post('/billings/bulk/', json.dumps([item]), content_type='application/json')
+
+        self.assertEqual(self.client.get('/billings/').json(), [])
+
+
+class ReplicaPoolTests(TestCase):
+    def setUp(self):
+        self.pool = ReplicaPool(['default'], check_interval=10)
+        # the background checker is not started; tests run check() themselves
+        patcher = mock.patch.object(self.pool, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_routing_reads_health_without_querying(self):
+        self.assertIsNone(self.pool.choose())
+        self.pool.check('default')
+
+        with CaptureQueriesContext(connection) as queries:
+            chosen = self.pool.choose()
+
+        self.assertEqual(chosen, 'default')
+        self.assertEqual(len(queries), 0)
+
+    def test_replica_with_a_stale_check_is_not_used(self):
+        self.pool.check('default')
+        self.pool.health['default']['checked_at'] -= 30
+
+        self.assertIsNone(self.pool.choose())
+
+
+class PinnedStreamTests(TransactionTestCase):
+    # outside a test transaction, so reads are routed as they are in production
+    def test_streams_are_routed_while_the_request_is_pinned(self):
+        billing()
+        # any read routed after the pin is gone goes to an alias that does not exist
+        with mock.patch('billing_service.routers.replica_pool.choose', return_value='missing'):
+            with pin_to_primary():
+                responses = [self.client.get('/billings/?stream=1'), self.client.get('/billings/export/')]
+            bodies = [streamed(response) for response in responses]
+
+        self.assertEqual(len(json.loads(bodies[0])), 1)
+        self.assertEqual(len(bodies[1].splitlines()), 1)
+
+
+class AuditLogWriterTests(TestCase):
+    def item(self, owner):
+        return {'ownerId': {'S': owner}, 'timestamp': {'S': '2026-01-01 00:00:00.000000'}, 'billing': {'S': '{}'}}
+
+    def test_invalid_record_is_dropped_without_retrying_the_rest(self):
+        def batch_write_item(RequestItems):
+            if any(r['PutRequest']['Item']['ownerId']['S'] == 'bad' for r in RequestItems['BillingInfo']):
+                raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'invalid'}}, 'BatchWriteItem')
+            return {}
+        writer = AuditLogWriter()
+        writer._client = mock.Mock(batch_write_item=mock.Mock(side_effect=batch_write_item))
+
+        with mock.patch('billing_service.audit.time.sleep') as sleep:
+            writer._write_batch([self.item('1'), self.item('bad'), self.item('2')])
+
+        sleep.assert_not_called()
+        self.assertEqual((writer.written, writer.rejected, writer.failed), (2, 1, 0))
+
+
+class InvalidNameIndexTests(TestCase):
+    def test_fingerprint_hits_are_confirmed_against_check_list(self):
+        CheckList.objects.create(invalid_name='Bogus')
+        index = InvalidNameIndex()
+
+        with mock.patch.object(index, 'might_contain', return_value=True):
+            excluded = index.excluded_names(['Bogus', 'CatCare'])
+
+        self.assertEqual(excluded, {'Bogus'})
+
+    def test_refresh_picks_up_added_rows_incrementally(self):
+        CheckList.objects.create(invalid_name='Bogus')
+        index = InvalidNameIndex()
+        index.refresh()
+        CheckList.objects.create(invalid_name='Bogus2')
+        # what the post_save receiver does for the shared index
+        index.mark_changed()
+
+        with mock.patch.object(index, '_full_load') as full_load:
+            index.refresh()
+
+        full_load.assert_not_called()
+        self.assertTrue(index.might_contain('Bogus2'))
+        self.assertEqual(len(index), 2)
+
+    def test_loaded_index_is_served_while_another_request_refreshes_it(self):
+        CheckList.objects.create(invalid_name='Bogus')
+        index = InvalidNameIndex()
+        index.refresh()
+        index.mark_changed()
+
+        with index._lock, mock.patch.object(index, '_incremental_load') as load:
+            index.refresh()
+
+        load.assert_not_called()
+        self.assertTrue(index.might_contain('Bogus'))
+
+    def test_full_reload_picks_up_rows_rewritten_in_place(self):
+        row = CheckList.objects.create(invalid_name='Bogus')
+        index = InvalidNameIndex(refresh_seconds=0, full_reload_seconds=0)
+        index.refresh()
+        # a queryset update sends no signal, like a write from another process
+        CheckList.objects.filter(id=row.id).update(invalid_name='Renamed')
+
+        index.refresh()
+
+        self.assertTrue(index.might_contain('Renamed'))
+        self.assertEqual(index.excluded_names(['Renamed', 'Bogus'], 'default'), {'Renamed'})
+
+
+class FastReadPathTests(WriteTestCase):
+    def test_row_serializer_matches_the_model_serializer(self):
+        record = billing(payment='12.50')
+
+        response = self.client.get(f'/billings/{record.id}/')
+
+        self.assertEqual(response.json(), json.loads(json.dumps(BillingSerializer(record).data)))
+
+
+class BulkUpsertTests(WriteTestCase):
+    def post(self, items):
+        return self.client.post('/billings/bulk/', json.dumps(items), content_type='application/json')
+
+    def item(self, pet_id, **fields):
+        return {'owner_id': 1, 'pet_id': pet_id, 'type': 'insurance', 'type_name': 'CatCare', 'payment': '10.00',
+                'status': 'open', **fields}
+
+    def test_reports_each_items_outcome_in_request_order(self):
+        existing = billing(pet_id=1)
+
+        response = self.post([self.item(1, payment='11.00'), self.item(2), self.item(2, payment='13.00'),
+                              self.item(3, payment='not a number')])
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.json()],
+                         ['updated', 'superseded', 'created', 'invalid'])
+        self.assertEqual(response.json()[0]['id'], existing.id)
+        self.assertEqual(Billing.objects.get(pet_id=2).payment, Decimal('13.00'))
+
+    def test_archived_key_is_restored_and_updated(self):
+        archived = billing(pet_id=1, status='paid')
+        Billing.objects.update(updated_at=timezone.now() - timedelta(days=100))
+        rebuild_summary()
+        archive_batch(retention_cutoff(90), ['paid'], batch_size=10)
+
+        response = self.post([self.item(1, payment='11.00')])
+
+        self.assertEqual(response.json()[0], {'index': 0, 'status': 'updated', 'id': archived.id})
+        self.assertFalse(BillingArchive.objects.exists())
+        self.assertEqual(self.client.get('/billings/summary/1/').json()['count'], 1)
+
+    def test_key_inserted_concurrently_is_counted_as_an_update(self):
+        lock_stored = bulk.lock_stored
+
+        def racing(keys):
+            stored = lock_stored(keys)
+            if not Billing.objects.exists():
+                # another request inserts the key after our lookup, summary included
+                created = billing(pet_id=1)
+                record_changes([(None, {'owner_id': 1, 'status': 'open', 'type': 'insurance',
+                                        'payment': created.payment})])
+            return stored
+
+        with mock.patch('billing_service.bulk.lock_stored', side_effect=racing):
+            response = self.post([self.item(1, payment='11.00')])
+
+        summary = self.client.get('/billings/summary/1/').json()
+        self.assertEqual(response.json()[0]['status'], 'updated')
+        self.assertEqual((summary['count'], Decimal(summary['total'])), (1, Decimal('11.00')))
+
+    def test_rejects_more_items_than_the_limit(self):
+        with mock.patch.dict(os.environ, {"BILLING_BULK_MAX_ITEMS": "1"}):
+            response = self.post([self.item(1), self.item(2)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Billing.objects.exists())
+
+
+class BootstrapTests(TestCase):
+    def test_failed_step_is_retried_without_holding_up_the_others(self):
+        calls = []
+
+        def flaky():
+            calls.append('flaky')
+            if len(calls) == 1:
+                raise OSError("not yet")
+
+        bootstrap = Bootstrap([('flaky', flaky), ('steady', lambda: calls.append('steady'))])
+        with mock.patch('pet_clinic_billing_service.startup.time.sleep') as sleep:
+            bootstrap._run()
+
+        self.assertEqual(calls, ['flaky', 'steady', 'flaky'])
+        self.assertEqual(sleep.call_count, 1)
+        self.assertTrue(bootstrap.is_ready())
+        self.assertEqual(bootstrap.state['flaky']['attempts'], 2)
+
+    def test_readiness_is_503_until_every_step_is_done(self):
+        self.assertEqual(self.client.get('/ready/').status_code, 503)
+
+
+class SeedingTests(TestCase):
+    def test_seeds_the_requested_rows_after_the_last_id(self):
+        CheckList.objects.all().delete()
+
+        report = seed_checklist(connection, 120, seed=1, batch_size=50)
+        more = seed_checklist(connection, 5, seed=2, start_id=next_checklist_id(connection))
+
+        self.assertEqual((report['rows'], more['rows']), (120, 5))
+        self.assertEqual(CheckList.objects.count(), 125)
+        self.assertEqual(next_checklist_id(connection), 125)
+
+    def test_names_are_alphanumeric_and_reproducible(self):
+        names = generate_names(50, random.Random(3))
+
+        self.assertEqual(names, generate_names(50, random.Random(3)))
+        self.assertTrue(all(len(name) == 32 and name.isalnum() and name.isascii() for name in names))
+
+
+class MetricsTests(TestCase):
+    def test_histogram_percentiles_are_within_the_bucket_error(self):
+        histogram = Histogram()
+        for value in range(1, 100_001):
+            histogram.record(value)
+
+        for p in (50, 90, 99):
+            expected = p * 1_000
+            self.assertLessEqual(abs(histogram.percentile(p) - expected) / expected, 1 / 64)
+        self.assertEqual(histogram.percentile(100), 100_000)
+
+    def test_request_stages_are_exported(self):
+        self.client.get('/billings/')
+
+        body = self.client.get('/metrics/').content.decode()
+
+        self.assertIn('endpoint="GET billings-list",stage="total"', body)
+        self.assertIn('endpoint="GET billings-list",stage="db"', body)
+
+
+class SchemaTests(TestCase):
+    def test_list_columns_are_indexed(self):
+        indexes = {
+            table: {name for name, constraint in connection.introspection.get_constraints(
+                connection.cursor(), table).items() if constraint['index']}
+            for table in ('billing_service_billing', 'check_list')
+        }
+
+        self.assertIn('billing_type_name_idx', indexes['billing_service_billing'])
+        self.assertIn('check_list_invalid_name_idx', indexes['check_list'])
+
+
+class ConnectionPoolStatsTests(TestCase):
+    def test_pool_stats_cover_pooled_aliases(self):
+        pool = mock.Mock(max_size=10, get_stats=mock.Mock(return_value={
+            'pool_size': 4, 'pool_available': 1, 'requests_num': 8, 'requests_wait_ms': 16,
+        }))
+        pooled = mock.Mock(alias='default', settings_dict={'OPTIONS': {'pool': {'min_size': 2}}}, pool=pool)
+        plain = mock.Mock(alias='other', settings_dict={'OPTIONS': {}})
+
+        with mock.patch('django.db.connections.all', return_value=[pooled, plain]):
+            stats = connection_pool_stats()
+
+        self.assertEqual((stats['default_in_use'], stats['default_utilization'], stats['default_wait_ms_avg']),
+                         (3, 0.3, 2))
+        self.assertNotIn('other_size', stats)
+
+
+class AsyncViewTests(WriteTestCase):
+    def test_async_retrieve_returns_the_same_row(self):
+        record = billing()
+        request = RequestFactory().get(f'/billings/{record.id}/')
+
+        response = async_to_sync(billing_retrieve)(request, pk=record.id)
+
+        self.assertEqual(json.loads(response.content), self.client.get(f'/billings/{record.id}/').json())
+
+
+class LogPipelineTests(TestCase):
+    def record(self, level=logging.INFO, name='billing_service.views'):
+        return logging.LogRecord(name, level, __file__, 1, "message", None, None)
+
+    def test_rate_limit_allows_a_burst_of_twice_the_rate(self):
+        limit = RateLimitFilter(rate=2, rates={})
+
+        allowed = [limit.filter(self.record()) for _ in range(6)]
+
+        self.assertEqual(allowed, [True] * 4 + [False] * 2)
+
+    def test_sampling_never_drops_warnings(self):
+        sampling = SamplingFilter(rate=0, rates={'billing_service.cache': 1.0})
+
+        self.assertFalse(sampling.filter(self.record()))
+        self.assertTrue(sampling.filter(self.record(logging.WARNING)))
+        self.assertTrue(sampling.filter(self.record(name='billing_service.cache')))
+
+
+class SummaryTests(WriteTestCase):
+    def test_deltas_net_out_and_move_between_keys(self):
+        before = {'owner_id': 1, 'status': 'open', 'type': 'insurance', 'payment': '10.00'}
+        after = {**before, 'status': 'paid'}
+
+        deltas = billing_deltas([(None, before), (before, after)])
+
+        self.assertEqual(deltas, {(1, 'paid', 'insurance'): (1, Decimal('10.00'))})
+
+    def test_writes_keep_the_summary_equal_to_a_rebuild(self):
+        self.client.post('/billings/', {'owner_id': 1, 'pet_id': 1, 'type': 'insurance', 'type_name': 'CatCare',
+                                        'payment': '10.00', 'status': 'open'})
+        self.client.put('/billings/1/2/insurance/', json.dumps({'type_name': 'CatCare', 'payment': '5.00'}),
+                        content_type='application/json')
+        self.client.put('/billings/1/1/insurance/', json.dumps({'type_name': 'CatCare', 'payment': '10.00',
+                                                                'status': 'paid'}),
+                        content_type='application/json')
+
+        summary = self.client.get('/billings/summary/1/').json()
+        incremental = list(BillingSummary.objects.filter(count__gt=0).order_by('status').values())
+        rebuild_summary()
+        rebuilt = list(BillingSummary.objects.filter(count__gt=0).order_by('status').values())
+
+        self.assertEqual(summary['count'], 2)
+        self.assertEqual(summary['by_status']['paid']['count'], 1)
+        self.assertEqual(Decimal(summary['total']), Decimal('15.00'))
+        self.assertEqual([(row['status'], row['count'], row['total']) for row in incremental],
+                         [(row['status'], row['count'], row['total']) for row in rebuilt])
+
+
+class TransferTests(WriteTestCase):
+    def test_csv_export_imports_back(self):
+        billing(pet_id=1, payment='10.00')
+        billing(pet_id=2, payment='12.50', status='paid')
+        exported = streamed(self.client.get('/billings/export/', {'format': 'csv'})).decode()
+        records = [record for _, record in read_records(io.StringIO(exported, newline=''), 'csv')]
+        Billing.objects.all().delete()
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as export:
+            export.write(exported)
+        self.addCleanup(os.remove, export.name)
+        call_command('import_billings', export.name, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual([record['payment'] for record in records], ['10.00', '12.50'])
+        self.assertEqual(list(Billing.objects.order_by('pet_id').values_list('pet_id', 'payment', 'status')),
+                         [(1, Decimal('10.00'), 'open'), (2, Decimal('12.50'), 'paid')])
+
+    def test_malformed_ndjson_lines_are_reported_not_raised(self):
+        lines = io.StringIO('{"owner_id": 1}\nnot json\n[1]\n')
+
+        records = [record for _, record in read_records(lines, 'ndjson')]
+
+        self.assertEqual(records[0], {'owner_id': 1})
+        self.assertIsInstance(records[1], str)
+        self.assertEqual(records[2], "expected a JSON object")
+
+
+class ArchiveTests(WriteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.paid = billing(pet_id=1, status='paid')
+        self.open = billing(pet_id=2)
+        Billing.objects.update(updated_at=timezone.now() - timedelta(days=100))
+        rebuild_summary()
+
+    def test_moves_old_closed_rows_and_reads_fall_through(self):
+        moved, last_id = archive_batch(retention_cutoff(90), ['paid'], batch_size=10)
+
+        self.assertEqual((moved, last_id), (1, self.paid.id))
+        self.assertEqual(list(Billing.objects.values_list('id', flat=True)), [self.open.id])
+        self.assertEqual(self.client.get(f'/billings/{self.paid.id}/').json()['status'], 'paid')
+        self.assertEqual(self.client.get('/billings/summary/1/').json()['count'], 2)
+
+    def test_upsert_restores_an_archived_row_under_its_id(self):
+        archive_batch(retention_cutoff(90), ['paid'], batch_size=10)
+
+        response = self.client.put('/billings/1/1/insurance/', json.dumps({'type_name': 'CatCare',
+                                                                           'payment': '10.00', 'status': 'open'}),
+                                   content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], self.paid.id)
+        self.assertFalse(BillingArchive.objects.exists())
+
+
+class FieldsetTests(WriteTestCase):
+    def test_list_and_retrieve_return_only_the_requested_fields(self):
+        record = billing()
+
+        listed = self.client.get('/billings/', {'fields': 'payment'}).json()
+        retrieved = self.client.get(f'/billings/{record.id}/', {'fields': 'status,payment'}).json()
+
+        self.assertEqual(listed, [{'id': record.id, 'payment': '10.00'}])
+        self.assertEqual(retrieved, {'id': record.id, 'payment': '10.00', 'status': 'open'})
+
+    def test_unknown_field_is_a_400(self):
+        self.assertEqual(self.client.get('/billings/', {'fields': 'payment,secret'}).status_code, 400)
@@ -0,0 +1,160 @@
+"""
+Bulk export and import of billing records as NDJSON or CSV.
+
+The export streams the whole Billing table through a server-side cursor
+(`.iterator()`), encoding and optionally gzipping one chunk at a time, so
+memory stays flat however large the table is. The import reads the same
+formats line by line and upserts them in batches through upsert_billings(),
+so an export from one environment loads straight into another.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from .models import Billing
+from .renderers import dumps
+from .serializers import BillingRowSerializer
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import zlib
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class _Echo:
+    # csv.writer target that hands each formatted row straight back
+    def write(self, value):
+        return value
+
+
+def export_rows(chunk_size, using=None):
+    """
+    Yield every billing row as a tuple of BillingRowSerializer.fields, in id
+    order, fetched `chunk_size` rows at a time from a server-side cursor.
+    """
+    billings = Billing.objects.using(using) if using else Billing.objects.all()
+    queryset = billings.order_by('id').values_list(*BillingRowSerializer.fields)
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def encode_ndjson(rows):
+    fields = BillingRowSerializer.fields
+    for row in rows:
+        yield dumps(dict(zip(fields, row))) + "\n"
+
+
+def encode_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(BillingRowSerializer.fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+ENCODERS = {'ndjson': encode_ndjson, 'csv': encode_csv}
+
+
+def batched_bytes(pieces, size):
+    """
+    Join text `pieces` into UTF-8 chunks of roughly `size` bytes, so the
+    response is written in a few large chunks rather than one per row.
+    """
+    buffer, buffered = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield "".join(buffer).encode("utf-8")
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def gzipped(chunks, level=6):
+    # wbits=31 writes a gzip header and trailer, so the output is a regular .gz file
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def _aiter(iterator):
+    # ASGI would buffer a sync iterator whole, so pull each chunk in the ORM's thread
+    while (chunk := await sync_to_async(next)(iterator, None)) is not None:
+        yield chunk
+
+
+@require_GET
+def export_billings(request):
+    """
+    GET /billings/export/?format=ndjson|csv[&gzip=1]
+
+    Streams every billing row; `gzip=1` returns the same file gzipped.
+    """
+    fmt = request.GET.get("format", "ndjson").lower()
+    if fmt not in FORMATS:
+        return JsonResponse({'message': f"format must be one of: {', '.join(FORMATS)}"}, status=400)
+    compress = request.GET.get("gzip", "").lower() in ("1", "true")
+    chunk_size = int(os.getenv("BILLING_EXPORT_CHUNK_SIZE", 2_000))
+    logger.info("export_billings() called - format: %s, gzip: %s, chunk_size: %s", fmt, compress, chunk_size)
+
+    # routed now: a read-your-writes pin is gone by the time the response is consumed
+    chunks = batched_bytes(ENCODERS[fmt](export_rows(chunk_size, router.db_for_read(Billing))), 64 * 1024)
+    filename = f"billings.{fmt}"
+    if compress:
+        chunks = gzipped(chunks)
+        filename += ".gz"
+    if isinstance(request, ASGIRequest):
+        chunks = _aiter(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type="application/gzip" if compress else FORMATS[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def open_import(path, fmt=None):
+    """
+    Open `path` ('-' for stdin) as text, gunzipping it when it ends in .gz,
+    and return the stream with its format (from `fmt` or the extension).
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    if fmt is None:
+        fmt = 'csv' if name.endswith(".csv") else 'ndjson'
+    raw = sys.stdin.buffer if path == "-" else open(path, "rb")
+    if path.endswith(".gz"):
+        raw = gzip.GzipFile(fileobj=raw)
+    return io.TextIOWrapper(raw, encoding="utf-8", newline=""), fmt
+
+
+def read_records(stream, fmt):
+    """
+    Yield (line number, record dict) for each record in an NDJSON or CSV
+    stream, one line at a time. A malformed NDJSON line is yielded as an
+    error string instead of a dict.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, f"invalid JSON: {e}"
+            continue
+        yield number, record if isinstance(record, dict) else "expected a JSON object"
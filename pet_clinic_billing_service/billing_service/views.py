@@ -1,157 +1,467 @@
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.renderers import BrowsableAPIRenderer
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, router, transaction
 from django.db.models import Subquery
+from django.http import StreamingHttpResponse
+from .archive import archived_record, restore
+from .audit import audit_log
+from .budget import query_budget
+from .bulk import upsert_billings
+from .cache import billing_cache
+from .checklist import billing_type_names, index_enabled, invalid_name_index
+from .metrics import stage
 from .models import Billing,CheckList
-from .serializers import BillingSerializer
+from .pagination import InvalidCursor, decode_cursor, iter_keyset_chunks, keyset_page
+from .renderers import FastJSONRenderer, dumps
+from .serializers import (
+    BillingRowSerializer, BillingSerializer, BillingUpsertSerializer, InvalidFields, project, requested_fields,
+)
+from .summary import owner_summary, record_changes
+from operator import attrgetter, itemgetter
 from opentelemetry import trace
 import logging
-import boto3
-import datetime
 import os
-import json
 import random
-import time
 
 logger = logging.getLogger(__name__)
 # Create your views here.
 
 class BillingViewSet(viewsets.ViewSet):
+    # serve reads from .values_list() rows instead of model instances + DRF serializers
+    fast_read_path = True
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def list(self, request):
         logger.info("BillingViewSet.list() called - Fetching billing records")
+        try:
+            fields = self.read_fields(request.query_params)
+        except InvalidFields as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if "cursor" in request.query_params or "page_size" in request.query_params:
+            return self.list_page(request, fields)
+
         span = trace.get_current_span()
+        decision = self.plan_list()
+
+        if request.query_params.get("stream", "").lower() in ("1", "true"):
+            response = self.stream(decision, fields)
+            return decision.annotate(span, response, query_budget.budget_ms)
+
+        data, decision = self.list_rows(decision, fields)
+        logger.info("BillingViewSet.list() completed successfully - Returned %s records", len(data))
+        return decision.annotate(span, Response(data), query_budget.budget_ms)
+
+    def plan_list(self):
+        subquery_limit = self.pick_subquery_limit()
+
+        MAX_RESULTS_BOUND = int(os.getenv("MAX_BILLING_RESULTS", 10_000))
+        # MIN_BILLING_RESULTS=MAX_BILLING_RESULTS pins the result cap (e.g. for benchmarks)
+        MIN_RESULTS_BOUND = int(os.getenv("MIN_BILLING_RESULTS", int(MAX_RESULTS_BOUND/10)))
+        max_results = random.randint(min(MIN_RESULTS_BOUND, MAX_RESULTS_BOUND), MAX_RESULTS_BOUND)
+        logger.info("Query parameters - subquery_limit: %s, max_results: %s", subquery_limit, max_results)
+
+        # the budget may shrink the randomly requested plan before it runs
+        exclusion = "index" if index_enabled() else "subquery"
+        decision = query_budget.plan(subquery_limit, max_results, exclusion, self.subquery_tiers())
+        if exclusion == "subquery":
+            trace.get_current_span().set_attribute("db.subquery_limit", decision.subquery_limit)
+        return decision
+
+    def list_rows(self, decision, fields=None):
+        """
+        Run the planned list query and serialize it, narrowed to `fields`.
+        Returns the data and the decision that produced it, which changes if
+        the plan timed out.
+        """
+        span = trace.get_current_span()
+        # force the DB query and count rows
+        try:
+            objs, db_timer = self.run_list_query(decision, fields)
+        except OperationalError as e:
+            logger.warning("BillingViewSet.list() - Query exceeded its %sms budget: %s", query_budget.budget_ms, e)
+            partial = query_budget.on_timeout(decision)
+            if partial is not None:
+                decision.decision = "cached_partial"
+                return project(partial, fields), decision
+            # nothing cached yet: re-plan with the cost the timeout just taught us
+            decision = query_budget.plan(decision.subquery_limit, decision.max_results, decision.exclusion,
+                                         self.subquery_tiers())
+            decision.decision = "replanned"
+            try:
+                objs, db_timer = self.run_list_query(decision, fields)
+            except OperationalError as e:
+                logger.warning("BillingViewSet.list() - Re-planned query also exceeded the budget: %s", e)
+                query_budget.on_timeout(decision)
+                decision.decision = "timed_out"
+                return [], decision
+        record_count = len(objs)
+        logger.info("Database query completed - Records: %s, Duration: %.2fms", record_count, db_timer.ms)
+        
+        span.set_attribute("db.record_count", record_count)
+        span.set_attribute("db.fetch_time_ms", db_timer.ms)
+
+        # measure serialization
+        with stage("serialization") as ser_timer:
+            data = self.read_serializer(objs, many=True, fields=fields).data
+        logger.debug("Serialization completed - Duration: %.2fms", ser_timer.ms)
+        span.set_attribute("serialization.time_ms", ser_timer.ms)
+        # only full rows can stand in for any later request's field set
+        query_budget.observe(decision, db_timer.ms, data, keep_partial=fields is None)
+        return data, decision
+
+    def run_list_query(self, decision, fields=None):
+        # route first so the deadline applies to the connection that runs every query
+        db = router.db_for_read(Billing)
+        trace.get_current_span().set_attribute("db.alias", db)
+        with stage("db") as db_timer, query_budget.deadline(using=db):
+            qs = self.read_queryset(self.billing_queryset(decision.subquery_limit, using=db), fields)
+            # list(qs) actually hit the database
+            objs = list(qs[:decision.max_results])
+        return objs, db_timer
+
+    def list_page(self, request, fields=None):
+        span = trace.get_current_span()
+        page_size = self.page_size(request.query_params)
+        if page_size is None:
+            return Response({'message': 'page_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            objs, next_cursor, db_timer = self.fetch_page(request.query_params.get("cursor"), page_size, fields)
+        except InvalidCursor as e:
+            logger.warning("BillingViewSet.list_page() - %s", e)
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except OperationalError as e:
+            logger.warning("BillingViewSet.list_page() - Page exceeded its %sms budget: %s", query_budget.budget_ms, e)
+            return Response({'message': 'The page query exceeded its time budget'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        span.set_attribute("db.record_count", len(objs))
+        span.set_attribute("db.fetch_time_ms", db_timer.ms)
+
+        with stage("serialization") as ser_timer:
+            data = self.read_serializer(objs, many=True, fields=fields).data
+        span.set_attribute("serialization.time_ms", ser_timer.ms)
+        logger.info("BillingViewSet.list_page() completed successfully - Returned %s records", len(objs))
+        return Response({'results': data, 'next_cursor': next_cursor})
+
+    def fetch_page(self, cursor, page_size, fields=None):
+        """
+        Fetch the page after `cursor`. The first page picks the subquery limit
+        and its cursor carries it, so every page of one traversal excludes the
+        same names and no row is skipped or repeated.
+        """
+        subquery_limit = decode_cursor(cursor).get("subquery_limit") if cursor else self.pick_subquery_limit()
+        if not isinstance(subquery_limit, int) or subquery_limit < 1:
+            raise InvalidCursor(f"Invalid cursor: {cursor}")
+        if not index_enabled():
+            trace.get_current_span().set_attribute("db.subquery_limit", subquery_limit)
+        # the whole page, exclusion lookup included, runs under the statement deadline
+        db = router.db_for_read(Billing)
+        with stage("db") as db_timer, query_budget.deadline(using=db):
+            objs, next_cursor = keyset_page(
+                self.read_queryset(self.billing_queryset(subquery_limit, using=db), fields), cursor, page_size,
+                key=self.row_id, state={"subquery_limit": subquery_limit}
+            )
+        return objs, next_cursor, db_timer
+
+    def page_size(self, params):
+        default_page_size = int(os.getenv("BILLING_PAGE_SIZE", 100))
+        max_page_size = int(os.getenv("BILLING_MAX_PAGE_SIZE", 1_000))
+        try:
+            page_size = int(params.get("page_size", default_page_size))
+        except ValueError:
+            return None
+        return max(1, min(page_size, max_page_size))
+
+    def stream(self, decision, fields=None):
+        chunk_size = int(os.getenv("BILLING_STREAM_CHUNK_SIZE", 500))
+        logger.info("BillingViewSet.stream() - Streaming up to %s records in chunks of %s", decision.max_results,
+                    chunk_size)
+        # routed now: a read-your-writes pin is gone by the time the response is consumed
+        db = router.db_for_read(Billing)
+        return StreamingHttpResponse(self.stream_json(decision, chunk_size, fields, db),
+                                     content_type="application/json")
+
+    def stream_json(self, decision, chunk_size, fields=None, db=DEFAULT_DB_ALIAS):
+        """
+        Yield the planned list as a JSON array, one chunk query at a time on
+        `db`. Each chunk query runs under the statement deadline; one that
+        overruns it aborts the response, since its status has already been sent.
+        """
+        chunks = None
+        yield "["
+        first = True
+        while True:
+            try:
+                with query_budget.deadline(using=db):
+                    if chunks is None:
+                        queryset = self.read_queryset(self.billing_queryset(decision.subquery_limit, using=db), fields)
+                        chunks = iter_keyset_chunks(queryset, chunk_size, limit=decision.max_results,
+                                                    key=self.row_id)
+                    chunk = next(chunks, None)
+            except OperationalError as e:
+                logger.warning("BillingViewSet.stream() - Chunk query exceeded its %sms budget, aborting: %s",
+                               query_budget.budget_ms, e)
+                query_budget.on_timeout(decision)
+                raise
+            if chunk is None:
+                break
+            rows = dumps(self.read_serializer(chunk, many=True, fields=fields).data)[1:-1]
+            if not rows:
+                continue
+            yield rows if first else "," + rows
+            first = False
+        yield "]"
+
+    def read_fields(self, params):
+        """
+        The `?fields=` projection for a read, or None for every field. 'id'
+        is always included, since the keyset pagination seeks on it.
+        """
+        return requested_fields(params.get("fields"), BillingRowSerializer.fields)
+
+    def read_queryset(self, queryset, fields=None):
+        if self.fast_read_path:
+            return queryset.values_list(*(fields or BillingRowSerializer.fields))
+        if fields:
+            return queryset.only(*fields)
+        return queryset
+
+    def read_serializer(self, rows, many=False, fields=None):
+        if self.fast_read_path:
+            return BillingRowSerializer(rows, many=many, fields=fields)
+        return BillingSerializer(rows, many=many, fields=fields)
 
+    @property
+    def row_id(self):
+        return itemgetter(0) if self.fast_read_path else attrgetter("id")
+
+    def subquery_tiers(self):
         # Read all three limits from environment (or use defaults)
         small_limit = int(os.getenv("SMALL_NAME_LIMIT", 100))      # default 100
         medium_limit = int(os.getenv("MEDIUM_NAME_LIMIT", 1_000))   # default 1k
         large_limit = int(os.getenv("LARGE_NAME_LIMIT", 1_000_000))  # default 1M
+        return small_limit, medium_limit, large_limit
+
+    def pick_subquery_limit(self):
+        small_limit, medium_limit, large_limit = self.subquery_tiers()
 
         # Pick with 1% → large, 10% → medium, otherwise → small
         r = random.random()
         if r < 0.01:
             subquery_limit = large_limit
-            logger.debug(f"Selected large subquery limit: {subquery_limit}")
+            logger.debug("Selected large subquery limit: %s", subquery_limit)
         elif r < 0.11:
             subquery_limit = medium_limit
-            logger.debug(f"Selected medium subquery limit: {subquery_limit}")
+            logger.debug("Selected medium subquery limit: %s", subquery_limit)
         else:
             subquery_limit = small_limit
-            logger.debug(f"Selected small subquery limit: {subquery_limit}")
+            logger.debug("Selected small subquery limit: %s", subquery_limit)
+        return subquery_limit
 
-        invalid_names = CheckList.objects.values('invalid_name').distinct()[:subquery_limit]
+    def billing_queryset(self, subquery_limit, using=None):
+        span = trace.get_current_span()
+        billings = Billing.objects.using(using) if using else Billing.objects.all()
+        if index_enabled():
+            # Billing only carries a handful of distinct type names, so checking
+            # those against the in-memory index replaces the DISTINCT anti-join
+            excluded = invalid_name_index.excluded_names(billing_type_names.get(using), using)
+            span.set_attribute("db.exclusion_strategy", "index")
+            span.set_attribute("db.excluded_type_names", len(excluded))
+            if not excluded:
+                return billings
+            return billings.exclude(type_name__in=excluded)
 
-        MAX_RESULTS_BOUND = int(os.getenv("MAX_BILLING_RESULTS", 10_000))
-        max_results = random.randint(int(MAX_RESULTS_BOUND/10), MAX_RESULTS_BOUND)
-        logger.info(f"Query parameters - subquery_limit: {subquery_limit}, max_results: {max_results}")
-        
-        qs = Billing.objects.exclude(
+        span.set_attribute("db.exclusion_strategy", "subquery")
+        # ordered, so a given limit always excludes the same names (the index serves the order)
+        invalid_names = CheckList.objects.values('invalid_name').distinct().order_by('invalid_name')[:subquery_limit]
+        return billings.exclude(
             type_name__in=Subquery(invalid_names)
-        )[:max_results]
-
-
-        # force the DB query and count rows
-        db_start = time.time()
-        # list(qs) actually hit the database
-        objs = list(qs)  
-        db_duration_ms = (time.time() - db_start) * 1_000
-        record_count = len(objs)
-        logger.info(f"Database query completed - Records: {record_count}, Duration: {db_duration_ms:.2f}ms")
-        
-        span.set_attribute("db.subquery_limit", subquery_limit)
-        span.set_attribute("db.record_count", record_count)
-        span.set_attribute("db.fetch_time_ms", db_duration_ms)
-
-        # measure serialization
-        ser_start = time.time()
-        serializer = BillingSerializer(objs, many=True)
-        ser_duration_ms = (time.time() - ser_start) * 1_000
-        logger.debug(f"Serialization completed - Duration: {ser_duration_ms:.2f}ms")
-        span.set_attribute("serialization.time_ms", ser_duration_ms)
-
-        logger.info(f"BillingViewSet.list() completed successfully - Returned {record_count} records")
-        return Response(serializer.data)
+        )
 
     def retrieve(self, request, pk=None, owner_id=None, type=None, pet_id=None):
-        logger.info(f"BillingViewSet.retrieve() called - pk: {pk}, owner_id: {owner_id}, type: {type}, pet_id: {pet_id}")
+        logger.info("BillingViewSet.retrieve() called - pk: %s, owner_id: %s, type: %s, pet_id: %s", pk, owner_id, type, pet_id)
         try:
-            billing_obj = None
+            fields = self.read_fields(request.query_params)
+        except InvalidFields as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        db = router.db_for_read(Billing)
+        # a replica row may predate a write whose invalidation already ran, so it stays out of
+        # the shared tier; the local tier's TTL is within the replica lag bound
+        share = db == DEFAULT_DB_ALIAS
+        with stage("db"):
             if pk is not None:
-                logger.debug(f"Retrieving billing record by ID: {pk}")
-                billing_obj = Billing.objects.get(id=pk)
+                logger.debug("Retrieving billing record by ID: %s", pk)
+                record, hit = billing_cache.get_by_id(pk, lambda: self.load_record(db, id=pk), share=share)
             else:
-                logger.debug(f"Retrieving billing record by owner_id: {owner_id}, type: {type}, pet_id: {pet_id}")
-                billing_obj = Billing.objects.get(owner_id=owner_id, type=type, pet_id=pet_id)
-            
-            serializer = BillingSerializer(billing_obj)
-            logger.info(f"BillingViewSet.retrieve() completed successfully - Found billing record")
-            return Response(serializer.data)
-        except Billing.DoesNotExist:
-            logger.warning(f"BillingViewSet.retrieve() - Billing object not found with given parameters")
+                logger.debug("Retrieving billing record by owner_id: %s, type: %s, pet_id: %s", owner_id, type, pet_id)
+                record, hit = billing_cache.get_by_natural_key(
+                    owner_id, pet_id, type,
+                    lambda: self.load_record(db, owner_id=owner_id, type=type, pet_id=pet_id), share=share
+                )
+        trace.get_current_span().set_attribute("cache.hit", hit)
+
+        if record is None:
+            logger.warning("BillingViewSet.retrieve() - Billing object not found with given parameters")
             return Response({'message': 'Billing object not found'}, status=404)
+        logger.info("BillingViewSet.retrieve() completed successfully - Found billing record")
+        # the cache holds whole rows, shared by every field set
+        return Response(project(record, fields))
+
+    def load_record(self, using, **lookup):
+        record = Billing.objects.using(using).filter(**lookup).values(*BillingRowSerializer.fields).first()
+        if record is None:
+            record = archived_record(using, **lookup)
+        return record
 
     def create(self, request):
-        logger.info(f"BillingViewSet.create() called - Creating new billing record")
-        logger.debug(f"Request data: {request.data}")
+        logger.info("BillingViewSet.create() called - Creating new billing record")
+        logger.debug("Request data: %s", request.data)
         
         serializer = BillingSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            logger.info(f"BillingViewSet.create() - Billing record created successfully, ID: {serializer.data.get('id')}")
+            with stage("db"), transaction.atomic():
+                serializer.save()
+                record_changes([(None, serializer.data)])
+            billing_cache.invalidate(serializer.data)
+            logger.info("BillingViewSet.create() - Billing record created successfully, ID: %s", serializer.data.get('id'))
             self.log(request.data)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
-        logger.error(f"BillingViewSet.create() - Validation failed: {serializer.errors}")
+        logger.error("BillingViewSet.create() - Validation failed: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def update(self, request, pk=None):
-        logger.info(f"BillingViewSet.update() called - Updating billing record ID: {pk}")
-        logger.debug(f"Request data: {request.data}")
+        logger.info("BillingViewSet.update() called - Updating billing record ID: %s", pk)
+        logger.debug("Request data: %s", request.data)
         
         try:
-            billing_obj = Billing.objects.get(id=pk)
-            serializer = BillingSerializer(billing_obj, data=request.data)
-            if serializer.is_valid():
-                serializer.save()
-                logger.info(f"BillingViewSet.update() - Billing record updated successfully, ID: {pk}")
+            with transaction.atomic():
+                # the row lock keeps `previous` accurate for the summary delta
+                try:
+                    billing_obj = Billing.objects.select_for_update().get(id=pk)
+                except Billing.DoesNotExist:
+                    # updating an archived record makes it active again
+                    billing_obj = restore(pk)
+                previous = BillingSerializer(billing_obj).data
+                serializer = BillingSerializer(billing_obj, data=request.data)
+                valid = serializer.is_valid()
+                if valid:
+                    with stage("db"):
+                        serializer.save()
+                        record_changes([(previous, serializer.data)])
+                else:
+                    # leave a restored record in the archive
+                    transaction.set_rollback(True)
+            if valid:
+                # the natural key may have changed, so drop the old and the new entries
+                billing_cache.invalidate(previous)
+                billing_cache.invalidate(serializer.data)
+                logger.info("BillingViewSet.update() - Billing record updated successfully, ID: %s", pk)
                 self.log(request.data)
                 return Response(serializer.data)
             
-            logger.error(f"BillingViewSet.update() - Validation failed: {serializer.errors}")
+            logger.error("BillingViewSet.update() - Validation failed: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Billing.DoesNotExist:
-            logger.warning(f"BillingViewSet.update() - Billing object not found with ID: {pk}")
+            logger.warning("BillingViewSet.update() - Billing object not found with ID: %s", pk)
             return Response({'message': 'Billing object not found'}, status=status.HTTP_404_NOT_FOUND)
+        except IntegrityError:
+            logger.warning("BillingViewSet.update() - Archived billing %s conflicts with an active record", pk)
+            return Response({'message': 'An active billing already exists for this owner, pet and type'},
+                            status=status.HTTP_409_CONFLICT)
+
+    def upsert(self, request, owner_id=None, pet_id=None, type=None):
+        """
+        PUT /billings/<owner_id>/<pet_id>/<type>/: create or update the billing
+        for that natural key in one idempotent call. The body carries the
+        other fields; a missing status keeps the current one ('open' for a
+        new billing). An archived billing is restored and updated.
+        """
+        logger.info("BillingViewSet.upsert() called - owner_id: %s, pet_id: %s, type: %s", owner_id, pet_id, type)
+        logger.debug("Request data: %s", request.data)
+        if hasattr(request.data, 'dict'):
+            body = request.data.dict()
+        elif isinstance(request.data, dict):
+            body = dict(request.data)
+        else:
+            return Response({'message': 'Expected a billing object'}, status=status.HTTP_400_BAD_REQUEST)
+        key = {'owner_id': int(owner_id), 'pet_id': int(pet_id), 'type': type}
+
+        # a concurrent upsert may insert the key between our lookup and insert; retry once to update it
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    billing_obj = Billing.objects.select_for_update().filter(**key).first()
+                    if billing_obj is None:
+                        archived = archived_record(DEFAULT_DB_ALIAS, **key)
+                        if archived is not None:
+                            billing_obj = restore(archived['id'])
+                    previous = BillingSerializer(billing_obj).data if billing_obj is not None else None
+                    serializer = BillingUpsertSerializer(billing_obj, data={
+                        'status': previous['status'] if previous else 'open', **body, **key,
+                    })
+                    valid = serializer.is_valid()
+                    if valid:
+                        with stage("db"):
+                            serializer.save()
+                            record_changes([(previous, serializer.data)])
+                    else:
+                        transaction.set_rollback(True)
+                break
+            except IntegrityError:
+                if attempt:
+                    raise
+                logger.info("BillingViewSet.upsert() - Key created concurrently, retrying as an update")
+
+        if not valid:
+            logger.error("BillingViewSet.upsert() - Validation failed: %s", serializer.errors)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if previous is not None:
+            billing_cache.invalidate(previous)
+        billing_cache.invalidate(serializer.data)
+        logger.info("BillingViewSet.upsert() - Billing record %s, ID: %s",
+                    "updated" if previous else "created", serializer.data.get('id'))
+        self.log(serializer.data)
+        return Response(serializer.data, status=status.HTTP_200_OK if previous else status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        logger.info("BillingViewSet.bulk() called - Upserting billing records")
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'message': 'Expected a list of billing records'}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = int(os.getenv("BILLING_BULK_MAX_ITEMS", 1_000))
+        if len(items) > max_items:
+            return Response({'message': f'At most {max_items} records per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results, saved = upsert_billings(items)
+        for data in saved:
+            billing_cache.invalidate(data)
+            self.log(data)
+        trace.get_current_span().set_attribute("billing.bulk.upserted", len(saved))
+        logger.info("BillingViewSet.bulk() completed - %s of %s records upserted", len(saved), len(items))
+        if any(result['status'] == 'invalid' for result in results):
+            return Response(results, status=status.HTTP_207_MULTI_STATUS)
+        return Response(results)
+
+    @action(detail=False, methods=['get'], url_path=r'summary/(?P<owner_id>\d+)')
+    def summary(self, request, owner_id=None):
+        logger.info("BillingViewSet.summary() called - owner_id: %s", owner_id)
+        with stage("db"):
+            summary = owner_summary(int(owner_id))
+        return Response(summary)
 
     def log(self, data):
-        logger.info(f"BillingViewSet.log() called - Logging billing data to DynamoDB")
-        try:
-            # Initialize a DynamoDB client
-            region = os.environ.get('REGION', 'us-east-1')
-            client = boto3.client('dynamodb', region_name=region)
-            logger.debug(f"DynamoDB client initialized for region: {region}")
-
-            # Define the table name
-            table_name = 'BillingInfo'
-            current_time = datetime.datetime.now()
-            formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Define the item you want to add
-            item = {
-                'ownerId': {'S': data['owner_id']},
-                'timestamp': {'S': formatted_time},
-                'billing': {'S': json.dumps(data)},
-                # Add more attributes as needed
-            }
-
-            logger.debug(f"Preparing to write to DynamoDB table: {table_name}")
-            # Add the item to the table
-            response = client.put_item(
-                TableName=table_name,
-                Item=item
-            )
-            logger.info(f"BillingViewSet.log() - Successfully logged billing data to DynamoDB, owner_id: {data.get('owner_id')}")
-        except Exception as e:
-            logger.error(f"BillingViewSet.log() - Failed to log billing data to DynamoDB: {str(e)}")
-            # Don't raise the exception to avoid disrupting the main flow
+        logger.info("BillingViewSet.log() called - Queueing billing data for DynamoDB")
+        # the audit writer batches records to DynamoDB in the background
+        queued = audit_log.enqueue(data)
+        stats = audit_log.stats()
+        span = trace.get_current_span()
+        span.set_attribute("audit.queued", queued)
+        span.set_attribute("audit.queue_depth", stats['queue_depth'])
+        span.set_attribute("audit.dropped", stats['dropped'])
 
 
 class HealthViewSet(viewsets.ViewSet):
@@ -34,4 +34,9 @@ export OTEL_EXPORTER_OTLP_TRACES_ENDPOINT=http://localhost:4316/v1/traces
 export OTEL_RESOURCE_ATTRIBUTES="service.name=$SVC_NAME"
 
 python3 manage.py migrate  
-opentelemetry-instrument python3 manage.py runserver 0.0.0.0:8800 --noreload
\ No newline at end of file
+if [ "$SERVICE_ASYNC_VIEWS" = "true" ]; then
+  # async views need an ASGI server
+  opentelemetry-instrument uvicorn pet_clinic_billing_service.asgi:application --host 0.0.0.0 --port 8800
+else
+  opentelemetry-instrument python3 manage.py runserver 0.0.0.0:8800 --noreload
+fi
\ No newline at end of file
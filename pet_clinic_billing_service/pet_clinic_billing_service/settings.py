@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "billing_service.metrics.StageTimingMiddleware",
+    "billing_service.routers.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -74,13 +76,36 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "pet_clinic_billing_service.wsgi.application"
 
+# Serve the hot read/write endpoints from async views; meant for ASGI servers
+# (uvicorn pet_clinic_billing_service.asgi:application).
+SERVICE_ASYNC_VIEWS = os.environ.get('SERVICE_ASYNC_VIEWS', 'false').lower() in ('1', 'true')
+
+# Records are filtered (sampling, per-logger rate limits) on the request thread
+# and formatted/written by a background thread; see billing_service/log_pipeline.py.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'standard': {
+            'format': '%(asctime)s %(levelname)s [%(name)s] %(message)s',
+        },
+    },
+    'filters': {
+        'sample': {
+            '()': 'billing_service.log_pipeline.SamplingFilter',
+        },
+        'rate_limit': {
+            '()': 'billing_service.log_pipeline.RateLimitFilter',
+        },
+    },
     'handlers': {
         'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
+            # the loggers below decide what is emitted; the handler passes all of it on
+            'level': LOG_LEVEL,
+            '()': 'billing_service.log_pipeline.BackgroundHandler',
+            'formatter': 'standard',
+            'filters': ['sample', 'rate_limit'],
         },
     },
     'loggers': {
@@ -89,6 +114,16 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'billing_service': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        'pet_clinic_billing_service': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
     },
 }
 
@@ -106,10 +141,12 @@ def get_secret_value(secret_name: str, region_name: str) -> str:
 
 
 env_db_password = os.environ.get('DB_USER_PASSWORD')
+DB_PASSWORD = None
 
 if env_db_password:
     DB_PASSWORD = env_db_password
-else:
+elif os.environ.get('DATABASE_PROFILE', 'local') == 'postgresql':
+    # only the postgresql profile needs the secret; local runs stay offline
     # Retrieve from Secrets Manager
     try:
         DB_PASSWORD = get_secret_value(SECRET_NAME, REGION)
@@ -134,12 +171,61 @@ DATABASES = {
         "PASSWORD": DB_PASSWORD,
         "HOST": os.environ.get("DB_SERVICE_HOST"),
         "PORT": os.environ.get("DB_SERVICE_PORT"),
+        # health-check connections on checkout (pooled) or reuse (persistent)
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# PostgreSQL connection pooling (psycopg 3 pool, one per worker process). With
+# DB_POOL_ENABLED=false, connections persist for DB_CONN_MAX_AGE seconds instead.
+if os.environ.get('DB_POOL_ENABLED', 'true').lower() in ('1', 'true'):
+    DATABASES['postgresql']['CONN_MAX_AGE'] = 0  # the pool owns connection lifetime
+    DATABASES['postgresql']['OPTIONS'] = {
+        "pool": {
+            "min_size": int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            "max_size": int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            # seconds to wait for a free connection before failing the request
+            "timeout": float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            "max_lifetime": float(os.environ.get('DB_POOL_MAX_LIFETIME', 1_800)),
+            # idle connections above min_size are closed after this many seconds
+            "max_idle": float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        },
+    }
+else:
+    DATABASES['postgresql']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
 default_database = os.environ.get('DATABASE_PROFILE', 'local')
 DATABASES['default'] = DATABASES[default_database]
 
+# Read replicas: comma separated host[:port] entries for the postgresql profile,
+# or database file paths for the local profile. Each becomes a replica_<n> alias.
+DATABASE_REPLICA_ALIASES = []
+for index, replica in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), start=1):
+    replica_config = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if replica_config['ENGINE'] == 'django.db.backends.sqlite3':
+        replica_config['NAME'] = replica.strip()
+    else:
+        host, _, port = replica.strip().partition(':')
+        replica_config.update(HOST=host, PORT=port or replica_config['PORT'])
+    DATABASES[f'replica_{index}'] = replica_config
+    DATABASE_REPLICA_ALIASES.append(f'replica_{index}')
+DATABASE_ROUTERS = ['billing_service.routers.ReplicaRouter']
+
+# Caches
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+
+# Optional shared tier for billing lookups
+if os.environ.get('REDIS_URL'):
+    CACHES['shared'] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get('REDIS_URL'),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
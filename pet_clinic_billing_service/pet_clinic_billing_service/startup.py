@@ -0,0 +1,169 @@
+"""
+Deferred startup for the billing service.
+
+Network-bound setup (local IP discovery, the BillingInfo DynamoDB table,
+Eureka registration, warming the CheckList index) runs in a background
+thread once the WSGI/ASGI application has been built, instead of at import
+time in every process. Failed steps are retried with backoff, and the
+`ready/` endpoint reports per-step state until everything has succeeded.
+Bootstrap is the same class as in the insurance service; only the steps differ.
+"""
+from django.http import JsonResponse
+from functools import lru_cache
+from py_eureka_client import eureka_client
+import boto3
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def local_ip():
+    # connecting a UDP socket sends no packets, it only picks the outbound interface
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+        finally:
+            s.close()
+    except OSError:
+        return socket.gethostbyname(socket.gethostname())
+
+
+def table_exists(table_name, dynamodb_client):
+    try:
+        dynamodb_client.describe_table(TableName=table_name)
+        return True
+    except dynamodb_client.exceptions.ResourceNotFoundException:
+        return False
+
+
+def create_dynamodb_table():
+    # Initialize a DynamoDB client
+    dynamodb = boto3.client(
+        'dynamodb',
+        region_name=os.environ.get('REGION', 'us-east-1'),
+        endpoint_url=os.environ.get('DYNAMODB_ENDPOINT_URL') or None,
+    )
+
+    # Define table parameters
+    table_name = 'BillingInfo'
+    read_capacity_units = 2
+    write_capacity_units = 2
+    attribute_definitions = [
+        {
+            'AttributeName': 'ownerId',
+            'AttributeType': 'S'
+        },
+        {
+            'AttributeName': 'timestamp',
+            'AttributeType': 'S'
+        }
+    ]
+    key_schema = [
+        {
+            'AttributeName': 'ownerId',
+            'KeyType': 'HASH'
+        },
+        {
+            'AttributeName': 'timestamp',
+            'KeyType': 'RANGE'
+        }
+    ]
+
+    # Check if table exists
+    if not table_exists(table_name, dynamodb):
+        # Create table
+        dynamodb.create_table(
+            TableName=table_name,
+            KeySchema=key_schema,
+            AttributeDefinitions=attribute_definitions,
+            ProvisionedThroughput={
+                'ReadCapacityUnits': read_capacity_units,
+                'WriteCapacityUnits': write_capacity_units
+            }
+        )
+        logger.info("Table created successfully.")
+    else:
+        logger.info("Table already exists.")
+
+
+def register_with_eureka():
+    billing_service_ip = os.environ.get('BILLING_SERVICE_IP') or local_ip()
+    eureka_server_url = os.environ.get('EUREKA_SERVER_URL', 'localhost')
+    eureka_client.init(
+        eureka_server=f"http://{eureka_server_url}:8761/eureka",
+        instance_host=billing_service_ip,
+        app_name="billing-service",
+        instance_port=8800,
+    )
+
+
+def warm_checklist_index():
+    from billing_service.checklist import index_enabled, invalid_name_index
+    if index_enabled():
+        invalid_name_index.refresh()
+
+
+class Bootstrap:
+    def __init__(self, steps, max_backoff=30.0):
+        self.steps = steps
+        self.max_backoff = max_backoff
+        self.state = {name: {'status': 'pending'} for name, _ in steps}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if os.getenv("SERVICE_BOOTSTRAP_ENABLED", "true").lower() not in ("1", "true"):
+            logger.info("Bootstrap disabled by SERVICE_BOOTSTRAP_ENABLED")
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="service-bootstrap", daemon=True)
+            self._thread.start()
+
+    def is_ready(self):
+        return all(step['status'] == 'done' for step in self.state.values())
+
+    def _run(self):
+        # a step that keeps failing (e.g. no AWS credentials) must not hold up the others
+        pending = list(self.steps)
+        attempt = 0
+        while pending:
+            attempt += 1
+            for name, step in list(pending):
+                self.state[name] = {'status': 'running', 'attempts': attempt}
+                start = time.time()
+                try:
+                    step()
+                except Exception as e:
+                    self.state[name] = {'status': 'failed', 'attempts': attempt, 'error': str(e)}
+                    logger.error("Bootstrap step '%s' failed (attempt %s): %s", name, attempt, e)
+                    continue
+                self.state[name] = {
+                    'status': 'done',
+                    'attempts': attempt,
+                    'duration_ms': round((time.time() - start) * 1_000, 2),
+                }
+                logger.info("Bootstrap step '%s' completed in %sms", name, self.state[name]['duration_ms'])
+                pending.remove((name, step))
+            if pending:
+                time.sleep(min(self.max_backoff, 2 ** attempt))
+
+
+bootstrap = Bootstrap([
+    ('dynamodb_table', create_dynamodb_table),
+    ('eureka_registration', register_with_eureka),
+    ('checklist_index', warm_checklist_index),
+])
+
+
+def readiness(request):
+    ready = bootstrap.is_ready()
+    return JsonResponse({'ready': ready, 'steps': bootstrap.state}, status=200 if ready else 503)
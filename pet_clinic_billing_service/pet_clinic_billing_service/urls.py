@@ -14,16 +14,27 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
+from billing_service.async_views import urlpatterns as async_urlpatterns
+from billing_service.metrics import metrics_view
+from billing_service.transfer import export_billings
 from billing_service.views import HealthViewSet, BillingViewSet
+from pet_clinic_billing_service.startup import readiness
 
 router = DefaultRouter()
 router.register('billings', BillingViewSet, basename='billings')
 router.register('health', HealthViewSet, basename='health')
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("ready/", readiness, name='readiness'),
+    path("metrics/", metrics_view, name='metrics'),
+    # ahead of the router so 'export' is not taken for a billing id
+    path("billings/export/", export_billings, name='billings-export'),
+    # async list/retrieve routes shadow the router's when the async path is on
+    *(async_urlpatterns if settings.SERVICE_ASYNC_VIEWS else []),
     path("", include(router.urls)),
-    path('billings/<int:owner_id>/<int:pet_id>/<str:type>/', BillingViewSet.as_view({'get': 'retrieve'}), name='billing-retrieve'),
+    path('billings/<int:owner_id>/<int:pet_id>/<str:type>/', BillingViewSet.as_view({'get': 'retrieve', 'put': 'upsert'}), name='billing-retrieve'),
 ]
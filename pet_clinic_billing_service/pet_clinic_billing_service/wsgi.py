@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pet_clinic_billing_service.settings")
 
 application = get_wsgi_application()
+
+# network-bound startup runs in the background once the app is loaded
+from pet_clinic_billing_service.startup import bootstrap  # noqa: E402
+
+bootstrap.start()
@@ -40,4 +40,9 @@ export OTEL_RESOURCE_ATTRIBUTES="service.name=$SVC_NAME"
 
 python3 manage.py migrate  
 python3 manage.py loaddata initial_data.json
-opentelemetry-instrument python3 manage.py runserver 0.0.0.0:8000 --noreload
\ No newline at end of file
+if [ "$SERVICE_ASYNC_VIEWS" = "true" ]; then
+  # async views need an ASGI server
+  opentelemetry-instrument uvicorn pet_clinic_insurance_service.asgi:application --host 0.0.0.0 --port 8000
+else
+  opentelemetry-instrument python3 manage.py runserver 0.0.0.0:8000 --noreload
+fi
\ No newline at end of file
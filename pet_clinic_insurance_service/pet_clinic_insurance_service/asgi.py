@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pet_clinic_insurance_service.settings")
 
 application = get_asgi_application()
+
+# network-bound startup runs in the background once the app is loaded
+from pet_clinic_insurance_service.startup import bootstrap  # noqa: E402
+
+bootstrap.start()
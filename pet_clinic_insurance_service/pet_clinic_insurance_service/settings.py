@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "service.metrics.StageTimingMiddleware",
+    "service.routers.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -74,6 +76,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "pet_clinic_insurance_service.wsgi.application"
 
+# Serve the hot read/write endpoints from async views; meant for ASGI servers
+# (uvicorn pet_clinic_insurance_service.asgi:application).
+SERVICE_ASYNC_VIEWS = os.environ.get('SERVICE_ASYNC_VIEWS', 'false').lower() in ('1', 'true')
+
 
 # Get secret name and region from environment or use defaults
 SECRET_NAME = os.environ.get('SECRET_NAME', 'petclinic-python-dbsecret')
@@ -89,10 +95,12 @@ def get_secret_value(secret_name: str, region_name: str) -> str:
 
 
 env_db_password = os.environ.get('DB_USER_PASSWORD')
+DB_PASSWORD = None
 
 if env_db_password:
     DB_PASSWORD = env_db_password
-else:
+elif os.environ.get('DATABASE_PROFILE', 'local') == 'postgresql':
+    # only the postgresql profile needs the secret; local runs stay offline
     # Retrieve from Secrets Manager
     try:
         DB_PASSWORD = get_secret_value(SECRET_NAME, REGION)
@@ -117,19 +125,72 @@ DATABASES = {
         "PASSWORD": DB_PASSWORD,
         "HOST": os.environ.get("DB_SERVICE_HOST"),
         "PORT": os.environ.get("DB_SERVICE_PORT"),
+        # health-check connections on checkout (pooled) or reuse (persistent)
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# PostgreSQL connection pooling (psycopg 3 pool, one per worker process). With
+# DB_POOL_ENABLED=false, connections persist for DB_CONN_MAX_AGE seconds instead.
+if os.environ.get('DB_POOL_ENABLED', 'true').lower() in ('1', 'true'):
+    DATABASES['postgresql']['CONN_MAX_AGE'] = 0  # the pool owns connection lifetime
+    DATABASES['postgresql']['OPTIONS'] = {
+        "pool": {
+            "min_size": int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            "max_size": int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            # seconds to wait for a free connection before failing the request
+            "timeout": float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            "max_lifetime": float(os.environ.get('DB_POOL_MAX_LIFETIME', 1_800)),
+            # idle connections above min_size are closed after this many seconds
+            "max_idle": float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        },
+    }
+else:
+    DATABASES['postgresql']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
 default_database = os.environ.get('DATABASE_PROFILE', 'local')
 DATABASES['default'] = DATABASES[default_database]
 
+# Read replicas: comma separated host[:port] entries for the postgresql profile,
+# or database file paths for the local profile. Each becomes a replica_<n> alias.
+DATABASE_REPLICA_ALIASES = []
+for index, replica in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), start=1):
+    replica_config = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if replica_config['ENGINE'] == 'django.db.backends.sqlite3':
+        replica_config['NAME'] = replica.strip()
+    else:
+        host, _, port = replica.strip().partition(':')
+        replica_config.update(HOST=host, PORT=port or replica_config['PORT'])
+    DATABASES[f'replica_{index}'] = replica_config
+    DATABASE_REPLICA_ALIASES.append(f'replica_{index}')
+DATABASE_ROUTERS = ['service.routers.ReplicaRouter']
+
+# Records are filtered (sampling, per-logger rate limits) on the request thread
+# and formatted/written by a background thread; see service/log_pipeline.py.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'standard': {
+            'format': '%(asctime)s %(levelname)s [%(name)s] %(message)s',
+        },
+    },
+    'filters': {
+        'sample': {
+            '()': 'service.log_pipeline.SamplingFilter',
+        },
+        'rate_limit': {
+            '()': 'service.log_pipeline.RateLimitFilter',
+        },
+    },
     'handlers': {
         'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
+            # the loggers below decide what is emitted; the handler passes all of it on
+            'level': LOG_LEVEL,
+            '()': 'service.log_pipeline.BackgroundHandler',
+            'formatter': 'standard',
+            'filters': ['sample', 'rate_limit'],
         },
     },
     'loggers': {
@@ -138,6 +199,16 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'service': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        'pet_clinic_insurance_service': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
     },
 }
 
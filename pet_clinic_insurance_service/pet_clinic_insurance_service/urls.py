@@ -14,10 +14,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
+from service.async_views import urlpatterns as async_urlpatterns
+from service.metrics import metrics_view
 from service.views import InsuranceViewSet, PetInsuranceViewSet, HealthViewSet
+from pet_clinic_insurance_service.startup import readiness
 
 router = DefaultRouter()
 router.register(r'insurances', InsuranceViewSet)
@@ -26,6 +30,10 @@ router.register('health', HealthViewSet, basename='health')
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("ready/", readiness, name='readiness'),
+    path("metrics/", metrics_view, name='metrics'),
+    # async routes shadow the router's when the async path is on
+    *(async_urlpatterns if settings.SERVICE_ASYNC_VIEWS else []),
     path('', include(router.urls)),
     # path('api/', include((router.urls, 'service'), namespace='service')),
 ]
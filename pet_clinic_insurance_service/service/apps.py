@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class ServiceConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "service"
+
+    def ready(self):
+        from . import log_pipeline
+        from .cache import insurance_list_cache
+        from .discovery import service_registry
+        from .metrics import connection_pool_stats, registry
+        from .outbox import outbox_dispatcher
+        from .resilience import downstreams
+        from .routers import replica_pool
+
+        registry.register_gauge("database_replica", replica_pool.stats)
+        registry.register_gauge("database_pool", connection_pool_stats)
+        registry.register_gauge("logging", log_pipeline.stats)
+        registry.register_gauge("insurance_list_cache", insurance_list_cache.stats)
+        registry.register_gauge("discovery", service_registry.stats)
+        registry.register_gauge("billing_outbox", outbox_dispatcher.stats)
+        registry.register_gauge("circuit_breaker", downstreams.stats)
@@ -0,0 +1,162 @@
+"""
+Async path for the insurance endpoints.
+
+With SERVICE_ASYNC_VIEWS=true the insurance list and the pet-insurance
+list/retrieve/create/update routes are served by the coroutines below. Under
+an ASGI server (uvicorn), reads await the database on the event loop; a
+pet-insurance write hands its save to a worker thread and queues the
+billing-service sync in the outbox (service.outbox). Other methods keep going
+to the DRF viewsets.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import ParseError, ValidationError
+from .cache import insurance_list_cache
+from .metrics import stage
+from .models import Insurance, PetInsurance
+from .serializers import InsuranceSerializer, InvalidFields, PetInsuranceSerializer, requested_fields
+from .views import InsuranceViewSet, PetInsuranceViewSet, parse_owner_id, save_and_enqueue
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch(sync_view, **handlers):
+    """
+    Route each HTTP method to its coroutine in `handlers`; any other method
+    goes to the DRF `sync_view` in a worker thread.
+    """
+    async def view(request, *args, **kwargs):
+        handler = handlers.get(request.method.lower())
+        if handler is None:
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        return await handler(request, *args, **kwargs)
+    return csrf_exempt(view)
+
+
+def request_data(request):
+    """
+    The request body as a dict. Raises ParseError (400, as DRF's parser
+    would) for malformed JSON or JSON that is not an object.
+    """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError as e:
+            raise ParseError(f"JSON parse error - {e}")
+        if not isinstance(data, dict):
+            raise ParseError("Expected a JSON object")
+        return data
+    return request.POST.dict()
+
+
+def read_fields(request, serializer_class):
+    # the `?fields=` projection, raising InvalidFields for unknown names
+    return requested_fields(request.GET.get('fields'), serializer_class.Meta.fields)
+
+
+async def insurance_list(request):
+    logger.info("insurance_list() called - Fetching insurance records")
+    try:
+        fields = read_fields(request, InsuranceSerializer)
+    except InvalidFields as e:
+        return JsonResponse({'detail': str(e)}, status=400)
+
+    async def load():
+        with stage("db"):
+            return [row async for row in Insurance.objects.values(*(fields or InsuranceSerializer.Meta.fields))]
+
+    rows = await insurance_list_cache.aget_or_load(fields, load)
+    return JsonResponse(rows, safe=False)
+
+
+async def pet_insurance_list(request):
+    logger.info("pet_insurance_list() called - Fetching pet insurance records")
+    try:
+        fields = read_fields(request, PetInsuranceSerializer)
+    except InvalidFields as e:
+        return JsonResponse({'detail': str(e)}, status=400)
+    with stage("db"):
+        rows = [row async for row in PetInsurance.objects.values(*(fields or PetInsuranceSerializer.Meta.fields))]
+    return JsonResponse(rows, safe=False)
+
+
+async def pet_insurance_retrieve(request, pet_id):
+    try:
+        fields = read_fields(request, PetInsuranceSerializer)
+    except InvalidFields as e:
+        return JsonResponse({'detail': str(e)}, status=400)
+    with stage("db"):
+        row = await PetInsurance.objects.filter(pet_id=pet_id).values(
+            *(fields or PetInsuranceSerializer.Meta.fields)
+        ).afirst()
+    if row is None:
+        return JsonResponse({'detail': 'No PetInsurance matches the given query.'}, status=404)
+    return JsonResponse(row)
+
+
+async def pet_insurance_create(request):
+    try:
+        data = request_data(request)
+    except ParseError as e:
+        return JsonResponse({'detail': e.detail}, status=400)
+    owner_id = data.get('owner_id')
+    logger.info("pet_insurance_create() called - Creating pet insurance for owner_id: %s, pet_id: %s", owner_id, data.get('pet_id'))
+    try:
+        owner_id = parse_owner_id(data)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+    serializer = PetInsuranceSerializer(data=data)
+    # validation checks pet_id uniqueness against the database
+    if not await sync_to_async(serializer.is_valid)():
+        logger.error("pet_insurance_create() - Validation failed: %s", serializer.errors)
+        return JsonResponse(serializer.errors, status=400)
+    await save_and_bill(serializer, owner_id)
+    return JsonResponse(serializer.data, status=201)
+
+
+async def pet_insurance_update(request, pet_id):
+    try:
+        data = request_data(request)
+    except ParseError as e:
+        return JsonResponse({'detail': e.detail}, status=400)
+    owner_id = data.get('owner_id')
+    logger.info("pet_insurance_update() called - Updating pet insurance for pet_id: %s, owner_id: %s", pet_id, owner_id)
+    try:
+        instance = await PetInsurance.objects.aget(pet_id=pet_id)
+    except PetInsurance.DoesNotExist:
+        return JsonResponse({'detail': 'No PetInsurance matches the given query.'}, status=404)
+    try:
+        owner_id = parse_owner_id(data)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+    serializer = PetInsuranceSerializer(instance, data=data, partial=True)
+    if not await sync_to_async(serializer.is_valid)():
+        logger.error("pet_insurance_update() - Validation failed for pet_id: %s, errors: %s", pet_id, serializer.errors)
+        return JsonResponse(serializer.errors, status=400)
+    await save_and_bill(serializer, owner_id)
+    return JsonResponse(serializer.data)
+
+
+async def save_and_bill(serializer, owner_id):
+    # the billing upsert is queued in the same transaction, see service.outbox
+    await sync_to_async(save_and_enqueue)(serializer, owner_id)
+    logger.info("save_and_bill() - Successfully saved and queued billing for owner_id: %s", owner_id)
+
+
+# the names match the router's so per-endpoint metrics keep their labels
+urlpatterns = [
+    path('insurances/', dispatch(InsuranceViewSet.as_view({'get': 'list', 'post': 'create'}), get=insurance_list),
+         name='insurance-list'),
+    path('pet-insurances/', dispatch(PetInsuranceViewSet.as_view({'get': 'list', 'post': 'create'}),
+                                     get=pet_insurance_list, post=pet_insurance_create),
+         name='petinsurance-list'),
+    path('pet-insurances/<int:pet_id>/', dispatch(
+        PetInsuranceViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+                                     'delete': 'destroy'}),
+        get=pet_insurance_retrieve, put=pet_insurance_update, patch=pet_insurance_update,
+    ), name='petinsurance-detail'),
+]
@@ -0,0 +1,67 @@
+"""
+In-process cache for rendered insurance list responses, one entry per
+`?fields=` field set.
+
+The insurance catalogue is small and changes rarely, so every worker keeps
+the serialized list for each field set it has served for
+INSURANCE_LIST_CACHE_TTL seconds. Writes in this process clear it at once;
+other workers pick the change up when their entries expire.
+"""
+import os
+import threading
+import time
+
+
+class FieldsetCache:
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self._data = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, fields, loader):
+        """
+        Return the cached data for `fields` (None for every field), calling
+        `loader()` to build it on a miss.
+        """
+        data, generation = self._get(fields)
+        if data is None:
+            data = loader()
+            self._set(fields, data, generation)
+        return data
+
+    async def aget_or_load(self, fields, loader):
+        # get_or_load() with an async loader
+        data, generation = self._get(fields)
+        if data is None:
+            data = await loader()
+            self._set(fields, data, generation)
+        return data
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'fieldsets': len(self._data)}
+
+    def _get(self, fields):
+        with self._lock:
+            entry = self._data.get(fields)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0], self._generation
+            self.misses += 1
+            return None, self._generation
+
+    def _set(self, fields, data, generation):
+        with self._lock:
+            # a write since the load started may have made `data` stale
+            if self.ttl > 0 and generation == self._generation:
+                self._data[fields] = (data, time.monotonic() + self.ttl)
+
+
+insurance_list_cache = FieldsetCache(ttl=float(os.getenv("INSURANCE_LIST_CACHE_TTL", 30)))
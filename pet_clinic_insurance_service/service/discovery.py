@@ -0,0 +1,182 @@
+"""
+Client-side service registry on top of the Eureka client.
+
+Instance lists are cached per service for DISCOVERY_TTL_SECONDS and refreshed
+by a background thread, so outbound calls never wait on Eureka once a
+service has been resolved. When a refresh fails, the last known good list
+keeps being served. Only instances Eureka reports UP are used, and an
+instance that fails DISCOVERY_MAX_FAILURES calls in a row is skipped for
+DISCOVERY_EJECT_SECONDS. Requests are spread with DISCOVERY_STRATEGY:
+`round_robin` (default) or `least_outstanding`, which picks the instance
+with the fewest requests in flight from this process.
+"""
+from contextlib import contextmanager
+from itertools import count
+from py_eureka_client import eureka_client
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceUnavailable(ValueError):
+    pass
+
+
+def fetch_instances(service_name):
+    """
+    Base URLs of the UP instances of `service_name` in the Eureka client's
+    registry.
+    """
+    client = eureka_client.get_client()
+    if client is None:
+        raise ServiceUnavailable("Eureka client is not initialised yet")
+    application = client.applications.get_application(service_name.upper())
+    instances = [
+        'http://' + instance.ipAddr + ":" + str(instance.port.port) + "/"
+        for instance in application.instances
+        if getattr(instance, 'status', 'UP') == 'UP'
+    ]
+    logger.debug("Instances of %s: %s", service_name, instances)
+    return instances
+
+
+class ServiceRegistry:
+    def __init__(self, fetch=fetch_instances, ttl=30.0, strategy='round_robin', max_failures=3, eject_seconds=30.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self._services = {}
+        self._outstanding = {}
+        self._failures = {}
+        self._ejected_until = {}
+        self._next = count()
+        self._lock = threading.Lock()
+        self._refresher = None
+        self.counters = {'refreshes': 0, 'refresh_failures': 0, 'stale_served': 0}
+
+    def resolve(self, service_name):
+        """
+        Return the base URL of the instance the next request should go to.
+        """
+        instances = self.instances(service_name)
+        with self._lock:
+            now = time.monotonic()
+            healthy = [url for url in instances if self._ejected_until.get(url, 0) <= now]
+            # with every instance ejected, trying one beats failing outright
+            candidates = healthy or instances
+            if self.strategy == 'least_outstanding':
+                turn = next(self._next)
+                # rotate first so ties are shared rather than all going to the first instance
+                rotated = candidates[turn % len(candidates):] + candidates[:turn % len(candidates)]
+                return min(rotated, key=lambda url: self._outstanding.get(url, 0))
+            return candidates[next(self._next) % len(candidates)]
+
+    @contextmanager
+    def instance(self, service_name):
+        """
+        Pick an instance and track the request against it: yields its base
+        URL, counts it as outstanding until the block exits, and records a
+        failure if the block raises anything but ServiceUnavailable.
+        """
+        url = self.resolve(service_name)
+        with self._lock:
+            self._outstanding[url] = self._outstanding.get(url, 0) + 1
+        try:
+            yield url
+        except ServiceUnavailable:
+            # rejected before reaching the instance (e.g. an open circuit); says nothing about it
+            raise
+        except Exception:
+            self.report(url, ok=False)
+            raise
+        else:
+            self.report(url, ok=True)
+        finally:
+            with self._lock:
+                self._outstanding[url] -= 1
+
+    def report(self, url, ok):
+        with self._lock:
+            if ok:
+                self._failures.pop(url, None)
+                return
+            failures = self._failures.get(url, 0) + 1
+            self._failures[url] = failures
+            if failures >= self.max_failures:
+                self._ejected_until[url] = time.monotonic() + self.eject_seconds
+                self._failures.pop(url)
+                logger.warning("ServiceRegistry - Ejecting %s for %ss after %s failures", url, self.eject_seconds,
+                               failures)
+
+    def instances(self, service_name):
+        entry = self._services.get(service_name)
+        if entry is None:
+            # first use: nothing to fall back on, so wait for the registry
+            entry = self.refresh(service_name)
+            if entry is None or not entry['instances']:
+                raise ServiceUnavailable(f"no valid instance found for service '{service_name}'")
+            self._start_refresher()
+        elif time.monotonic() - entry['fetched_at'] > 2 * self.ttl:
+            # the refresher has fallen behind (or keeps failing); serve what we have
+            self.counters['stale_served'] += 1
+        return entry['instances']
+
+    def refresh(self, service_name):
+        """
+        Re-read `service_name` from Eureka. A failed or empty read keeps the
+        last known good instance list; returns the cache entry or None.
+        """
+        previous = self._services.get(service_name)
+        try:
+            instances = self.fetch(service_name)
+        except Exception as e:
+            self.counters['refresh_failures'] += 1
+            logger.warning("ServiceRegistry.refresh() - Could not resolve %s, keeping the last known instances: %s",
+                           service_name, e)
+            return previous
+        if not instances and previous is not None:
+            self.counters['refresh_failures'] += 1
+            logger.warning("ServiceRegistry.refresh() - Eureka lists no UP instance of %s, keeping the last known ones",
+                           service_name)
+            return previous
+        self.counters['refreshes'] += 1
+        entry = {'instances': instances, 'fetched_at': time.monotonic()}
+        self._services[service_name] = entry
+        return entry
+
+    def stats(self):
+        now = time.monotonic()
+        stats = dict(self.counters)
+        for name, entry in self._services.items():
+            stats[f"{name}_instances"] = len(entry['instances'])
+            stats[f"{name}_age_seconds"] = round(now - entry['fetched_at'], 1)
+        with self._lock:
+            stats['outstanding'] = sum(self._outstanding.values())
+            stats['ejected'] = sum(1 for until in self._ejected_until.values() if until > now)
+        return stats
+
+    def _start_refresher(self):
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="service-registry", daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.ttl)
+            for service_name in list(self._services):
+                self.refresh(service_name)
+
+
+service_registry = ServiceRegistry(
+    ttl=float(os.getenv("DISCOVERY_TTL_SECONDS", 30)),
+    strategy=os.getenv("DISCOVERY_STRATEGY", "round_robin"),
+    max_failures=int(os.getenv("DISCOVERY_MAX_FAILURES", 3)),
+    eject_seconds=float(os.getenv("DISCOVERY_EJECT_SECONDS", 30)),
+)
@@ -0,0 +1,135 @@
+"""
+Logging pipeline: filters run on the request thread, everything else on a
+background writer.
+
+BackgroundHandler puts records on a bounded queue unformatted; a
+QueueListener thread formats and writes them, so %-style arguments are only
+rendered for records that are actually emitted. SamplingFilter keeps a
+fraction of DEBUG/INFO records per logger and RateLimitFilter caps each
+logger's records per second. WARNING and above are never sampled out.
+Configured from settings.LOGGING; no Django imports so it can load before
+the apps do. A copy lives in the billing service as
+billing_service/log_pipeline.py.
+"""
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+_counters = {'dropped': 0, 'sampled_out': 0, 'rate_limited': 0}
+_handlers = []
+
+
+def _parse_rates(value):
+    # "billing_service.views=0.1,service.rest=0.5"
+    rates = {}
+    for item in filter(None, (value or "").split(",")):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def _for_logger(rates, name, default):
+    # the longest configured prefix of the logger name wins
+    while name:
+        if name in rates:
+            return rates[name]
+        name = name.rpartition(".")[0]
+    return default
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Queue records for a writer thread that formats them and writes them to
+    stderr. When the queue is full, records are dropped and counted rather
+    than blocking the request.
+    """
+
+    def __init__(self, queue_size=10_000, stream=None):
+        super().__init__(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", queue_size))))
+        self.target = logging.StreamHandler(stream)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self._closed = False
+        _handlers.append(self)
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        # formatting happens on the writer thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # unlike QueueHandler.prepare(), keep msg/args unmerged until the writer formats them
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _counters['dropped'] += 1
+
+    def close(self):
+        # close() runs again from logging.shutdown(), and stop() only works once
+        if not self._closed:
+            self._closed = True
+            # flushes whatever is still queued
+            self.listener.stop()
+        self.target.close()
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep DEBUG/INFO records with probability LOG_SAMPLE_RATE, overridden per
+    logger (prefix) by LOG_SAMPLE_RATES.
+    """
+
+    def __init__(self, rate=None, rates=None):
+        super().__init__()
+        self.rate = float(os.getenv("LOG_SAMPLE_RATE", 1.0) if rate is None else rate)
+        self.rates = _parse_rates(os.getenv("LOG_SAMPLE_RATES")) if rates is None else rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if random.random() < _for_logger(self.rates, record.name, self.rate):
+            return True
+        _counters['sampled_out'] += 1
+        return False
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per logger: at most LOG_RATE_LIMIT records per second
+    (overridden per logger prefix by LOG_RATE_LIMITS), with bursts of up to
+    twice that. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate=None, rates=None):
+        super().__init__()
+        self.rate = float(os.getenv("LOG_RATE_LIMIT", 0) if rate is None else rate)
+        self.rates = _parse_rates(os.getenv("LOG_RATE_LIMITS")) if rates is None else rates
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        rate = _for_logger(self.rates, record.name, self.rate)
+        if rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(record.name, (2 * rate, now))
+            tokens = min(2 * rate, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            self._buckets[record.name] = (tokens - 1 if allowed else tokens, now)
+        if not allowed:
+            _counters['rate_limited'] += 1
+        return allowed
+
+
+def stats():
+    return {**_counters, 'queue_depth': sum(handler.queue.qsize() for handler in _handlers)}
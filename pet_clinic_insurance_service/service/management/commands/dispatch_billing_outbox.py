@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+from pet_clinic_insurance_service.startup import register_with_eureka
+from py_eureka_client import eureka_client
+from service.models import BillingOutbox
+from service.outbox import outbox_dispatcher
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver pending billing outbox rows to billing-service until none is due, the same way "
+        "the in-process dispatcher does. Safe to run next to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Override BILLING_OUTBOX_BATCH_SIZE.")
+        parser.add_argument("--max-batches", type=int, default=None, help="Stop after this many batches.")
+        parser.add_argument("--retry-failed", action="store_true",
+                            help="Put rows that ran out of attempts back in the queue first.")
+        parser.add_argument("--purge-sent-hours", type=float, default=None,
+                            help="Afterwards delete rows delivered more than this many hours ago.")
+        parser.add_argument("--counts", action="store_true", help="Only print the row count per status.")
+
+    def handle(self, *args, **options):
+        if options["counts"]:
+            for row in BillingOutbox.objects.values('status').annotate(rows=Count('id')).order_by('status'):
+                self.stdout.write(f"{row['status']}: {row['rows']}")
+            return
+        if options["batch_size"]:
+            outbox_dispatcher.batch_size = options["batch_size"]
+        if options["retry_failed"]:
+            requeued = BillingOutbox.objects.filter(status=BillingOutbox.FAILED).update(
+                status=BillingOutbox.PENDING, attempts=0, next_attempt_at=timezone.now()
+            )
+            self.stdout.write(f"Requeued {requeued} failed rows")
+
+        # the dispatcher resolves billing-service through Eureka, which only the server bootstrap starts
+        try:
+            register_with_eureka(should_register=False)
+        except Exception as e:
+            raise CommandError(f"Could not start the Eureka client: {e}")
+        try:
+            self.dispatch(options["max_batches"])
+        finally:
+            eureka_client.stop()
+        if options["purge_sent_hours"] is not None:
+            self.stdout.write(f"Purged {outbox_dispatcher.purge_sent(options['purge_sent_hours'])} delivered rows")
+
+    def dispatch(self, max_batches):
+        started = time.monotonic()
+        first_batch = outbox_dispatcher.counters['batches']
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            handled, unreachable = outbox_dispatcher.dispatch_batch()
+            batches = outbox_dispatcher.counters['batches'] - first_batch
+            if unreachable:
+                self.stderr.write("billing-service is unreachable, stopping")
+                break
+            if not handled:
+                break
+            self.stdout.write(f"batch {batches}: {handled} rows handled")
+        self.stdout.write(
+            f"{outbox_dispatcher.stats()} in {batches} batches ({time.monotonic() - started:.1f}s)"
+        )
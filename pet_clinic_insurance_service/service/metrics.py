@@ -0,0 +1,310 @@
+"""
+In-process per-stage timing histograms.
+
+Each (endpoint, stage) pair gets an HDR-style log-linear histogram, and
+`metrics/` exposes them in the Prometheus text format together with any
+registered gauges. Histograms are per worker process and live for the life
+of the process. This is billing_service/metrics.py plus the outbound-call
+series (observe_outbound); fix shared code in both copies.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.http import HttpResponse
+import re
+import threading
+import time
+
+_endpoint = ContextVar("metrics_endpoint", default="unmatched")
+
+
+class Histogram:
+    """
+    Log-linear histogram of non-negative integer values (microseconds here).
+
+    Values below 2**sub_bucket_bits are counted exactly. Above that, every
+    power-of-two range is split into 2**(sub_bucket_bits - 1) buckets, so a
+    recorded value is off by less than 1/64 (~1.6%) with the default of 7 bits.
+    """
+
+    def __init__(self, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def bucket_index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.half_count + ((value >> shift) - self.half_count)
+
+    def bucket_upper_bound(self, index):
+        if index < self.sub_bucket_count:
+            return index
+        offset = index - self.sub_bucket_count
+        shift = offset // self.half_count + 1
+        mantissa = offset % self.half_count + self.half_count
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(0, int(value))
+        index = self.bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        target = max(1, int(round(p / 100 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.bucket_upper_bound(index), self.max)
+        return self.max
+
+
+class MetricsRegistry:
+    QUANTILES = (50, 90, 99, 99.9)
+
+    def __init__(self):
+        self._histograms = {}
+        self._outbound = {}
+        self._outcomes = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get((endpoint, stage))
+            if histogram is None:
+                histogram = self._histograms[(endpoint, stage)] = Histogram()
+            histogram.record(seconds * 1_000_000)
+
+    def observe_outbound(self, destination, method, outcome, seconds):
+        """
+        Record an outbound call to `destination` (host:port). `outcome` is the
+        response status, or "error" when no response came back.
+        """
+        outcome = f"{outcome // 100}xx" if isinstance(outcome, int) else outcome
+        with self._lock:
+            histogram = self._outbound.get((destination, method))
+            if histogram is None:
+                histogram = self._outbound[(destination, method)] = Histogram()
+            histogram.record(seconds * 1_000_000)
+            key = (destination, method, outcome)
+            self._outcomes[key] = self._outcomes.get(key, 0) + 1
+
+    def register_gauge(self, name, collect):
+        """
+        `collect` returns either a number or a dict of suffix -> number.
+        """
+        self._gauges[name] = collect
+
+    def snapshot(self, histograms=None):
+        with self._lock:
+            return {
+                key: {
+                    'count': h.count,
+                    'sum_us': h.total,
+                    'max_us': h.max,
+                    **{f'p{q:g}_us': h.percentile(q) for q in self.QUANTILES},
+                }
+                for key, h in (self._histograms if histograms is None else histograms).items()
+            }
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP django_stage_duration_seconds Per-stage request timings.",
+            "# TYPE django_stage_duration_seconds summary",
+        ]
+        for (endpoint, stage), stats in sorted(self.snapshot().items()):
+            labels = f'endpoint="{_escape(endpoint)}",stage="{_escape(stage)}"'
+            for q in self.QUANTILES:
+                lines.append(
+                    f'django_stage_duration_seconds{{{labels},quantile="{q / 100:g}"}} {stats[f"p{q:g}_us"] / 1e6:.6f}'
+                )
+            lines.append(f"django_stage_duration_seconds_sum{{{labels}}} {stats['sum_us'] / 1e6:.6f}")
+            lines.append(f"django_stage_duration_seconds_count{{{labels}}} {stats['count']}")
+        lines += [
+            "# HELP http_client_duration_seconds Outbound request timings per destination.",
+            "# TYPE http_client_duration_seconds summary",
+        ]
+        for (destination, method), stats in sorted(self.snapshot(self._outbound).items()):
+            labels = f'destination="{_escape(destination)}",method="{_escape(method)}"'
+            for q in self.QUANTILES:
+                lines.append(
+                    f'http_client_duration_seconds{{{labels},quantile="{q / 100:g}"}} {stats[f"p{q:g}_us"] / 1e6:.6f}'
+                )
+            lines.append(f"http_client_duration_seconds_sum{{{labels}}} {stats['sum_us'] / 1e6:.6f}")
+            lines.append(f"http_client_duration_seconds_count{{{labels}}} {stats['count']}")
+        lines.append("# TYPE http_client_requests_total counter")
+        with self._lock:
+            outcomes = sorted(self._outcomes.items())
+        for (destination, method, outcome), total in outcomes:
+            lines.append(
+                f'http_client_requests_total{{destination="{_escape(destination)}",method="{_escape(method)}",'
+                f'outcome="{outcome}"}} {total}'
+            )
+        for name, collect in sorted(self._gauges.items()):
+            try:
+                values = collect()
+            except Exception:
+                continue
+            if not isinstance(values, dict):
+                values = {None: values}
+            for suffix, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = _metric_name(name if suffix is None else f"{name}_{suffix}")
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+registry = MetricsRegistry()
+
+
+def connection_pool_stats():
+    """
+    psycopg pool statistics for every pooled database alias this worker has
+    opened: size, utilization and cumulative/average checkout wait.
+    """
+    from django.db import connections
+    stats = {}
+    for conn in connections.all(initialized_only=True):
+        if not conn.settings_dict.get("OPTIONS", {}).get("pool"):
+            continue
+        pool = conn.pool
+        if pool is None:
+            continue
+        pool_stats = pool.get_stats()
+        size = pool_stats.get("pool_size", 0)
+        in_use = size - pool_stats.get("pool_available", 0)
+        requests = pool_stats.get("requests_num", 0)
+        wait_ms = pool_stats.get("requests_wait_ms", 0)
+        stats.update({
+            f"{conn.alias}_size": size,
+            f"{conn.alias}_max_size": pool.max_size,
+            f"{conn.alias}_in_use": in_use,
+            f"{conn.alias}_utilization": round(in_use / pool.max_size, 4) if pool.max_size else 0,
+            f"{conn.alias}_requests_waiting": pool_stats.get("requests_waiting", 0),
+            f"{conn.alias}_requests": requests,
+            f"{conn.alias}_wait_ms_total": wait_ms,
+            f"{conn.alias}_wait_ms_avg": round(wait_ms / requests, 3) if requests else 0,
+            f"{conn.alias}_timeouts": pool_stats.get("requests_errors", 0),
+            f"{conn.alias}_connections_lost": pool_stats.get("connections_lost", 0),
+        })
+    return stats
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = 0.0
+
+    @property
+    def ms(self):
+        return self.seconds * 1_000
+
+
+@contextmanager
+def stage(name):
+    """
+    Time the enclosed block as `name` for the current request's endpoint.
+    """
+    timer = StageTimer()
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        timer.seconds = time.perf_counter() - start
+        registry.observe(_endpoint.get(), name, timer.seconds)
+
+
+def _queue_seconds(header):
+    # X-Request-Start as set by nginx/Heroku style proxies: "t=<epoch>" in s, ms or us
+    try:
+        started = float(header.split("=", 1)[-1])
+    except ValueError:
+        return None
+    while started > 1e11:
+        started /= 1_000
+    return max(0.0, time.time() - started)
+
+
+class StageTimingMiddleware:
+    """
+    Records total, queue and render time per endpoint and sets the endpoint
+    label used by `stage()` blocks inside the view.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start, token, queue_seconds = self._begin(request)
+        try:
+            response = self.get_response(request)
+            self._finish(start, queue_seconds)
+            return response
+        finally:
+            _endpoint.reset(token)
+
+    async def __acall__(self, request):
+        start, token, queue_seconds = self._begin(request)
+        try:
+            response = await self.get_response(request)
+            self._finish(start, queue_seconds)
+            return response
+        finally:
+            _endpoint.reset(token)
+
+    def _begin(self, request):
+        start = time.perf_counter()
+        token = _endpoint.set("unmatched")
+        queue_header = request.META.get("HTTP_X_REQUEST_START")
+        return start, token, _queue_seconds(queue_header) if queue_header else None
+
+    def _finish(self, start, queue_seconds):
+        endpoint = _endpoint.get()
+        if queue_seconds is not None:
+            registry.observe(endpoint, "queue", queue_seconds)
+        registry.observe(endpoint, "total", time.perf_counter() - start)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        _endpoint.set(f"{request.method} {match.view_name or match.route}")
+
+    def process_template_response(self, request, response):
+        render_start = time.perf_counter()
+        endpoint = _endpoint.get()
+        response.add_post_render_callback(
+            lambda rendered: registry.observe(endpoint, "render", time.perf_counter() - render_start)
+        )
+        return response
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render_prometheus(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0002_alter_petinsurance_pet_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pet_id', models.IntegerField()),
+                ('owner_id', models.IntegerField()),
+                ('type', models.CharField(max_length=200)),
+                ('type_name', models.CharField(max_length=200)),
+                ('payment', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField()),
+                ('locked_until', models.DateTimeField(null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'db_table': 'billing_outbox',
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['next_attempt_at', 'id'], name='billing_outbox_due_idx'), models.Index(condition=models.Q(('status', 'pending')), fields=['pet_id', 'id'], name='billing_outbox_pet_idx')],
+            },
+        ),
+    ]
@@ -18,4 +18,37 @@ class PetInsurance(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
     def __str__(self):
-        return self.id
\ No newline at end of file
+        return self.id
+
+class BillingOutbox(models.Model):
+    """
+    A billing-service upsert owed for a PetInsurance write, stored in the
+    same transaction and delivered by service.outbox.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    pet_id = models.IntegerField()
+    owner_id = models.IntegerField()
+    type = models.CharField(max_length=200)
+    type_name = models.CharField(max_length=200)
+    payment = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    # set while a dispatcher is delivering the row
+    locked_until = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = 'billing_outbox'
+        indexes = [
+            # only undelivered rows are indexed, so sent history does not slow the dispatcher
+            models.Index(fields=['next_attempt_at', 'id'], name='billing_outbox_due_idx',
+                         condition=models.Q(status='pending')),
+            models.Index(fields=['pet_id', 'id'], name='billing_outbox_pet_idx',
+                         condition=models.Q(status='pending')),
+        ]
@@ -0,0 +1,83 @@
+"""
+Shared HTTP client for service-to-service calls.
+
+One requests Session per process keeps a keep-alive connection pool per
+destination host, so calls reuse connections instead of opening a TCP
+connection each time. Every call gets connect and read timeouts
+(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT). Failed connections are retried for any method. Read errors and 502/503/504
+responses are retried for idempotent methods only. There are at most
+HTTP_RETRIES retries, with exponential backoff plus jitter. Each call's
+latency and outcome are recorded per destination host.
+"""
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+from .metrics import registry
+import os
+import requests
+import threading
+import time
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 2))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.1))
+POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", 10))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 20))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def destination(url):
+    return urlsplit(url).netloc
+
+
+def build_session():
+    retry = Retry(
+        total=RETRIES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=BACKOFF,
+        backoff_jitter=BACKOFF,
+        respect_retry_after_header=True,
+        # hand the last 5xx back to the caller instead of raising MaxRetryError
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # the session is shared by every request this process serves, so no cookie
+    # (e.g. billing's read-your-writes pin) may carry over from one to the next
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def request(method, url, **kwargs):
+    """
+    requests.request() through the shared session, with the default timeouts
+    and latency recorded against the destination host.
+    """
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        response = session().request(method, url, **kwargs)
+        outcome = response.status_code
+        return response
+    finally:
+        registry.observe_outbound(destination(url), method, outcome, time.perf_counter() - start)
@@ -0,0 +1,240 @@
+"""
+Transactional outbox for insurance-to-billing propagation.
+
+A PetInsurance write stores the billing upsert it owes in BillingOutbox in
+the same transaction, so the row exists exactly when the write committed and
+the request never waits on billing-service. A dispatcher thread in every
+worker (and the dispatch_billing_outbox command) delivers pending rows in
+batches of BILLING_OUTBOX_BATCH_SIZE with the idempotent PUT of
+generate_billings().
+
+Rows for one pet are delivered in the order they were written: a pet is
+only taken when its oldest pending row is due, and a failed row holds back
+the pet's later rows until it succeeds. Since each PUT carries
+the full billing state, a row followed in the same batch by another for the
+same (owner, pet, type) is skipped as superseded. A failed row is retried
+with exponential backoff and jitter, and marked failed after
+BILLING_OUTBOX_MAX_ATTEMPTS attempts. Claimed rows are leased for
+BILLING_OUTBOX_LEASE_SECONDS, so dispatchers in other processes skip them
+and a dispatcher that dies mid-batch only delays them. While billing-service's
+circuit is open (service.resilience) rows wait without using up attempts.
+"""
+from datetime import timedelta
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from .discovery import ServiceUnavailable
+from .models import BillingOutbox
+from .resilience import BulkheadFull, CircuitOpen
+from .rest import generate_billings
+import logging
+import os
+import random
+import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# failures that say nothing about the row itself, so the rest of the batch would fail too
+UNREACHABLE_ERRORS = (ServiceUnavailable, requests.ConnectionError, requests.Timeout)
+
+
+def enqueue(pet_insurance, owner_id, type, type_name):
+    """
+    Record the billing upsert for a saved PetInsurance. Call inside the
+    transaction that saved it, with an owner_id from parse_owner_id(); the
+    dispatcher is woken once it commits.
+    """
+    entry = BillingOutbox.objects.create(
+        pet_id=pet_insurance["pet_id"],
+        owner_id=owner_id,
+        type=type,
+        type_name=type_name,
+        payment=pet_insurance["price"],
+        next_attempt_at=timezone.now(),
+    )
+    transaction.on_commit(outbox_dispatcher.wake)
+    return entry
+
+
+class OutboxDispatcher:
+    def __init__(self, batch_size=50, poll_interval=1.0, lease_seconds=120.0, max_attempts=10, backoff=2.0,
+                 max_backoff=300.0, retention_hours=24.0):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retention_hours = retention_hours
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.counters = {'batches': 0, 'delivered': 0, 'superseded': 0, 'retries': 0, 'failed': 0}
+
+    def start(self):
+        if os.getenv("BILLING_OUTBOX_DISPATCHER_ENABLED", "true").lower() not in ("1", "true"):
+            logger.info("Billing outbox dispatcher disabled by BILLING_OUTBOX_DISPATCHER_ENABLED")
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="billing-outbox", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def claim(self):
+        """
+        Lease the next batch of due rows that are the oldest pending row of
+        their pet, or follow it in the batch. Returns the rows grouped per
+        pet, oldest first.
+        """
+        now = timezone.now()
+        # an older pending row of the pet (backing off or leased elsewhere) must go first;
+        # filtered before the LIMIT so such pets cannot crowd the others out of the batch
+        older_pending = BillingOutbox.objects.filter(
+            status=BillingOutbox.PENDING, pet_id=OuterRef('pet_id'), id__lt=OuterRef('id'),
+        )
+        with transaction.atomic():
+            heads = list(
+                BillingOutbox.objects.select_for_update(skip_locked=True)
+                .filter(status=BillingOutbox.PENDING, next_attempt_at__lte=now)
+                .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+                .filter(~Exists(older_pending))
+                .order_by('id')[:self.batch_size]
+            )
+            if not heads:
+                return {}
+            batch = {row.pet_id: [row] for row in heads}
+            # the rest of those pets' queues, in order and up to the batch size; nobody else
+            # can hold them while we hold their head, so they are locked without skipping
+            tail = (
+                BillingOutbox.objects.select_for_update()
+                .filter(status=BillingOutbox.PENDING, pet_id__in=list(batch))
+                .exclude(id__in=[row.id for row in heads])
+                .order_by('id')[:max(self.batch_size - len(heads), 0)]
+            )
+            stopped = set()
+            for row in tail:
+                # a row still leased by a dead dispatcher ends its pet's run, keeping the order
+                if row.locked_until is not None and row.locked_until >= now:
+                    stopped.add(row.pet_id)
+                if row.pet_id not in stopped:
+                    batch[row.pet_id].append(row)
+            rows = [row for pet_rows in batch.values() for row in pet_rows]
+            BillingOutbox.objects.filter(id__in=[row.id for row in rows]).update(
+                locked_until=now + timedelta(seconds=self.lease_seconds)
+            )
+        return batch
+
+    def dispatch_batch(self):
+        """
+        Deliver one claimed batch. Returns (rows handled, whether billing-service
+        was unreachable); an unreachable billing-service ends the batch early.
+        """
+        batch = self.claim()
+        handled = 0
+        unreachable = False
+        for pet_rows in batch.values():
+            if unreachable:
+                self.release(pet_rows)
+                continue
+            for index, row in enumerate(pet_rows):
+                later = pet_rows[index + 1:]
+                if any((r.owner_id, r.type) == (row.owner_id, row.type) for r in later):
+                    self.complete(row, superseded=True)
+                    handled += 1
+                    continue
+                try:
+                    generate_billings({'pet_id': row.pet_id, 'price': row.payment}, row.owner_id, row.type,
+                                      row.type_name)
+                except (CircuitOpen, BulkheadFull) as e:
+                    # never sent, so it does not count as an attempt
+                    logger.debug("OutboxDispatcher - Holding billing for pet_id %s: %s", row.pet_id, e)
+                    self.release(pet_rows[index:])
+                    unreachable = True
+                    break
+                except Exception as e:
+                    self.retry_later(row, e)
+                    self.release(later)
+                    unreachable = isinstance(e, UNREACHABLE_ERRORS)
+                    break
+                self.complete(row)
+                handled += 1
+        if batch:
+            self.counters['batches'] += 1
+        return handled, unreachable
+
+    def complete(self, row, superseded=False):
+        BillingOutbox.objects.filter(id=row.id).update(status=BillingOutbox.SENT, sent_at=timezone.now(),
+                                                       locked_until=None)
+        self.counters['superseded' if superseded else 'delivered'] += 1
+
+    def retry_later(self, row, error):
+        attempts = row.attempts + 1
+        if attempts >= self.max_attempts:
+            status = BillingOutbox.FAILED
+            self.counters['failed'] += 1
+            logger.error("OutboxDispatcher - Giving up on billing for pet_id %s (outbox id %s) after %s attempts: %s",
+                         row.pet_id, row.id, attempts, error)
+        else:
+            status = BillingOutbox.PENDING
+            self.counters['retries'] += 1
+            logger.warning("OutboxDispatcher - Billing for pet_id %s (outbox id %s) failed, attempt %s: %s",
+                           row.pet_id, row.id, attempts, error)
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1)) + random.uniform(0, self.backoff)
+        BillingOutbox.objects.filter(id=row.id).update(
+            status=status, attempts=attempts, last_error=str(error)[:2_000], locked_until=None,
+            next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+    def release(self, rows):
+        # not attempted: hand them back without counting an attempt
+        if rows:
+            BillingOutbox.objects.filter(id__in=[row.id for row in rows]).update(locked_until=None)
+
+    def purge_sent(self, older_than_hours=None):
+        if older_than_hours is None:
+            older_than_hours = self.retention_hours
+        cutoff = timezone.now() - timedelta(hours=older_than_hours)
+        deleted, _ = BillingOutbox.objects.filter(status=BillingOutbox.SENT, sent_at__lt=cutoff).delete()
+        return deleted
+
+    def stats(self):
+        return dict(self.counters)
+
+    def _run(self):
+        last_purge = 0.0
+        while True:
+            self._wake.clear()
+            wait = self.poll_interval
+            try:
+                handled, unreachable = self.dispatch_batch()
+                if unreachable:
+                    wait = self.backoff
+                elif handled:
+                    # more may be due right away
+                    wait = 0
+                if time.monotonic() - last_purge > 3_600:
+                    self.purge_sent()
+                    last_purge = time.monotonic()
+            except Exception as e:
+                logger.error("OutboxDispatcher - Batch failed: %s", e)
+            finally:
+                # this thread outlives requests, so it has to return its connection itself
+                close_old_connections()
+            if wait:
+                self._wake.wait(wait)
+
+
+outbox_dispatcher = OutboxDispatcher(
+    batch_size=int(os.getenv("BILLING_OUTBOX_BATCH_SIZE", 50)),
+    poll_interval=float(os.getenv("BILLING_OUTBOX_POLL_SECONDS", 1)),
+    lease_seconds=float(os.getenv("BILLING_OUTBOX_LEASE_SECONDS", 120)),
+    max_attempts=int(os.getenv("BILLING_OUTBOX_MAX_ATTEMPTS", 10)),
+    backoff=float(os.getenv("BILLING_OUTBOX_BACKOFF_SECONDS", 2)),
+    retention_hours=float(os.getenv("BILLING_OUTBOX_RETENTION_HOURS", 24)),
+)
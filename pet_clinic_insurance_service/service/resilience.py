@@ -0,0 +1,146 @@
+"""
+Circuit breaker and bulkhead for calls to other services.
+
+Every downstream service gets its own Downstream guard. The bulkhead caps
+the calls in flight to it from this process at BULKHEAD_MAX_CONCURRENT; a
+call over the cap is rejected at once rather than queued, so a slow
+dependency cannot tie up every worker thread. The breaker opens after
+BREAKER_FAILURE_THRESHOLD consecutive failures (transport errors and 5xx
+responses) and rejects calls for BREAKER_RESET_SECONDS. It then lets
+BREAKER_HALF_OPEN_CALLS probe calls through: a successful probe closes it
+and a failed one opens it again.
+
+Rejections raise CircuitOpen or BulkheadFull. Both are ServiceUnavailable,
+so the billing outbox keeps the row and retries it after backing off.
+"""
+from .discovery import ServiceUnavailable
+from . import outbound
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(ServiceUnavailable):
+    pass
+
+
+class BulkheadFull(ServiceUnavailable):
+    pass
+
+
+class Downstream:
+    def __init__(self, name, failure_threshold=5, reset_seconds=30.0, half_open_calls=1, max_concurrent=20):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_calls = half_open_calls
+        self.max_concurrent = max_concurrent
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.counters = {'rejected_open': 0, 'rejected_full': 0, 'opened': 0}
+
+    def acquire(self):
+        """
+        Admit one call or raise CircuitOpen/BulkheadFull. Returns whether the
+        call is a half-open probe; pass that to release().
+        """
+        with self._lock:
+            probe = False
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    self.counters['rejected_open'] += 1
+                    raise CircuitOpen(f"circuit for {self.name} is open")
+                self.state = HALF_OPEN
+                logger.info("Downstream %s - Circuit half-open, probing", self.name)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self.counters['rejected_open'] += 1
+                    raise CircuitOpen(f"circuit for {self.name} is half-open and already probing")
+                probe = True
+            if self._in_flight >= self.max_concurrent:
+                self.counters['rejected_full'] += 1
+                raise BulkheadFull(f"{self._in_flight} calls to {self.name} already in flight")
+            self._in_flight += 1
+            if probe:
+                self._probes += 1
+            return probe
+
+    def release(self, probe, ok):
+        with self._lock:
+            self._in_flight -= 1
+            if probe:
+                self._probes -= 1
+            if ok:
+                self._failures = 0
+                if self.state == HALF_OPEN and probe:
+                    self.state = CLOSED
+                    logger.info("Downstream %s - Circuit closed", self.name)
+                return
+            self._failures += 1
+            if (self.state == HALF_OPEN and probe) or (self.state == CLOSED
+                                                       and self._failures >= self.failure_threshold):
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self.counters['opened'] += 1
+                logger.warning("Downstream %s - Circuit opened for %ss after %s failures", self.name,
+                               self.reset_seconds, self._failures)
+
+    def stats(self):
+        with self._lock:
+            return {'state': STATE_VALUES[self.state], 'in_flight': self._in_flight,
+                    'consecutive_failures': self._failures, **self.counters}
+
+
+class Downstreams:
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._downstreams = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        downstream = self._downstreams.get(name)
+        if downstream is None:
+            with self._lock:
+                downstream = self._downstreams.setdefault(name, Downstream(name, **self.defaults))
+        return downstream
+
+    def request(self, name, method, url, **kwargs):
+        """
+        outbound.request() to service `name`, through its breaker and bulkhead.
+        """
+        downstream = self.get(name)
+        probe = downstream.acquire()
+        ok = False
+        try:
+            response = outbound.request(method, url, **kwargs)
+            ok = response.status_code < 500
+            return response
+        finally:
+            downstream.release(probe, ok)
+
+    def stats(self):
+        stats = {}
+        for name, downstream in list(self._downstreams.items()):
+            for key, value in downstream.stats().items():
+                stats[f"{name}_{key}"] = value
+        return stats
+
+
+downstreams = Downstreams(
+    failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5)),
+    reset_seconds=float(os.getenv("BREAKER_RESET_SECONDS", 30)),
+    half_open_calls=int(os.getenv("BREAKER_HALF_OPEN_CALLS", 1)),
+    max_concurrent=int(os.getenv("BULKHEAD_MAX_CONCURRENT", 20)),
+)
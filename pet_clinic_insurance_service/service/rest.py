@@ -1,59 +1,79 @@
-from py_eureka_client import eureka_client
 from opentelemetry import trace
-import requests
+from .discovery import service_registry
+from .metrics import stage
+from .resilience import downstreams
+from decimal import Decimal, InvalidOperation
 import logging
 import json
 
 logger = logging.getLogger(__name__)
 
+
+def log_response(method, url, status_code, expected=()):
+    # only failed calls are worth more than INFO; payloads are DEBUG
+    level = logging.ERROR if status_code >= 400 and status_code not in expected else logging.INFO
+    logger.log(level, "%s %s - %s", method, url, status_code)
+
 def resolve_service_url(service_name):
-    client = eureka_client.get_client()
-    instances = client.applications.get_application(service_name.upper()).instances
-    logger.error(instances)
-    if len(instances) > 0:
-        instance = instances[0]
-        return 'http://' + instance.ipAddr + ":" + str(instance.port.port) + "/"
-    else:
-        raise ValueError("no valid instance found for service '%s'", service_name)
+    # cached and load-balanced; see service.discovery
+    return service_registry.resolve(service_name)
 
 def get_owner_info(owner_id):
     trace.get_current_span().set_attribute("customer.id", owner_id)
     server_url = resolve_service_url("customers-service")
-    response = requests.get(server_url + "owner/" + str(owner_id) + "")
-    logger.error(server_url + "owner/" + str(owner_id) + "", response.status_code)
+    with stage("outbound"):
+        response = downstreams.request("customers-service", "GET", server_url + "owner/" + str(owner_id))
+    log_response("GET", server_url + "owner/" + str(owner_id), response.status_code)
     data = json.loads(response.text)
-    logger.error(data)
+    logger.debug("Owner %s: %s", owner_id, data)
     return data
 
-def create_billings(url, data):
-    logger.error(data)
-    response = requests.post(url, data)
-    logger.error(url + " - " +  str(response.status_code))
+class BillingSyncError(Exception):
+    pass
 
-def update_billings(url, data):
-    logger.error(data)
-    response = requests.put(url, data)
-    logger.error(url + " - " +  str(response.status_code))
 
-def generate_billings(pet_insurance, owner_id, type, type_name):
-    server_url = resolve_service_url("billing-service")
-    pet_id = pet_insurance["pet_id"]
-    url = f"{server_url}billings/{owner_id}/{pet_id}/{type}/"
-    response = requests.get(url)
-    logger.error(url + " - " + str(response.status_code))
-    if response.status_code != 200 :
-        logger.error("create")
-        create_billings(server_url + "billings/", {
-            "owner_id": owner_id,
-            "type": type,
-            "type_name": type_name,
-            "pet_id": pet_id,
-            "payment": pet_insurance["price"],
-            "status": "open"
-        })
-    else:
-        logger.error("update")
-        data = json.loads(response.text)
-        data['payment'] = pet_insurance["price"]
-        update_billings(server_url + "billings/" + str(data['id']) + "/", data)
+def billing_payload(pet_insurance, type_name):
+    return {"type_name": type_name, "payment": str(pet_insurance["price"])}
+
+
+def response_body(response):
+    # error pages may not be JSON
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
 
+
+def confirm_billing(url, status_code, body, payload):
+    """
+    Check the billing-service upsert response against what was sent and
+    return the stored billing; raise BillingSyncError if it does not match.
+    """
+    if status_code not in (200, 201):
+        raise BillingSyncError(f"PUT {url} returned {status_code}: {body}")
+    if not isinstance(body, dict):
+        raise BillingSyncError(f"PUT {url} returned {status_code} without a billing: {body}")
+    try:
+        payment = Decimal(body["payment"])
+    except (KeyError, TypeError, InvalidOperation):
+        raise BillingSyncError(f"PUT {url} returned a billing without a valid payment: {body}")
+    if body.get("type_name") != payload["type_name"] or payment != Decimal(payload["payment"]):
+        raise BillingSyncError(f"PUT {url} stored {body}, expected {payload}")
+    logger.debug("Billing %s at %s confirmed", "created" if status_code == 201 else "updated", url)
+    return body
+
+
+def generate_billings(pet_insurance, owner_id, type, type_name):
+    """
+    Create or update the billing for (owner_id, pet_id, type) with one
+    idempotent PUT to the billing-service natural-key route.
+    """
+    payload = billing_payload(pet_insurance, type_name)
+    # a connection error or timeout counts against the chosen instance
+    with service_registry.instance("billing-service") as server_url:
+        url = f"{server_url}billings/{owner_id}/{pet_insurance['pet_id']}/{type}/"
+        logger.debug("PUT %s payload: %s", url, payload)
+        with stage("outbound"):
+            response = downstreams.request("billing-service", "PUT", url, json=payload)
+    log_response("PUT", url, response.status_code)
+    return confirm_billing(url, response.status_code, response_body(response), payload)
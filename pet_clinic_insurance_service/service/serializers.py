@@ -1,12 +1,39 @@
 from rest_framework import serializers
 from .models import Insurance, PetInsurance
 
-class InsuranceSerializer(serializers.ModelSerializer):
+class InvalidFields(ValueError):
+    pass
+
+def requested_fields(value, available):
+    """
+    Parse a `?fields=name,price` value into a tuple of names from
+    `available`, in `available` order and always including 'id'. Returns None
+    when the parameter is absent or empty, meaning every field.
+    """
+    names = {name.strip() for name in (value or "").split(",") if name.strip()}
+    if not names:
+        return None
+    unknown = names.difference(available)
+    if unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(sorted(unknown))}; available: {', '.join(available)}")
+    return tuple(name for name in available if name in names or name == 'id')
+
+class FieldsetMixin:
+    """
+    Serializer that takes a `fields` argument and drops every other field.
+    """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields).difference(fields):
+                self.fields.pop(name)
+
+class InsuranceSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Insurance
         fields = ['id', 'name', 'description', 'price']
 
-class PetInsuranceSerializer(serializers.ModelSerializer):
+class PetInsuranceSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = PetInsurance
-        fields = ['id', 'pet_id', 'insurance_id', 'insurance_name', 'price']
\ No newline at end of file
+        fields = ['id', 'pet_id', 'insurance_id', 'insurance_name', 'price']
@@ -1,3 +1,303 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from http.client import HTTPMessage
+from requests.cookies import extract_cookies_to_jar
+from unittest import mock
+from . import outbound
+from .cache import FieldsetCache, insurance_list_cache
+from .discovery import ServiceRegistry, ServiceUnavailable
+from .metrics import registry
+from .models import BillingOutbox, Insurance, PetInsurance
+from .outbox import OutboxDispatcher
+from .resilience import CLOSED, OPEN, BulkheadFull, CircuitOpen, Downstream, Downstreams
+from .rest import BillingSyncError, confirm_billing
+import io
+import requests
+import time
 
-# Create your tests here.
+
+def outbox_row(pet_id, **fields):
+    fields = {'owner_id': 1, 'type': 'insurance', 'type_name': 'CatCare', 'payment': '10.00',
+              'next_attempt_at': timezone.now(), **fields}
+    return BillingOutbox.objects.create(pet_id=pet_id, **fields)
+
+
+class OutboxClaimTests(TestCase):
+    def test_pet_backing_off_does_not_starve_other_pets(self):
+        outbox_row(1, attempts=1, next_attempt_at=timezone.now() + timedelta(minutes=5))
+        for _ in range(5):
+            outbox_row(1)
+        ready = outbox_row(2)
+
+        batch = OutboxDispatcher(batch_size=5).claim()
+
+        self.assertEqual(list(batch), [2])
+        self.assertEqual([row.id for row in batch[2]], [ready.id])
+
+    def test_claims_a_pets_rows_in_order_behind_its_head(self):
+        rows = [outbox_row(1) for _ in range(3)]
+        other = outbox_row(2)
+
+        batch = OutboxDispatcher(batch_size=10).claim()
+
+        self.assertEqual([row.id for row in batch[1]], [row.id for row in rows])
+        self.assertEqual([row.id for row in batch[2]], [other.id])
+        self.assertFalse(BillingOutbox.objects.filter(locked_until__isnull=True).exists())
+        # leased rows are not handed out twice
+        self.assertEqual(OutboxDispatcher(batch_size=10).claim(), {})
+
+
+class PetInsuranceWriteTests(TestCase):
+    def create(self, **data):
+        payload = {'pet_id': 7, 'insurance_id': 1, 'insurance_name': 'CatCare', 'price': '10.00', **data}
+        return self.client.post('/pet-insurances/', payload, content_type='application/json')
+
+    def test_write_queues_the_billing_in_the_same_transaction(self):
+        response = self.create(owner_id=3)
+
+        self.assertEqual(response.status_code, 201)
+        entry = BillingOutbox.objects.get()
+        self.assertEqual((entry.owner_id, entry.pet_id, entry.type_name, str(entry.payment)),
+                         (3, 7, 'CatCare', '10.00'))
+
+    def test_missing_or_invalid_owner_is_rejected_before_saving(self):
+        for owner in ({}, {'owner_id': 'abc'}):
+            response = self.create(**owner)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('owner_id', response.json())
+        self.assertFalse(PetInsurance.objects.exists())
+        self.assertFalse(BillingOutbox.objects.exists())
+
+    def test_malformed_or_non_object_body_is_rejected(self):
+        for body in ('{"pet_id": 7,', '[{"pet_id": 7}]'):
+            for method, url in ((self.client.post, '/pet-insurances/'), (self.client.put, '/pet-insurances/7/')):
+                response = method(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400, (method, body))
+                self.assertIn('detail', response.json())
+
+    def test_update_without_owner_is_rejected(self):
+        self.create(owner_id=3)
+        response = self.client.put('/pet-insurances/7/', {'price': '12.00'}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(str(PetInsurance.objects.get().price), '10.00')
+
+
+class ConfirmBillingTests(TestCase):
+    payload = {'type_name': 'CatCare', 'payment': '10.00'}
+
+    def test_matching_billing_is_returned(self):
+        body = {'id': 7, 'type_name': 'CatCare', 'payment': '10.00'}
+
+        self.assertEqual(confirm_billing('url', 200, body, self.payload), body)
+
+    def test_non_json_success_is_a_sync_error(self):
+        with self.assertRaises(BillingSyncError):
+            confirm_billing('url', 200, '<html>ok</html>', self.payload)
+
+    def test_missing_or_invalid_payment_is_a_sync_error(self):
+        for payment in ({}, {'payment': None}, {'payment': 'ten'}):
+            with self.assertRaises(BillingSyncError):
+                confirm_billing('url', 200, {'id': 7, 'type_name': 'CatCare', **payment}, self.payload)
+
+
+class FieldsetTests(TestCase):
+    def setUp(self):
+        insurance_list_cache.invalidate()
+        self.insurance = Insurance.objects.create(name='CatCare', description='Cats', price='10.00')
+
+    def test_list_returns_only_the_requested_fields(self):
+        response = self.client.get('/insurances/', {'fields': 'name'})
+
+        self.assertEqual(response.json(), [{'id': self.insurance.id, 'name': 'CatCare'}])
+
+    def test_unknown_field_is_a_400(self):
+        self.assertEqual(self.client.get('/pet-insurances/', {'fields': 'price,secret'}).status_code, 400)
+
+
+class InsuranceListCacheTests(TestCase):
+    def test_list_loaded_before_a_write_is_not_cached_after_it(self):
+        cache = FieldsetCache(ttl=30)
+
+        def load_then_write():
+            cache.invalidate()
+            return ['old']
+
+        cache.get_or_load(None, load_then_write)
+
+        self.assertEqual(cache.get_or_load(None, lambda: ['new']), ['new'])
+
+    def test_insurance_write_clears_the_cached_list(self):
+        insurance_list_cache.invalidate()
+        self.client.get('/insurances/')
+        self.client.post('/insurances/', {'name': 'DogCare', 'description': 'Dogs', 'price': '12.00'},
+                         content_type='application/json')
+
+        self.assertEqual([row['name'] for row in self.client.get('/insurances/').json()], ['DogCare'])
+
+
+class ServiceRegistryTests(TestCase):
+    def setUp(self):
+        self.instances = ['http://a:8800/', 'http://b:8800/']
+        self.registry = ServiceRegistry(fetch=lambda name: list(self.instances), max_failures=2)
+        # no background refresh; tests call refresh() themselves
+        patcher = mock.patch.object(self.registry, '_start_refresher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_round_robin_over_the_up_instances(self):
+        picks = [self.registry.resolve('billing-service') for _ in range(4)]
+
+        self.assertEqual(picks, self.instances * 2)
+
+    def test_failed_refresh_keeps_the_last_known_instances(self):
+        self.registry.resolve('billing-service')
+        self.instances = []
+        self.registry.fetch = mock.Mock(side_effect=OSError("eureka down"))
+
+        self.registry.refresh('billing-service')
+
+        self.assertIn(self.registry.resolve('billing-service'), ['http://a:8800/', 'http://b:8800/'])
+        self.assertEqual(self.registry.stats()['refresh_failures'], 1)
+
+    def test_instance_failing_repeatedly_is_ejected(self):
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                with self.registry.instance('billing-service') as url:
+                    self.assertEqual(url, 'http://a:8800/')
+                    raise requests.ConnectionError("refused")
+            # skip b, so a is picked again
+            self.registry.resolve('billing-service')
+
+        picks = {self.registry.resolve('billing-service') for _ in range(4)}
+
+        self.assertEqual(picks, {'http://b:8800/'})
+        self.assertEqual(self.registry.stats()['ejected'], 1)
+
+    def test_unknown_service_is_unavailable(self):
+        self.registry.fetch = lambda name: []
+
+        with self.assertRaises(ServiceUnavailable):
+            self.registry.resolve('billing-service')
+
+
+class OutboundTests(TestCase):
+    def test_calls_are_recorded_per_destination_and_outcome(self):
+        session = mock.Mock(request=mock.Mock(return_value=mock.Mock(status_code=503)))
+        with mock.patch('service.outbound.session', return_value=session):
+            outbound.request('PUT', 'http://billing:8800/billings/1/1/insurance/')
+            session.request.side_effect = requests.ConnectionError("refused")
+            with self.assertRaises(requests.ConnectionError):
+                outbound.request('PUT', 'http://billing:8800/billings/1/1/insurance/')
+
+        body = registry.render_prometheus()
+        self.assertIn('http_client_requests_total{destination="billing:8800",method="PUT",outcome="5xx"}', body)
+        self.assertIn('http_client_requests_total{destination="billing:8800",method="PUT",outcome="error"}', body)
+        self.assertEqual(session.request.call_args.kwargs['timeout'], (outbound.CONNECT_TIMEOUT, outbound.READ_TIMEOUT))
+
+    def test_shared_session_keeps_no_cookies(self):
+        session = outbound.build_session()
+        request = requests.Request('PUT', 'http://billing:8800/billings/1/1/insurance/').prepare()
+        headers = HTTPMessage()
+        headers['Set-Cookie'] = 'db_pin_primary=1; Path=/'
+
+        extract_cookies_to_jar(session.cookies, request, mock.Mock(_original_response=mock.Mock(msg=headers)))
+
+        self.assertEqual(len(session.cookies), 0)
+
+
+class OutboxDispatchTests(TestCase):
+    def dispatch(self, side_effect=None):
+        dispatcher = OutboxDispatcher(batch_size=10)
+        with mock.patch('service.outbox.generate_billings', side_effect=side_effect) as sent:
+            result = dispatcher.dispatch_batch()
+        return dispatcher, sent, result
+
+    def test_superseded_rows_are_not_sent(self):
+        outbox_row(1, payment='10.00')
+        outbox_row(1, payment='12.00')
+
+        dispatcher, sent, result = self.dispatch()
+
+        self.assertEqual(result, (2, False))
+        sent.assert_called_once()
+        self.assertEqual(sent.call_args.args[0]['price'], Decimal('12.00'))
+        self.assertEqual((dispatcher.counters['superseded'], dispatcher.counters['delivered']), (1, 1))
+        self.assertEqual(set(BillingOutbox.objects.values_list('status', flat=True)), {BillingOutbox.SENT})
+
+    def test_failed_row_backs_off_and_holds_back_the_pets_later_rows(self):
+        failing, later = outbox_row(1), outbox_row(1, type='other')
+
+        dispatcher, sent, result = self.dispatch(side_effect=BillingSyncError("mismatch"))
+
+        failing.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual(result, (0, False))
+        self.assertEqual((failing.status, failing.attempts), (BillingOutbox.PENDING, 1))
+        self.assertGreater(failing.next_attempt_at, timezone.now())
+        self.assertIsNone(later.locked_until)
+        self.assertEqual(later.attempts, 0)
+
+    def test_open_circuit_releases_rows_without_using_attempts(self):
+        row = outbox_row(1)
+
+        dispatcher, sent, result = self.dispatch(side_effect=CircuitOpen("open"))
+
+        row.refresh_from_db()
+        self.assertEqual(result, (0, True))
+        self.assertEqual((row.status, row.attempts, row.locked_until), (BillingOutbox.PENDING, 0, None))
+
+
+class CircuitBreakerTests(TestCase):
+    def test_opens_after_consecutive_failures_and_closes_after_a_good_probe(self):
+        downstream = Downstream('billing-service', failure_threshold=2, reset_seconds=30)
+        for _ in range(2):
+            downstream.release(downstream.acquire(), ok=False)
+
+        self.assertEqual(downstream.state, OPEN)
+        with self.assertRaises(CircuitOpen):
+            downstream.acquire()
+
+        with mock.patch('service.resilience.time.monotonic', return_value=time.monotonic() + 31):
+            probe = downstream.acquire()
+            # only one probe at a time
+            with self.assertRaises(CircuitOpen):
+                downstream.acquire()
+        downstream.release(probe, ok=True)
+
+        self.assertTrue(probe)
+        self.assertEqual(downstream.state, CLOSED)
+
+    def test_bulkhead_rejects_calls_over_the_cap(self):
+        downstream = Downstream('billing-service', max_concurrent=1)
+        downstream.acquire()
+
+        with self.assertRaises(BulkheadFull):
+            downstream.acquire()
+        self.assertEqual(downstream.stats()['rejected_full'], 1)
+
+    def test_server_errors_count_as_failures(self):
+        downstreams = Downstreams(failure_threshold=1)
+        with mock.patch('service.resilience.outbound.request', return_value=mock.Mock(status_code=503)):
+            response = downstreams.request('billing-service', 'PUT', 'http://billing:8800/billings/1/1/insurance/')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(downstreams.get('billing-service').state, OPEN)
+
+
+class DispatchCommandTests(TestCase):
+    def test_starts_a_non_registering_eureka_client_and_reports_its_batches(self):
+        outbox_row(1)
+        out = io.StringIO()
+        with mock.patch('service.management.commands.dispatch_billing_outbox.register_with_eureka') as eureka, \
+                mock.patch('service.management.commands.dispatch_billing_outbox.eureka_client') as client, \
+                mock.patch('service.outbox.generate_billings'):
+            call_command('dispatch_billing_outbox', stdout=out, stderr=io.StringIO())
+
+        eureka.assert_called_once_with(should_register=False)
+        client.stop.assert_called_once()
+        self.assertEqual(BillingOutbox.objects.get().status, BillingOutbox.SENT)
+        self.assertIn("in 1 batches", out.getvalue())
@@ -1,80 +1,160 @@
-from rest_framework import viewsets, status
+from django.db import transaction
+from rest_framework import serializers, viewsets, status
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.fields import empty
 from rest_framework.response import Response
+from .cache import insurance_list_cache
 from .models import Insurance, PetInsurance
-from .serializers import InsuranceSerializer, PetInsuranceSerializer
-from .rest import generate_billings
+from .serializers import InsuranceSerializer, InvalidFields, PetInsuranceSerializer, requested_fields
+from .metrics import stage
+from .outbox import enqueue
 import logging
 
 logger = logging.getLogger(__name__)
 
-class InsuranceViewSet(viewsets.ModelViewSet):
+
+def parse_owner_id(data):
+    """
+    The owner a pet-insurance write is billed to. Raises ValidationError (400)
+    before anything is saved, since the billing cannot be queued without it.
+    """
+    try:
+        return serializers.IntegerField().run_validation(data.get('owner_id', empty))
+    except ValidationError as e:
+        raise ValidationError({'owner_id': e.detail})
+
+
+def save_and_enqueue(serializer, owner_id):
+    """
+    Save a PetInsurance and queue its billing upsert in one transaction;
+    billing-service is updated by the outbox dispatcher, not the request.
+    """
+    with stage("db"), transaction.atomic():
+        serializer.save()
+        # .data renders from the saved instance, no query
+        data = serializer.data
+        enqueue(data, owner_id, "insurance", data.get("insurance_name"))
+
+
+class FieldsetViewMixin:
+    """
+    `?fields=` projection for list and retrieve: only the requested columns
+    are selected (`.only()`) and serialized. Writes always use every field.
+    """
+    projection = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in ('list', 'retrieve'):
+            try:
+                self.projection = requested_fields(request.query_params.get('fields'),
+                                                   self.get_serializer_class().Meta.fields)
+            except InvalidFields as e:
+                raise ParseError(str(e))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.projection is not None:
+            queryset = queryset.only(*self.projection)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.projection is not None:
+            kwargs.setdefault('fields', self.projection)
+        return super().get_serializer(*args, **kwargs)
+
+
+class InsuranceViewSet(FieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Insurance.objects.all()
     serializer_class = InsuranceSerializer
 
+    def list(self, request, *args, **kwargs):
+        # the catalogue rarely changes, so each field set's list is cached
+        def load():
+            return list(super(InsuranceViewSet, self).list(request, *args, **kwargs).data)
+        return Response(insurance_list_cache.get_or_load(self.projection, load))
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        insurance_list_cache.invalidate()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        insurance_list_cache.invalidate()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        insurance_list_cache.invalidate()
+
     def get_queryset(self):
         logger.info("InsuranceViewSet.get_queryset() called - Fetching insurance records")
         queryset = super().get_queryset()
         if not queryset:
             logger.warning("InsuranceViewSet.get_queryset() - No insurance records found")
             return []  # Return an empty list if the queryset is empty
-        logger.info(f"InsuranceViewSet.get_queryset() - Found {len(queryset)} insurance records")
+        logger.info("InsuranceViewSet.get_queryset() - Found %s insurance records", len(queryset))
         return queryset
 
 
-class PetInsuranceViewSet(viewsets.ModelViewSet):
+class PetInsuranceViewSet(FieldsetViewMixin, viewsets.ModelViewSet):
     queryset = PetInsurance.objects.all()
     serializer_class = PetInsuranceSerializer
     lookup_field = 'pet_id'
 
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # a JSON array parses fine but is not a pet insurance
+        if self.action in ('create', 'update', 'partial_update') and not isinstance(request.data, dict):
+            raise ParseError("Expected a JSON object")
+
     def create(self, request, *args, **kwargs):
         owner_id = request.data.get('owner_id')
         pet_id = request.data.get('pet_id')
-        logger.info(f"PetInsuranceViewSet.create() called - Creating pet insurance for owner_id: {owner_id}, pet_id: {pet_id}")
-        logger.debug(f"Request data: {request.data}")
+        logger.info("PetInsuranceViewSet.create() called - Creating pet insurance for owner_id: %s, pet_id: %s", owner_id, pet_id)
+        logger.debug("Request data: %s", request.data)
         
         serializer = self.get_serializer(data=request.data)
         try:
+            owner_id = parse_owner_id(request.data)
             serializer.is_valid(raise_exception=True)
             self.perform_update(serializer, owner_id)
             headers = self.get_success_headers(serializer.data)
-            logger.info(f"PetInsuranceViewSet.create() - Pet insurance created successfully for pet_id: {pet_id}")
+            logger.info("PetInsuranceViewSet.create() - Pet insurance created successfully for pet_id: %s", pet_id)
             return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
         except Exception as e:
-            logger.error(f"PetInsuranceViewSet.create() - Failed to create pet insurance: {str(e)}")
+            logger.error("PetInsuranceViewSet.create() - Failed to create pet insurance: %s", e)
             raise
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         pet_id = instance.pet_id
         owner_id = request.data.get('owner_id')
-        logger.info(f"PetInsuranceViewSet.update() called - Updating pet insurance for pet_id: {pet_id}, owner_id: {owner_id}")
-        logger.debug(f"Request data: {request.data}")
+        logger.info("PetInsuranceViewSet.update() called - Updating pet insurance for pet_id: %s, owner_id: %s", pet_id, owner_id)
+        logger.debug("Request data: %s", request.data)
         
+        owner_id = parse_owner_id(request.data)
         serializer = self.get_serializer(instance, data=request.data, partial=True)
 
         if serializer.is_valid():
             self.perform_update(serializer, owner_id)
-            logger.info(f"PetInsuranceViewSet.update() - Pet insurance updated successfully for pet_id: {pet_id}")
+            logger.info("PetInsuranceViewSet.update() - Pet insurance updated successfully for pet_id: %s", pet_id)
             return Response(serializer.data)
         
-        logger.error(f"PetInsuranceViewSet.update() - Validation failed for pet_id: {pet_id}, errors: {serializer.errors}")
+        logger.error("PetInsuranceViewSet.update() - Validation failed for pet_id: %s, errors: %s", pet_id, serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def perform_update(self, serializer, owner_id):
-        logger.info(f"PetInsuranceViewSet.perform_update() called - Saving pet insurance and generating billing")
+        logger.info("PetInsuranceViewSet.perform_update() called - Saving pet insurance and queueing billing")
         try:
-            serializer.save()
-            insurance_name = serializer.data.get("insurance_name")
-            logger.debug(f"Generating billing for owner_id: {owner_id}, insurance_name: {insurance_name}")
-            generate_billings(serializer.data, owner_id, "insurance", insurance_name)
-            logger.info(f"PetInsuranceViewSet.perform_update() - Successfully saved and generated billing for owner_id: {owner_id}")
+            save_and_enqueue(serializer, owner_id)
+            logger.info("PetInsuranceViewSet.perform_update() - Successfully saved and queued billing for owner_id: %s", owner_id)
         except Exception as e:
-            logger.error(f"PetInsuranceViewSet.perform_update() - Failed to save or generate billing: {str(e)}")
+            logger.error("PetInsuranceViewSet.perform_update() - Failed to save or queue billing: %s", e)
             raise
     def send_update_notification(self, instance):
         # Your custom logic to send a notification
         # after the instance is updated
-        logger.info(f"PetInsuranceViewSet.send_update_notification() called - Sending notification for pet_id: {instance.pet_id}")
+        logger.info("PetInsuranceViewSet.send_update_notification() called - Sending notification for pet_id: %s", instance.pet_id)
         logger.debug("PetInsuranceViewSet.send_update_notification() - Notification logic not implemented yet")
         pass
 
@@ -84,7 +164,7 @@ class PetInsuranceViewSet(viewsets.ModelViewSet):
         if not queryset:
             logger.warning("PetInsuranceViewSet.get_queryset() - No pet insurance records found")
             return []  # Return an empty list if the queryset is empty
-        logger.info(f"PetInsuranceViewSet.get_queryset() - Found {len(queryset)} pet insurance records")
+        logger.info("PetInsuranceViewSet.get_queryset() - Found %s pet insurance records", len(queryset))
         return queryset
 
 class HealthViewSet(viewsets.ViewSet):